@@ -0,0 +1,8 @@
+import numpy as np
+
+
+#------------------------------------------------------------------------------
+def to_epoch_seconds(index):
+    """Convert a naive DatetimeIndex to integer seconds since the epoch."""
+    return index.values.astype('datetime64[s]').astype(np.int64)
+#------------------------------------------------------------------------------
@@ -0,0 +1,296 @@
+"""Compare the NumPy aggregation kernel and the rolling window with the pandas implementation they replaced.
+
+The check compares every output table of the implementations on random compacted metrics, then they
+are timed, along with the update of a saved window by one minute of new packets.
+
+Usage: python benchmarks/bench_aggregation.py [rows] [repeats]
+"""
+import os
+import sys
+import time
+import pickle
+import socket
+import struct
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aggregation import to_epoch_seconds
+from rolling_window import RollingWindow
+
+
+def make_metrics(rows, start_time, seconds, seed = 0):
+    """Random compacted metrics (one row per second, destination and packet size) with gaps."""
+    rng = np.random.default_rng(seed)
+    # Leave some minutes without any packet
+    offsets = rng.integers(0, seconds, rows)
+    offsets = offsets[(offsets // 60) % 7 != 3]
+    sizes = rng.choice([60, 74, 120, 590, 1500], len(offsets))
+    counts = rng.integers(1, 20, len(offsets))
+    destinations = np.array([f"10.0.{i // 256}.{i % 256}" for i in range(500)], dtype=object)[rng.integers(0, 500, len(offsets))]
+
+    metrics = pd.DataFrame({
+        'throughput': sizes * 8 * counts,
+        'packet_count': counts,
+        'packet_size': sizes,
+        'destination': destinations
+    }, index=pd.DatetimeIndex(pd.Timestamp(start_time) + pd.to_timedelta(offsets, unit='s'), name='time'))
+    return metrics
+
+
+def pandas_reference(metrics_df, start_time, end_time):
+    """The resample/groupby implementation of save_metrics_to_csv before the NumPy kernel.
+
+    It truncated the packets, whose times were not rounded, after end_time, so only a packet stamped
+    exactly at end_time was kept. The rows here are whole seconds: the second that starts at end_time
+    is after the window.
+    """
+    metrics_df = metrics_df.sort_index()
+    truncated_df = metrics_df[(metrics_df.index >= start_time) & (metrics_df.index < end_time)]
+
+    throughput_per_second = truncated_df.resample('1s').sum()['throughput'].reset_index()
+    throughput_per_second.columns = ['time', 'throughput_per_sec(bps)']
+    throughput_per_second = throughput_per_second.fillna(0)
+
+    metrics_per_min = truncated_df.resample('1min').agg({
+        'throughput': 'sum',
+        'packet_count': 'sum',
+        'destination': lambda x: x.nunique()
+    }).reset_index()
+    metrics_per_min['packet_size'] = metrics_per_min['throughput'] / 8 / metrics_per_min['packet_count'].replace(0, float('nan'))
+    throughput_avg_per_min = throughput_per_second.resample('1min', on='time').mean()['throughput_per_sec(bps)']
+    throughput_peak_per_min = throughput_per_second.resample('1min', on='time').max()['throughput_per_sec(bps)']
+    metrics_per_min['avg_throughput_per_min(bps)'] = throughput_avg_per_min.values
+    metrics_per_min['peak_throughput_per_min(bps)'] = throughput_peak_per_min.values
+    metrics_per_min = metrics_per_min.rename(columns={
+        'packet_size': 'avg_packet_size_per_min(bytes)',
+        'packet_count': 'packet_count_per_min',
+        'destination': 'unique_destinations_count_per_min'
+    })
+    column_order = ['time', 'avg_throughput_per_min(bps)', 'peak_throughput_per_min(bps)', 'avg_packet_size_per_min(bytes)', 'packet_count_per_min', 'unique_destinations_count_per_min']
+    metrics_per_min = metrics_per_min[column_order].fillna(0).round(3)
+
+    dest_traffic = truncated_df.groupby(by='destination').agg({'throughput': 'sum'}).reset_index().sort_values(by='throughput', ascending=False)
+    dest_traffic.columns = ['destination_ip', 'throughput_per_ip(bits)']
+
+    packet_sizes_counts = truncated_df.groupby(by='packet_size')['packet_count'].sum().reset_index()
+    packet_sizes_counts.columns = ['packet_size(bytes)', 'count']
+    packet_sizes_counts = packet_sizes_counts.sort_values(by='packet_size(bytes)').reset_index(drop=True)
+
+    return throughput_per_second, metrics_per_min, dest_traffic, packet_sizes_counts
+
+
+def _as_totals(values, weights):
+    """Return bincount totals with the integer type of the input, as pandas sums would."""
+    if np.issubdtype(weights.dtype, np.integer):
+        return np.rint(values).astype(np.int64)
+    return values
+
+
+def aggregate_window(times, bits, packet_counts, packet_sizes, destinations, start_time, end_time):
+    """Compute every metric of save_metrics_to_csv in a few vectorized passes.
+
+    The NumPy kernel that save_metrics_to_csv used before the rolling window (rolling_window.py),
+    kept here as a reference: RollingWindow.aggregate returns the same keys.
+
+    The inputs are the columns of the compacted metrics: times in integer epoch seconds, total bits,
+    number of packets, packet size and destination of each row. Only the rows of [start_time, end_time)
+    (epoch seconds) are used. The seconds and minutes are integer bins, from the
+    first to the last second that has packets, like a pandas resample of the same rows.
+
+    Returns None if there is no row in the window, otherwise a dict of NumPy arrays:
+    seconds, bits_per_second, minutes, avg_throughput_per_min, peak_throughput_per_min,
+    avg_packet_size_per_min, packet_count_per_min, unique_destinations_per_min,
+    destinations, bits_per_destination, packet_sizes and packets_per_size.
+    """
+    in_window = (times >= start_time) & (times < end_time)
+    if not in_window.any():
+        return None
+
+    times = times[in_window]
+    bits = np.nan_to_num(bits[in_window]) if np.issubdtype(bits.dtype, np.floating) else bits[in_window]
+    packet_counts = packet_counts[in_window]
+    packet_sizes = packet_sizes[in_window]
+    destinations = destinations[in_window]
+
+    # 1. Seconds: one bin per second from the first to the last packet
+    first_second = times.min()
+    second_count = times.max() - first_second + 1
+    second_of_row = times - first_second
+    bits_per_second = _as_totals(np.bincount(second_of_row, weights=bits, minlength=second_count), bits)
+    seconds = first_second + np.arange(second_count)
+
+    # 2. Minutes: the seconds are grouped by minute, every minute of the range has at least one second
+    first_minute = first_second // 60
+    minute_count = (first_second + second_count - 1) // 60 - first_minute + 1
+    minute_of_second = seconds // 60 - first_minute
+    minute_of_row = times // 60 - first_minute
+    minute_starts = np.flatnonzero(np.diff(minute_of_second, prepend=-1))
+
+    seconds_per_minute = np.bincount(minute_of_second, minlength=minute_count)
+    bits_per_minute = np.bincount(minute_of_row, weights=bits, minlength=minute_count)
+    packet_count_per_min = _as_totals(np.bincount(minute_of_row, weights=packet_counts, minlength=minute_count), packet_counts)
+
+    avg_throughput_per_min = bits_per_minute / seconds_per_minute
+    peak_throughput_per_min = np.maximum.reduceat(bits_per_second, minute_starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_packet_size_per_min = np.where(packet_count_per_min > 0, bits_per_minute / 8 / packet_count_per_min, np.nan)
+
+    # 3. Destinations, encoded as integer codes (missing destinations get -1)
+    destination_codes, unique_destinations = pd.factorize(destinations, sort=True)
+    known = destination_codes >= 0
+    destination_count = max(len(unique_destinations), 1)
+
+    # Distinct (minute, destination) pairs, counted per minute
+    pairs = np.unique(minute_of_row[known] * destination_count + destination_codes[known])
+    unique_destinations_per_min = np.bincount(pairs // destination_count, minlength=minute_count)
+
+    bits_per_destination = _as_totals(np.bincount(destination_codes[known], weights=bits[known], minlength=len(unique_destinations)), bits)
+
+    # 4. Packet size histogram
+    size_codes, unique_sizes = pd.factorize(packet_sizes, sort=True)
+    known_sizes = size_codes >= 0
+    packets_per_size = _as_totals(np.bincount(size_codes[known_sizes], weights=packet_counts[known_sizes], minlength=len(unique_sizes)), packet_counts)
+
+    return {
+        "seconds": seconds,
+        "bits_per_second": bits_per_second,
+        "minutes": (first_minute + np.arange(minute_count)) * 60,
+        "avg_throughput_per_min": avg_throughput_per_min,
+        "peak_throughput_per_min": peak_throughput_per_min,
+        "avg_packet_size_per_min": avg_packet_size_per_min,
+        "packet_count_per_min": packet_count_per_min,
+        "unique_destinations_per_min": unique_destinations_per_min,
+        "destinations": np.asarray(unique_destinations),
+        "bits_per_destination": bits_per_destination,
+        "packet_sizes": np.asarray(unique_sizes),
+        "packets_per_size": packets_per_size
+    }
+
+
+def numpy_kernel(metrics_df, start_time, end_time):
+    """The same tables built from aggregate_window."""
+    aggregates = aggregate_window(
+        to_epoch_seconds(metrics_df.index),
+        metrics_df['throughput'].to_numpy(),
+        metrics_df['packet_count'].to_numpy(),
+        metrics_df['packet_size'].to_numpy(),
+        metrics_df['destination'].to_numpy(),
+        to_epoch_seconds(pd.DatetimeIndex([start_time]))[0],
+        to_epoch_seconds(pd.DatetimeIndex([end_time]))[0]
+    )
+    return build_tables(aggregates)
+
+
+def rolling_window(metrics_df, start_time, end_time):
+    """The same tables built from a RollingWindow, as save_metrics_to_csv does."""
+    return build_tables(fill_window(metrics_df, start_time, end_time).aggregate())
+
+
+def fill_window(metrics_df, start_time, end_time):
+    """A RollingWindow over [start_time, end_time) holding the packets of metrics_df."""
+    window = RollingWindow(int((end_time - start_time).total_seconds()))
+    window.move_to(int(to_epoch_seconds(pd.DatetimeIndex([end_time]))[0]))
+    window.add(*window_columns(metrics_df))
+    return window
+
+
+def window_columns(metrics_df):
+    # The destinations are packed as integers in the pipeline
+    return (to_epoch_seconds(metrics_df.index), metrics_df['throughput'].to_numpy(), metrics_df['packet_count'].to_numpy(),
+            metrics_df['packet_size'].to_numpy(), pack_destinations(metrics_df['destination']))
+
+
+def pack_destinations(destinations):
+    codes, unique_text = pd.factorize(destinations)
+    unique_packed = np.array([struct.unpack('!I', socket.inet_aton(text))[0] for text in unique_text], dtype=np.uint32)
+    return unique_packed[codes]
+
+
+def build_tables(aggregates):
+    """The tables of save_metrics_to_csv, with the destinations as text."""
+    if not np.issubdtype(aggregates['destinations'].dtype, np.integer):
+        destinations = aggregates['destinations']
+    else:
+        destinations = np.array([socket.inet_ntoa(struct.pack('!I', int(d))) for d in aggregates['destinations']], dtype=object)
+    order = np.argsort(destinations, kind='stable')
+
+    throughput_per_second = pd.DataFrame({
+        'time': pd.to_datetime(aggregates['seconds'], unit='s'),
+        'throughput_per_sec(bps)': aggregates['bits_per_second']
+    })
+    metrics_per_min = pd.DataFrame({
+        'time': pd.to_datetime(aggregates['minutes'], unit='s'),
+        'avg_throughput_per_min(bps)': aggregates['avg_throughput_per_min'],
+        'peak_throughput_per_min(bps)': aggregates['peak_throughput_per_min'],
+        'avg_packet_size_per_min(bytes)': aggregates['avg_packet_size_per_min'],
+        'packet_count_per_min': aggregates['packet_count_per_min'],
+        'unique_destinations_count_per_min': aggregates['unique_destinations_per_min']
+    }).fillna(0).round(3)
+    dest_traffic = pd.DataFrame({
+        'destination_ip': destinations[order],
+        'throughput_per_ip(bits)': aggregates['bits_per_destination'][order]
+    }).sort_values(by='throughput_per_ip(bits)', ascending=False)
+    packet_sizes_counts = pd.DataFrame({
+        'packet_size(bytes)': aggregates['packet_sizes'],
+        'count': aggregates['packets_per_size']
+    })
+    return throughput_per_second, metrics_per_min, dest_traffic, packet_sizes_counts
+
+
+def check_equivalence(metrics_df, start_time, end_time):
+    """Raise an AssertionError if the implementations disagree on any table."""
+    expected_tables = pandas_reference(metrics_df, start_time, end_time)
+    for implementation in (numpy_kernel, rolling_window):
+        for expected, actual in zip(expected_tables, implementation(metrics_df, start_time, end_time)):
+            pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True), check_dtype=False, check_freq=False)
+
+
+def time_window_update(metrics_df, start_time, end_time, repeats):
+    """Time one run of the pipeline with a saved window: move it by a minute, add that minute and aggregate."""
+    last_minute = end_time - pd.Timedelta(minutes=1)
+    window = fill_window(metrics_df[metrics_df.index < last_minute], start_time - pd.Timedelta(minutes=1), last_minute)
+    new_rows = window_columns(metrics_df[metrics_df.index >= last_minute])
+
+    elapsed = 0
+    for _ in range(repeats):
+        copy = pickle.loads(pickle.dumps(window))
+        start = time.perf_counter()
+        copy.move_to(int(to_epoch_seconds(pd.DatetimeIndex([end_time]))[0]))
+        copy.add(*new_rows)
+        copy.aggregate()
+        elapsed += time.perf_counter() - start
+    return elapsed / repeats
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    start_time = pd.Timestamp('2024-03-05 10:00:00')
+    end_time = start_time + pd.Timedelta(hours=2)
+    # Data starts before the window, so the truncation is exercised too
+    metrics_df = make_metrics(rows, start_time - pd.Timedelta(minutes=10), 2 * 3600 + 1200)
+
+    # The data goes a minute past the window, so the second at end_time is excluded too
+    for seed in range(3):
+        check_equivalence(make_metrics(5000, start_time, 7260, seed), start_time, end_time)
+    check_equivalence(metrics_df, start_time, end_time)
+    print("Equivalence check passed.")
+
+    print(f"{'implementation':<16}{'rows':>10}{'seconds':>10}")
+    for label, implementation in (("pandas", pandas_reference), ("numpy", numpy_kernel), ("rolling window", rolling_window)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            implementation(metrics_df, start_time, end_time)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{label:<16}{len(metrics_df):>10}{elapsed:>10.3f}")
+
+    # A run with a saved window only adds the packets of the last minute
+    new_rows = int((metrics_df.index >= end_time - pd.Timedelta(minutes=1)).sum())
+    print(f"{'window update':<16}{new_rows:>10}{time_window_update(metrics_df, start_time, end_time, repeats):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Time the downsampling of a series to a number of points, and check what it keeps.
+
+The series are random throughputs with a few spikes, as long as the tables /data can downsample:
+the per second table of the display period and the rollup tables. The LTTB implementation is
+compared with a plain Python one first. For each length, the table shows the time of each method,
+the number of points kept, whether the peak of the series was kept and the size of the points as JSON,
+which stays the same whatever the length of the series.
+
+Usage: python benchmarks/bench_downsampling.py [points] [repeats]
+"""
+import os
+import sys
+import json
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from downsampling import lttb_indices, minmax_indices
+
+# (series, number of rows)
+SERIES = (
+    ("2h of seconds", 2 * 3600),
+    ("48h of minutes", 48 * 60),
+    ("30d of 15 min", 30 * 96),
+    ("1y of hours", 365 * 24),
+    ("1d of seconds", 24 * 3600),
+)
+
+
+def make_series(rows, seed = 0):
+    """Random throughput with spikes."""
+    rng = np.random.default_rng(seed)
+    values = rng.gamma(2.0, 500.0, rows).round(3)
+    values[rng.integers(0, rows, 5)] *= 40
+    return values
+
+
+def lttb_reference(values, points):
+    """LTTB as it is usually written, one row at a time."""
+    count = len(values)
+    edge = lambda bucket: 1 + bucket * (count - 2) // (points - 2)
+    indices = [0]
+    previous = 0
+    for bucket in range(points - 2):
+        next_start = edge(bucket + 1)
+        next_end = edge(bucket + 2) if bucket + 2 <= points - 2 else count
+        next_x = sum(range(next_start, next_end)) / (next_end - next_start)
+        next_y = sum(values[next_start:next_end]) / (next_end - next_start)
+        best_area, best = -1, None
+        for row in range(edge(bucket), edge(bucket + 1)):
+            area = abs((previous - next_x) * (values[row] - values[previous]) - (previous - row) * (next_y - values[previous]))
+            if area > best_area:
+                best_area, best = area, row
+        indices.append(best)
+        previous = best
+    indices.append(count - 1)
+    return indices
+
+
+def time_calls(function, repeats, *args):
+    """Return the average time of a call in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(*args)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    for seed in range(3):
+        values = make_series(5000, seed)
+        assert list(lttb_indices(values, points)) == lttb_reference(values.tolist(), points)
+    print("Equivalence check passed.")
+
+    print(f"{'series':<18}{'rows':>8}{'method':>8}{'ms':>8}{'points':>8}{'peak kept':>11}{'JSON bytes':>12}")
+    for label, rows in SERIES:
+        values = make_series(rows)
+        for method, function in (("minmax", minmax_indices), ("lttb", lttb_indices)):
+            indices = function(values, points)
+            kept = values[indices]
+            print(f"{label:<18}{rows:>8}{method:>8}{time_calls(function, repeats, values, points):>8.2f}{len(indices):>8}"
+                  f"{str(kept.max() == values.max()):>11}{len(json.dumps(kept.tolist())):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Measure the peak memory of extract_data_from_pcap on a large synthetic pcap.
+
+Each extraction runs in its own process, once per chunk size, and reports the growth of its peak
+resident memory over the memory used after the imports. With the chunked extraction, the peak depends
+on EXTRACT_CHUNK_MB and on the rows of the partial aggregates, and not on the size of the file. Exits
+with 1 if a peak is over its budget: the chunk size plus BYTES_PER_PARTIAL_ROW for each row of the
+result.
+
+Usage: python benchmarks/bench_extraction_memory.py [size_gb] [chunk_mb ...]
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_FOLDER, ".."))
+
+from synthetic import write_pcap, PACKET_SIZES
+
+DURATION = 2 * 3600  # seconds, the packets fill the display period
+DESTINATIONS = 10  # few destinations, so the size of the aggregates does not grow with the file
+
+# Peak memory per row of the partial aggregates, which are concatenated and compacted again when merged
+BYTES_PER_PARTIAL_ROW = 250
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(pcap_file, reader, chunk_mb):
+    """Extract the pcap in this process and print the measurements as JSON."""
+    import data_process
+    data_process.CURRENT_TIME = datetime.now()
+    data_process.PCAP_READER = reader
+    data_process.EXTRACT_CHUNK_MB = chunk_mb
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    metrics = data_process.extract_data_from_pcap(pcap_file)[0]
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "packets": int(metrics['packet_count'].sum()) if metrics is not None else 0,
+        "rows": len(metrics) if metrics is not None else 0,
+        "peak_mb": peak_rss_mb() - baseline
+    }))
+
+
+def measure(pcap_file, reader, chunk_mb):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", pcap_file, reader, str(chunk_mb)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    size_gb = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    chunk_sizes = [int(chunk_mb) for chunk_mb in sys.argv[2:]] or [32, 128, 512]
+
+    frame_size = 16 + 14 + sum(PACKET_SIZES) / len(PACKET_SIZES)
+    packets_per_second = max(1, int(size_gb * 1e9 / frame_size / DURATION))
+
+    failures = []
+    folder = tempfile.mkdtemp()
+    try:
+        pcap_file = os.path.join(folder, "bench.pcap")
+        print("Writing the synthetic pcap...")
+        packet_count = write_pcap(pcap_file, time.time() - DURATION, DURATION, packets_per_second, DESTINATIONS)
+        print(f"Synthetic pcap: {packet_count} packets, {os.path.getsize(pcap_file) / 1e9:.2f} GB")
+
+        readers = ["native"] + (["tshark"] if shutil.which("tshark") else [])
+        print(f"{'reader':<10}{'chunk MB':>10}{'peak MB':>10}{'budget MB':>11}{'seconds':>10}{'packets':>12}{'rows':>10}")
+        for reader in readers:
+            for chunk_mb in chunk_sizes:
+                result = measure(pcap_file, reader, chunk_mb)
+                budget_mb = chunk_mb + result['rows'] * BYTES_PER_PARTIAL_ROW / (1024 * 1024)
+                print(f"{reader:<10}{chunk_mb:>10}{result['peak_mb']:>10.0f}{budget_mb:>11.0f}{result['seconds']:>10.1f}{result['packets']:>12}{result['rows']:>10}")
+
+                if result['peak_mb'] > budget_mb:
+                    failures.append(f"{reader} with {chunk_mb} MB chunks peaked at {result['peak_mb']:.0f} MB, over its budget of {budget_mb:.0f} MB")
+    finally:
+        shutil.rmtree(folder)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
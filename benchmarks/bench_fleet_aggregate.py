@@ -0,0 +1,210 @@
+"""Compare the fleet aggregate with the pandas implementation of process_all_devices_data it replaced.
+
+Each device has a random 2 hour window, starting and ending at a different minute. The pandas
+implementation reads back the CSV files of every device, as process_all_devices_data did. The fleet
+aggregate adds the metrics_per_min table and the destination sketches of each device as it is built.
+The pandas implementation averaged the destination counts of the devices, the fleet aggregate counts
+the distinct destinations of all devices, so that column is checked against an exact count instead.
+The distinct destinations of the last minutes are then counted from the sketches, on devices that
+send to many destinations, and compared with exact counts.
+
+Usage: python benchmarks/bench_fleet_aggregate.py [devices] [repeats]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aggregation import to_epoch_seconds
+from fleet_aggregate import FleetAggregate, summarize_device
+from rolling_window import RollingWindow
+from bench_aggregation import make_metrics, fill_window, build_tables
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def make_device_tables(device_count, start_time, end_time):
+    """The throughput_per_second and metrics_per_min tables and the window of random devices."""
+    rng = np.random.default_rng(0)
+    tables = []
+    for device in range(device_count):
+        # Devices start and stop sending at different times
+        first_second = int(rng.integers(0, 3600))
+        seconds = int(rng.integers(600, 7200 - first_second))
+        metrics_df = make_metrics(seconds * 2, start_time + pd.Timedelta(seconds=first_second), seconds, seed=device)
+        window = fill_window(metrics_df, start_time, end_time)
+        throughput_per_second, metrics_per_min, _, _ = build_tables(window.aggregate())
+        tables.append((f"device{device}", throughput_per_second, metrics_per_min, window))
+    return tables
+
+
+def write_device_tables(folder, tables):
+    for device_name, throughput_per_second, metrics_per_min, _ in tables:
+        os.makedirs(os.path.join(folder, device_name))
+        throughput_per_second.to_csv(os.path.join(folder, device_name, f'throughput_per_second_{device_name}.csv'), index=False, date_format=TIME_FORMAT)
+        metrics_per_min.to_csv(os.path.join(folder, device_name, f'metrics_per_min_{device_name}.csv'), index=False, date_format=TIME_FORMAT)
+
+
+def pandas_reference(folder, device_names, start_time, end_time):
+    """The CSV round trip and concat/resample/groupby of process_all_devices_data before the fleet aggregate."""
+    all_devices_data_list = []
+    all_throughput_data_list = []
+    for device_name in device_names:
+        metrics_df = pd.read_csv(os.path.join(folder, device_name, f'metrics_per_min_{device_name}.csv'), parse_dates=['time'])
+        throughput_df = pd.read_csv(os.path.join(folder, device_name, f'throughput_per_second_{device_name}.csv'), parse_dates=['time'])
+        metrics_df = metrics_df.drop(columns=['peak_throughput_per_min(bps)'])
+        all_throughput_data_list.append(throughput_df)
+        metrics_df.set_index('time', inplace=True)
+        all_devices_data_list.append((device_name, metrics_df))
+
+    all_throughput_data = pd.concat(all_throughput_data_list).sort_values(by='time').set_index('time')
+    peak_throughput_total = all_throughput_data.resample('1min').max()['throughput_per_sec(bps)']
+    peak_throughput_total.name = 'peak_throughput_all_devices(bps)'
+
+    aggregated_data = pd.concat([df.reset_index() for _, df in all_devices_data_list]).sort_values(by='time')
+    aggregated_data = aggregated_data.groupby('time').agg({
+        'avg_throughput_per_min(bps)': 'mean',
+        'avg_packet_size_per_min(bytes)': 'mean',
+        'packet_count_per_min': 'sum',
+        'unique_destinations_count_per_min': 'mean'
+    }).reset_index()
+    aggregated_data = pd.merge(aggregated_data, peak_throughput_total.reset_index(), on='time', how='left')
+    aggregated_data.rename(columns={
+        'avg_throughput_per_min(bps)': 'avg_throughput_all_devices(bps)',
+        'avg_packet_size_per_min(bytes)': 'avg_packet_size_all_devices(bytes)',
+        'packet_count_per_min': 'packet_count_all_devices',
+        'unique_destinations_count_per_min': 'destinations_count_all_devices'
+    }, inplace=True)
+    aggregated_data = aggregated_data.fillna(0)[[
+        'time', 'avg_throughput_all_devices(bps)', 'peak_throughput_all_devices(bps)',
+        'avg_packet_size_all_devices(bytes)', 'packet_count_all_devices', 'destinations_count_all_devices'
+    ]].round(3)
+
+    device_traffic_list = []
+    for device_name, device_df in all_devices_data_list:
+        truncated_df = device_df.truncate(before=start_time, after=end_time)
+        device_traffic_list.append((device_name, round((truncated_df['avg_throughput_per_min(bps)'] * 60).sum())))
+    sorted_traffic = pd.DataFrame(sorted(device_traffic_list, key=lambda x: x[1], reverse=True),
+                                  columns=['device_name', 'total_throughput(bits)'])
+    return aggregated_data, sorted_traffic
+
+
+def fill_fleet(tables, start_time, end_time):
+    """A FleetAggregate filled as main fills it when each device finishes."""
+    start, end = to_epoch_seconds(pd.DatetimeIndex([start_time, end_time]))
+    fleet = FleetAggregate(int(start), int(end))
+    for device_name, _, metrics_per_min, window in tables:
+        fleet.add_device(device_name, summarize_device(metrics_per_min, window))
+    return fleet
+
+
+def fleet_aggregate(tables, start_time, end_time):
+    """The same tables from a FleetAggregate."""
+    fleet = fill_fleet(tables, start_time, end_time)
+    return fleet.metrics_per_min(), fleet.sorted_traffic()
+
+
+def exact_destination_counts(tables, minutes):
+    """Distinct destinations of all devices in each minute, from the exact sets of the windows."""
+    counts = []
+    for minute in minutes:
+        destinations = [window.minute_destinations[(minute // 60) % window.minute_slots][0]
+                        for _, _, _, window in tables if window.start <= minute <= window.end]
+        counts.append(len(np.unique(np.concatenate(destinations))))
+    return np.array(counts)
+
+
+def make_scanner_windows(device_count, end, destinations_per_minute):
+    """Windows of devices that send to random destinations among 2^20 every minute."""
+    rng = np.random.default_rng(1)
+    windows = []
+    for _ in range(device_count):
+        window = RollingWindow(7200)
+        window.move_to(end)
+        times = np.repeat(np.arange(end - 7200, end, 60), destinations_per_minute)
+        ones = np.ones(len(times), dtype=np.int64)
+        window.add(times, ones * 480, ones, ones * 60, rng.integers(0, 1 << 20, len(times)))
+        windows.append(window)
+    return windows
+
+
+def time_destination_counts(device_count, end, repeats):
+    """Count the distinct destinations of all devices over the last minutes, exactly and from the sketches."""
+    windows = make_scanner_windows(device_count, end, 200)
+    fleet = FleetAggregate(end - 7200, end)
+    for device, window in enumerate(windows):
+        minutes = np.arange(end - 7200, end + 1, 60)
+        fleet.add_device(f"device{device}", {
+            "minutes": minutes, "avg_throughput": np.zeros(len(minutes)), "peak_throughput": np.zeros(len(minutes), dtype=np.int64),
+            "avg_packet_size": np.zeros(len(minutes)), "packet_count": np.zeros(len(minutes), dtype=np.int64),
+            "destination_sketches": window.destination_sketches(minutes)
+        })
+
+    print(f"{'last minutes':<16}{'exact':>10}{'sketch':>10}{'error %':>10}{'exact ms':>10}{'sketch ms':>10}")
+    for minute_count in (1, 10, 60, 120):
+        first = end - minute_count * 60
+        start = time.perf_counter()
+        for _ in range(repeats):
+            exact = len(np.unique(np.concatenate([window.minute_destinations[(minute // 60) % window.minute_slots][0]
+                                                  for window in windows for minute in range(first, end, 60)])))
+        exact_ms = (time.perf_counter() - start) / repeats * 1000
+        start = time.perf_counter()
+        for _ in range(repeats):
+            estimate = fleet.count_destinations(first, end - 60)
+        sketch_ms = (time.perf_counter() - start) / repeats * 1000
+        print(f"{minute_count:<16}{exact:>10}{estimate:>10}{(estimate - exact) / exact * 100:>10.2f}{exact_ms:>10.2f}{sketch_ms:>10.2f}")
+
+
+def check_equivalence(tables, folder, device_names, start_time, end_time):
+    """Raise an AssertionError if the fleet aggregate disagrees with the pandas implementation."""
+    expected_metrics, expected_traffic = pandas_reference(folder, device_names, start_time, end_time)
+    actual_metrics, actual_traffic = fleet_aggregate(tables, start_time, end_time)
+
+    # The averages of exact ties (half a thousandth) may be rounded either way by a float mean
+    destination_column = 'destinations_count_all_devices'
+    pd.testing.assert_frame_equal(expected_metrics.drop(columns=[destination_column]), actual_metrics.drop(columns=[destination_column]),
+                                  check_dtype=False, atol=0.0011, rtol=0)
+    expected_counts = exact_destination_counts(tables, to_epoch_seconds(pd.DatetimeIndex(actual_metrics['time'])))
+    np.testing.assert_array_equal(expected_counts, actual_metrics[destination_column].to_numpy())
+
+    # The traffic of the devices is distinct, so both sort orders agree
+    pd.testing.assert_frame_equal(expected_traffic, actual_traffic, check_dtype=False)
+
+
+def main():
+    device_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    start_time = pd.Timestamp('2024-03-05 10:00:00')
+    end_time = start_time + pd.Timedelta(hours=2)
+    tables = make_device_tables(device_count, start_time, end_time)
+    device_names = [device_name for device_name, _, _, _ in tables]
+
+    folder = tempfile.mkdtemp()
+    try:
+        write_device_tables(folder, tables)
+
+        check_equivalence(tables, folder, device_names, start_time, end_time)
+        print("Equivalence check passed.")
+
+        print(f"{'implementation':<16}{'devices':>10}{'seconds':>10}")
+        for label, implementation, args in (("pandas", pandas_reference, (folder, device_names, start_time, end_time)),
+                                            ("fleet aggregate", fleet_aggregate, (tables, start_time, end_time))):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                implementation(*args)
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{label:<16}{device_count:>10}{elapsed:>10.3f}")
+    finally:
+        shutil.rmtree(folder)
+
+    time_destination_counts(device_count, int(to_epoch_seconds(pd.DatetimeIndex([end_time]))[0]), repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compare selecting the pcap files of the display period with os.walk and with the pcap catalog.
+
+The device folder holds one hourly pcap file (empty) per hour of many days, in a folder per day. The
+os.walk implementation is the get_files_to_process used before the catalog: it lists and parses the
+names of all the files on every run. The catalog is refreshed (one stat per directory when nothing
+changed) and queried by start time.
+
+Usage: python benchmarks/bench_pcap_catalog.py [days] [repeats]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pcap_catalog import PcapCatalog, get_file_time_from_name, to_wall_clock_seconds
+
+DISPLAY_PERIOD = 2  # hours
+
+
+def make_device_folder(folder, days, end_time):
+    """Create a folder per day with an empty pcap file per hour, and make the folders look old."""
+    old = time.time() - 3600
+    for day in range(days):
+        day_time = end_time - timedelta(days=day)
+        day_folder = os.path.join(folder, day_time.strftime('%Y'), day_time.strftime('%m-%d'))
+        os.makedirs(day_folder, exist_ok=True)
+        for hour in range(24):
+            file_time = day_time.replace(hour=hour, minute=0, second=0)
+            open(os.path.join(day_folder, file_time.strftime('%Y-%m-%d_%H.%M.%S') + '_aabb.pcap'), 'wb').close()
+    for folder_path, _, _ in os.walk(folder):
+        os.utime(folder_path, (old, old))
+
+
+def walk_reference(folder, current_time):
+    """get_files_to_process before the catalog."""
+    pcap_files = sorted([os.path.join(dp, f) for dp, dn, filenames in os.walk(folder) for f in filenames if f.endswith('.pcap')], reverse=True)
+    valid_files = [(f, get_file_time_from_name(f)) for f in pcap_files]
+    valid_files = [(f, t) for f, t in valid_files if t is not None and t <= current_time]
+
+    two_hours_ago = current_time - timedelta(hours=DISPLAY_PERIOD)
+    twenty_six_hours_ago = current_time - timedelta(hours=DISPLAY_PERIOD + 24)
+    files = [f for f, t in valid_files if t > two_hours_ago]
+    first_file_beyond_2h = next((f for f, t in valid_files if twenty_six_hours_ago <= t <= two_hours_ago), None)
+    if first_file_beyond_2h:
+        files.append(first_file_beyond_2h)
+    return files
+
+
+def catalog_selection(catalog, folder, current_time):
+    """The same selection from the catalog, as get_files_to_process does it now."""
+    catalog.refresh("aabb", folder)
+    current_second = to_wall_clock_seconds(current_time)
+    window_start = current_second - DISPLAY_PERIOD * 3600
+    files = catalog.files_between("aabb", window_start, current_second)
+    file_before_window = catalog.latest_file_between("aabb", window_start - 24 * 3600, window_start)
+    if file_before_window:
+        files.append(file_before_window)
+    return files
+
+
+def time_calls(function, repeats, *args):
+    """Return the average time of a call in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(*args)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    current_time = datetime(2024, 3, 5, 12, 30, 20)
+    folder = tempfile.mkdtemp()
+    try:
+        device_folder = os.path.join(folder, "by-mac", "aa:bb")
+        make_device_folder(device_folder, days, current_time)
+
+        with PcapCatalog(os.path.join(folder, "catalog.sqlite")) as catalog:
+            start = time.perf_counter()
+            catalog.refresh("aabb", device_folder)
+            first_refresh_ms = (time.perf_counter() - start) * 1000
+
+            assert catalog_selection(catalog, device_folder, current_time) == walk_reference(device_folder, current_time)
+            print("Equivalence check passed.")
+
+            print(f"{'selection':<24}{'files':>10}{'ms':>10}")
+            print(f"{'os.walk + strptime':<24}{days * 24:>10}{time_calls(walk_reference, repeats, device_folder, current_time):>10.2f}")
+            print(f"{'catalog, first refresh':<24}{days * 24:>10}{first_refresh_ms:>10.2f}")
+            print(f"{'catalog':<24}{days * 24:>10}{time_calls(catalog_selection, repeats, catalog, device_folder, current_time):>10.2f}")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
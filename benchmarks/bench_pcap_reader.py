@@ -0,0 +1,60 @@
+"""Compare the native pcap reader with the tshark path of extract_data_from_pcap.
+
+Usage: python benchmarks/bench_pcap_reader.py [packets_per_second] [duration_seconds]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import data_process
+from synthetic import write_pcap
+
+
+def time_extraction(pcap_file, reader):
+    """Run extract_data_from_pcap with the given reader and return (seconds, packets)."""
+    data_process.PCAP_READER = reader
+    start = time.perf_counter()
+    metrics = data_process.extract_data_from_pcap(pcap_file)[0]
+    elapsed = time.perf_counter() - start
+    packets = int(metrics['packet_count'].sum()) if metrics is not None else 0
+    return elapsed, packets
+
+
+def main():
+    packets_per_second = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration = int(sys.argv[2]) if len(sys.argv) > 2 else 3600
+
+    data_process.CURRENT_TIME = datetime.now()
+    start_time = time.time() - duration
+
+    folder = tempfile.mkdtemp()
+    try:
+        pcap_file = os.path.join(folder, "bench.pcap")
+        packet_count = write_pcap(pcap_file, start_time, duration, packets_per_second, 50)
+        size_mb = os.path.getsize(pcap_file) / 1e6
+        print(f"Synthetic pcap: {packet_count} packets, {size_mb:.1f} MB")
+
+        readers = ["native"]
+        if shutil.which("tshark"):
+            readers.append("tshark")
+        else:
+            print("tshark not found, only the native reader is measured.")
+
+        results = {}
+        for reader in readers:
+            results[reader] = time_extraction(pcap_file, reader)
+
+        print(f"{'reader':<10}{'seconds':>10}{'packets':>12}{'packets/s':>14}")
+        for reader, (elapsed, packets) in results.items():
+            print(f"{reader:<10}{elapsed:>10.2f}{packets:>12}{packets / elapsed:>14.0f}")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Benchmark suite: data_process end to end, each stage on its own, and /data under concurrent load.
+
+The traffic is synthetic (synthetic.write_device_folders): N devices in the by-mac layout, each with
+an hourly pcap file of M packets per second to K destinations, from the hour the display period
+starts in. The time of the runs is pinned to CURRENT_TIME, so the same arguments process the same
+packets on every machine and every commit.
+
+1. main() runs end to end in a child process, so its peak memory is its own: first without
+   checkpoints (cold), then again with nothing changed (warm). The stage times come from the run
+   reports of the cold runs.
+2. Each stage runs on its own in this process, on the first device.
+3. web_app serves the generation of the last run in a child process, and concurrent clients send
+   POST /data requests for random devices. The data of all the devices is then loaded with one
+   request per device and with one /data/batch request.
+
+The results are a flat JSON object of metrics (value, unit and whether lower or higher is better),
+written with sorted keys so two result files can be diffed. --compare prints the change of each
+metric against a previous result file and exits with 1 if one got worse by more than --threshold.
+
+Usage: python benchmarks/bench_pipeline.py [--devices N] [--pps M] [--destinations K] [--workers W]
+           [--repeats R] [--clients C] [--requests Q] [--output results.json] [--compare baseline.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+import urllib.request
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_FOLDER = os.path.join(BENCHMARKS_FOLDER, "..")
+sys.path.insert(0, REPO_FOLDER)
+
+from synthetic import write_device_folders
+
+CURRENT_TIME = datetime(2024, 3, 5, 12, 30, 20)
+HOURS = 2  # hours of hourly files before CURRENT_TIME, from the file the display period starts in
+SERVER_START_TIMEOUT = 30  # seconds
+
+
+#------------------------------------------------------------------------------
+def configure_data_process(root, workers = 0):
+    """Point data_process at the folders of the benchmark."""
+    import data_process
+    data_process.BY_MAC_FOLDER_PATH = os.path.join(root, "by-mac")
+    data_process.DATA_FINISHED_PRO_FOLDER_PATH = os.path.join(root, "data_finished_processed")
+    data_process.CHECKPOINT_FOLDER_PATH = os.path.join(root, "checkpoints")
+    data_process.PROCESS_WORKERS = workers
+    os.makedirs(data_process.DATA_FINISHED_PRO_FOLDER_PATH, exist_ok=True)
+    return data_process
+
+
+def run_main_child(root, workers, seconds_after):
+    """Run main() once in this process and print its wall time and run report as JSON.
+
+    The run is seconds_after CURRENT_TIME, as each run needs a generation of its own.
+    """
+    data_process = configure_data_process(root, workers)
+    from generations import resolve_generation
+    from instrumentation import read_run_report
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_process.main(current_time = CURRENT_TIME + timedelta(seconds=seconds_after))
+    wall_seconds = time.perf_counter() - start
+
+    report = read_run_report(os.path.join(resolve_generation(data_process.DATA_FINISHED_PRO_FOLDER_PATH), "all_device"))
+    print(json.dumps({"wall_seconds": wall_seconds, "report": report}))
+
+
+def run_main(root, workers, seconds_after = 0):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-main", root, str(workers), str(seconds_after)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_end_to_end(root, workers, repeats, results):
+    """main() without checkpoints, then again a second later (same minute) with nothing changed."""
+    cold_runs, warm_runs = [], []
+    for _ in range(repeats):
+        for folder in ("checkpoints", "data_finished_processed"):
+            shutil.rmtree(os.path.join(root, folder), ignore_errors=True)
+        cold_runs.append(run_main(root, workers))
+        warm_runs.append(run_main(root, workers, 1))
+
+    for label, runs in (("main_cold", cold_runs), ("main_warm", warm_runs)):
+        wall_seconds = statistics.median(run["wall_seconds"] for run in runs)
+        report = runs[0]["report"]
+        add_result(results, f"{label}.wall_seconds", wall_seconds, "s", "lower")
+        add_result(results, f"{label}.peak_rss_mb", max(run["report"]["peak_rss_bytes"] for run in runs) / 2**20, "MB", "lower")
+        add_result(results, f"{label}.packets_parsed", report["counters"].get("packets_parsed", 0), "packets", "equal")
+
+    # Packets per second of the whole run, median time of each stage over the cold runs
+    report = cold_runs[0]["report"]
+    add_result(results, "main_cold.packets_per_second", report["counters"].get("packets_parsed", 0) / results["main_cold.wall_seconds"]["value"], "packets/s", "higher")
+    for name in report["stages"]:
+        wall_seconds = statistics.median(run["report"]["stages"][name]["wall_seconds"] for run in cold_runs)
+        add_result(results, f"main_cold.stage.{name}.wall_seconds", wall_seconds, "s", "lower")
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def bench_stages(root, repeats, device_count, results):
+    """Each stage of the processing of a device on its own, on the first device.
+
+    extract_data_from_pcap is timed over all the files of the device, the fleet tables are built
+    from device_count copies of the device.
+    """
+    data_process = configure_data_process(os.path.join(root, "stages"))
+    shutil.copytree(os.path.join(root, "by-mac"), data_process.BY_MAC_FOLDER_PATH)
+    data_process.CURRENT_TIME = CURRENT_TIME
+    data_process.OUTPUT_FOLDER_PATH = os.path.join(root, "stages", "output")
+    data_process.PREVIOUS_GENERATION_PATH = None
+
+    mac_address, device_folder_path, device_name = sorted(data_process.get_devices_to_process())[0]
+    checkpoint_folder = os.path.join(data_process.CHECKPOINT_FOLDER_PATH, mac_address)
+    timings = {}
+
+    def timed(name, function, *args):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = function(*args)
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+        return value
+
+    for _ in range(repeats):
+        pcap_files = timed("get_files_to_process", data_process.get_files_to_process, device_folder_path)
+        extracted = timed("extract_data_from_pcap", lambda: [data_process.extract_data_from_pcap(pcap_file)[0] for pcap_file in pcap_files])
+        packets = sum(int(metrics['packet_count'].sum()) for metrics in extracted)
+
+        shutil.rmtree(checkpoint_folder, ignore_errors=True)
+        data_process.WINDOWS_IN_MEMORY.clear()
+        window, rollups, _ = timed("update_device_window", data_process.update_device_window, device_folder_path)
+        metrics_per_min = timed("save_metrics_to_csv", data_process.save_metrics_to_csv, window, device_name, mac_address)
+        timed("save_rollup_tables", data_process.save_rollup_tables, rollups, window, device_name)
+
+        # The fleet tables of device_count devices with the traffic of the first one
+        from fleet_aggregate import summarize_device
+        summary = summarize_device(metrics_per_min, window)
+
+        def build_fleet_tables():
+            fleet = data_process.create_fleet_aggregate()
+            for device in range(device_count):
+                fleet.add_device(f"device{device}", summary)
+            data_process.process_all_devices_data(fleet)
+        timed("fleet_tables", build_fleet_tables)
+
+    for name, seconds in timings.items():
+        add_result(results, f"stage.{name}.seconds", statistics.median(seconds), "s", "lower")
+    add_result(results, "stage.extract_data_from_pcap.packets_per_second", packets / statistics.median(timings["extract_data_from_pcap"]), "packets/s", "higher")
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def serve_child(base_path, port):
+    """Serve web_app on the given port with its production server, reading the generations of base_path."""
+    import logging
+    import web_app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    web_app.BASE_PATH = base_path
+    web_app.HOST, web_app.PORT = "127.0.0.1", port
+    web_app.run_server()
+
+
+def get_free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_server(url, server):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("web_app exited before serving")
+        try:
+            with urllib.request.urlopen(url + "/devices", timeout=1) as response:
+                return json.loads(response.read())["devices"]
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("web_app did not start")
+
+
+def post_data(url, device_name):
+    """POST /data for a device, return the latency in seconds and the size of the response."""
+    return post_json(url + "/data", {"device_name": device_name})
+
+
+def post_json(url, params):
+    """POST a JSON body, return the latency in seconds and the size of the response."""
+    request = urllib.request.Request(url, data=json.dumps(params).encode(), headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        size = len(response.read())
+    return time.perf_counter() - start, size
+
+
+def bench_data_endpoint(root, clients, request_count, results):
+    """Latency of POST /data with concurrent clients."""
+    port = get_free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", os.path.join(root, "data_finished_processed"), str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        devices = sorted(wait_for_server(url, server))
+        rng = random.Random(0)
+        device_names = [rng.choice(devices) for _ in range(request_count)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            responses = list(executor.map(lambda device_name: post_data(url, device_name), device_names))
+        elapsed = time.perf_counter() - start
+
+        # The data of all the devices: one request per device, then one /data/batch request
+        # (each run once to warm the cache of the server first)
+        for _ in range(2):
+            sequential_seconds = sum(post_data(url, device_name)[0] for device_name in devices)
+            batch_seconds, _ = post_json(url + "/data/batch", {"device_names": devices})
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for latency, _ in responses)
+    for percentile in (50, 95, 99):
+        add_result(results, f"data.latency_p{percentile}_ms", latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] * 1000, "ms", "lower")
+    add_result(results, "data.requests_per_second", request_count / elapsed, "requests/s", "higher")
+    add_result(results, "data.mean_response_bytes", sum(size for _, size in responses) / len(responses), "bytes", "lower")
+    add_result(results, "data.all_devices_sequential_ms", sequential_seconds * 1000, "ms", "lower")
+    add_result(results, "data.all_devices_batch_ms", batch_seconds * 1000, "ms", "lower")
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def add_result(results, name, value, unit, better):
+    results[name] = {"value": round(float(value), 6), "unit": unit, "better": better}
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_FOLDER, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(), "commit": commit}
+
+
+def compare_results(baseline, results, threshold):
+    """Print the change of each metric against the baseline. Returns the names of the regressions."""
+    regressions = []
+    print(f"{'metric':<56}{'baseline':>14}{'current':>14}{'change %':>10}")
+    for name in sorted(set(baseline["results"]) & set(results)):
+        before, after = baseline["results"][name]["value"], results[name]["value"]
+        change = (after - before) / before if before else 0.0
+        better = results[name]["better"]
+        worse = change > threshold if better == "lower" else change < -threshold if better == "higher" else before != after
+        if worse:
+            regressions.append(name)
+        print(f"{name:<56}{before:>14.3f}{after:>14.3f}{change * 100:>10.1f}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark data_process and web_app on synthetic traffic.")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--pps", type=int, default=20, help="packets per second of each device")
+    parser.add_argument("--destinations", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=0, help="PROCESS_WORKERS of data_process")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent /data clients")
+    parser.add_argument("--requests", type=int, default=400, help="/data requests in total")
+    parser.add_argument("--output", help="file to save the results to")
+    parser.add_argument("--compare", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        packet_count = write_device_folders(os.path.join(root, "by-mac"), args.devices, args.pps, args.destinations, CURRENT_TIME, HOURS)
+        print(f"Synthetic traffic: {args.devices} devices, {packet_count} packets, written in {time.perf_counter() - start:.1f} seconds")
+
+        results = {}
+        bench_end_to_end(root, args.workers, args.repeats, results)
+        bench_data_endpoint(root, args.clients, args.requests, results)
+        bench_stages(root, args.repeats, args.devices, results)
+    finally:
+        shutil.rmtree(root)
+
+    print(f"{'metric':<56}{'value':>14}  unit")
+    for name, result in sorted(results.items()):
+        print(f"{name:<56}{result['value']:>14.3f}  {result['unit']}")
+
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "compare", "threshold")}
+    config["current_time"] = CURRENT_TIME.isoformat()
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"config": config, "environment": get_environment(), "results": results},
+                      output_file, indent=1, sort_keys=True)
+            output_file.write("\n")
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("config") != config:
+            print(f"Warning: the baseline was run with another configuration: {baseline.get('config')}")
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run-main":
+        run_main_child(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve_child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,72 @@
+"""Check the import time of data_process and web_app against a budget.
+
+Each module is imported in a new interpreter, REPEATS times, and the median time is compared with its
+budget. The modules that must not be imported at startup are checked too: scapy is not used at all,
+and web_app serves the snapshots without pandas or numpy, which are only imported by the requests
+that read the tables. Exits with 1 if a module is over its budget or imported a module it must not.
+
+Usage: python benchmarks/bench_startup.py [--repeats R] [--data-process-budget S] [--web-app-budget S]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules checked: (module, option of its budget, modules it must not import)
+MODULES = (
+    ("data_process", "data_process_budget", ("scapy",)),
+    ("web_app", "web_app_budget", ("scapy", "pandas", "numpy")),
+)
+
+# Run in the child interpreter: import the module and print the time it took and the modules loaded
+IMPORT_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(name.split('.')[0] for name in sys.modules)}}))
+"""
+
+
+def time_import(module):
+    """Import a module in a new interpreter. Returns the seconds it took and the top-level modules loaded."""
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], cwd=ROOT_FOLDER)
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return result["seconds"], set(result["modules"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of data_process and web_app.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--data-process-budget", type=float, default=1.5, help="seconds")
+    parser.add_argument("--web-app-budget", type=float, default=0.75, help="seconds")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<16}{'median s':>10}{'budget s':>10}")
+    for module, budget_option, forbidden in MODULES:
+        times = []
+        for _ in range(args.repeats):
+            seconds, loaded = time_import(module)
+            times.append(seconds)
+        median = statistics.median(times)
+        budget = getattr(args, budget_option)
+        print(f"{module:<16}{median:>10.3f}{budget:>10.3f}")
+
+        if median > budget:
+            failures.append(f"{module} takes {median:.3f}s to import, over its budget of {budget:.3f}s")
+        for name in sorted(loaded & set(forbidden)):
+            failures.append(f"{module} imports {name} at startup")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare reading the last rows of a table from CSV and from the columnar format.
+
+The table is a 2 hour window of 1 second throughput, as written by save_metrics_to_csv.
+
+Usage: python benchmarks/bench_storage.py [repeats]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage import write_table, read_table, FORMAT_CSV, FORMAT_COLUMNAR
+
+
+def time_reads(folder, table_name, repeats, **kwargs):
+    """Return the average time of read_table in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        read_table(folder, table_name, **kwargs)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    throughput_per_second = pd.DataFrame({
+        'time': pd.date_range('2024-01-01 10:00:00', periods=7200, freq='1s'),
+        'throughput_per_sec(bps)': np.random.default_rng(0).integers(0, 100000, 7200)
+    })
+
+    csv_folder = tempfile.mkdtemp()
+    columnar_folder = tempfile.mkdtemp()
+    try:
+        write_table(csv_folder, 'throughput_per_second', throughput_per_second, (FORMAT_CSV,), date_format='%Y-%m-%d %H:%M:%S.%f')
+        write_table(columnar_folder, 'throughput_per_second', throughput_per_second, (FORMAT_COLUMNAR,), date_format='%Y-%m-%d %H:%M:%S.%f')
+
+        print(f"{'read':<32}{'csv (ms)':>12}{'columnar (ms)':>16}")
+        cases = [
+            ("last 300 rows as text", dict(tail=300)),
+            ("all rows with parsed dates", dict(parse_dates=True)),
+        ]
+        for label, kwargs in cases:
+            csv_ms = time_reads(csv_folder, 'throughput_per_second', repeats, **kwargs)
+            columnar_ms = time_reads(columnar_folder, 'throughput_per_second', repeats, **kwargs)
+            print(f"{label:<32}{csv_ms:>12.2f}{columnar_ms:>16.2f}")
+    finally:
+        shutil.rmtree(csv_folder)
+        shutil.rmtree(columnar_folder)
+
+
+if __name__ == "__main__":
+    main()
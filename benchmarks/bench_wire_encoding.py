@@ -0,0 +1,92 @@
+"""Compare the size and the server CPU time of the /data responses in each encoding and content coding.
+
+A device with random traffic over the display period is written as data_process writes it (tables and
+snapshots), then web_app answers, through its test client: the full data (the snapshot file), an
+incremental request for the last 5 minutes (built from the tables) and a range request for the last
+hour. Each is requested as JSON and in the compact encoding, without compression, with gzip and with
+brotli. The first row of each request is the JSON response without compression, as sent before the
+compact encoding and the compression of the responses built at each request.
+
+Usage: python benchmarks/bench_wire_encoding.py [rows] [repeats]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import pandas as pd
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_FOLDER, ".."))
+sys.path.insert(0, BENCHMARKS_FOLDER)
+
+import data_process
+import web_app
+from generations import create_generation, publish_generation
+from snapshots import brotli, ENCODING_JSON, ENCODING_COMPACT
+from bench_aggregation import make_metrics, fill_window
+
+DEVICE_NAME = "bench_device"
+CODINGS = ("identity", "gzip", "br")
+
+
+def write_generation(base_folder, rows, start_time, end_time):
+    """Write the tables and snapshots of one device into a new published generation."""
+    window = fill_window(make_metrics(rows, start_time, int((end_time - start_time).total_seconds())), start_time, end_time)
+    data_process.OUTPUT_FOLDER_PATH = create_generation(base_folder, end_time)
+    data_process.save_metrics_to_csv(window, DEVICE_NAME, "aa:bb:cc:dd:ee:ff")
+    publish_generation(base_folder, data_process.OUTPUT_FOLDER_PATH, 1)
+
+
+def measure(client, method, params, coding, repeats):
+    """Return the size of the response body and the CPU time of a request in milliseconds."""
+    headers = {"Accept-Encoding": coding}
+    if method == "GET":
+        request = lambda: client.get("/data", query_string=params, headers=headers)
+    else:
+        request = lambda: client.post("/data", json=params, headers=headers)
+
+    response = request()
+    assert response.status_code == 200 and response.headers.get("Content-Encoding", "identity") == coding
+    start = time.process_time()
+    for _ in range(repeats):
+        request()
+    return len(response.data), (time.process_time() - start) / repeats * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    end_time = pd.Timestamp('2024-03-05 12:00:00')
+    start_time = end_time - pd.Timedelta(hours=2)
+    base_folder = tempfile.mkdtemp()
+    try:
+        write_generation(base_folder, rows, start_time.to_pydatetime(), end_time.to_pydatetime())
+        web_app.BASE_PATH = base_folder
+        client = web_app.app.test_client()
+
+        since = (end_time - pd.Timedelta(minutes=5)).strftime(data_process.TIME_FORMAT)
+        requests = (
+            ("full (snapshot)", "GET", {"device_name": DEVICE_NAME}),
+            ("since 5 min", "POST", {"device_name": DEVICE_NAME, "since": since, "generation": "older"}),
+            ("range 1h", "POST", {"device_name": DEVICE_NAME, "range": "1h"}),
+        )
+        codings = [coding for coding in CODINGS if coding != "br" or brotli is not None]
+        if brotli is None:
+            print("brotli is not installed, it is left out.")
+
+        print(f"{'request':<18}{'encoding':<10}{'coding':<10}{'bytes':>10}{'vs JSON':>10}{'CPU ms':>10}")
+        for label, method, params in requests:
+            baseline = None
+            for encoding in (ENCODING_JSON, ENCODING_COMPACT):
+                for coding in codings:
+                    size, cpu_ms = measure(client, method, dict(params, encoding=encoding), coding, repeats)
+                    baseline = baseline or size
+                    print(f"{label:<18}{encoding:<10}{coding:<10}{size:>10}{size / baseline:>10.2f}{cpu_ms:>10.3f}")
+    finally:
+        shutil.rmtree(base_folder)
+
+
+if __name__ == "__main__":
+    main()
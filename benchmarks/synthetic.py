@@ -0,0 +1,79 @@
+import os
+import random
+import struct
+from datetime import timedelta
+import pytz
+
+
+PCAP_GLOBAL_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)  # Ethernet link type
+PACKET_SIZES = [60, 74, 120, 342, 590, 1280, 1500]  # IP lengths (bytes)
+
+#------------------------------------------------------------------------------
+def make_ipv4_packet(source, destination, ip_length):
+    """Build an Ethernet frame carrying an IPv4/UDP packet of ip_length bytes."""
+    ethernet = b'\x02\x00\x00\x00\x00\x02' + b'\x02\x00\x00\x00\x00\x01' + b'\x08\x00'
+    ip_header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, ip_length, 0, 0, 64, 17, 0, source, destination)
+    return ethernet + ip_header + bytes(ip_length - 20)
+
+
+def write_pcap(pcap_file, start_time, duration, packets_per_second, destinations, seed = 0):
+    """Write a pcap file with packets_per_second packets for duration seconds from start_time (epoch).
+
+    Each packet goes to one of the given number of destinations and has one of PACKET_SIZES.
+    Returns the number of packets written.
+    """
+    rng = random.Random(seed)
+    source = bytes([192, 168, 1, 10])
+    addresses = [struct.pack('!I', 0x0A000000 + i + 1) for i in range(destinations)]
+
+    # Building every frame is the slow part, so the (destination, size) combinations are cached
+    frames = {}
+    packet_count = 0
+    with open(pcap_file, 'wb') as f:
+        f.write(PCAP_GLOBAL_HEADER)
+        for second in range(duration):
+            for i in range(packets_per_second):
+                key = (rng.randrange(destinations), rng.choice(PACKET_SIZES))
+                frame = frames.get(key)
+                if frame is None:
+                    frame = frames[key] = make_ipv4_packet(source, addresses[key[0]], key[1])
+                timestamp = start_time + second + i / packets_per_second
+                ts_sec = int(timestamp)
+                ts_usec = int(round((timestamp - ts_sec) * 1e6))
+                f.write(struct.pack('<IIII', ts_sec, ts_usec, len(frame), len(frame)))
+                f.write(frame)
+                packet_count += 1
+    return packet_count
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def write_device_folders(by_mac_folder, device_count, packets_per_second, destinations, end_time, hours, file_seconds = 3600):
+    """Write the pcap files of device_count devices in the by-mac layout read by data_process.
+
+    Each device gets by-mac/<mac>/name.txt and one pcap file per file_seconds in by-mac/<mac>/<year>/,
+    named <YYYY-MM-DD_HH.MM.SS>_<mac>.pcap after its start time (London time, like the capture), for
+    the hours before end_time (a naive London time). The files are the same for the same arguments.
+    Returns the number of packets written.
+    """
+    local_tz = pytz.timezone('Europe/London')
+    first_file_time = end_time.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+    packet_count = 0
+    for device in range(device_count):
+        mac_address = f"02:00:00:00:{device // 256:02x}:{device % 256:02x}"
+        device_folder = os.path.join(by_mac_folder, mac_address)
+        os.makedirs(device_folder, exist_ok=True)
+        with open(os.path.join(device_folder, "name.txt"), 'w') as name_file:
+            name_file.write(f"device{device}")
+
+        file_time = first_file_time
+        while file_time < end_time:
+            year_folder = os.path.join(device_folder, file_time.strftime('%Y'))
+            os.makedirs(year_folder, exist_ok=True)
+            pcap_file = os.path.join(year_folder, f"{file_time.strftime('%Y-%m-%d_%H.%M.%S')}_{mac_address.replace(':', '')}.pcap")
+            # The last file is still being captured: it stops at end_time
+            duration = min(file_seconds, int((end_time - file_time).total_seconds()))
+            start_time = local_tz.localize(file_time).timestamp()
+            packet_count += write_pcap(pcap_file, start_time, duration, packets_per_second, destinations, seed=device * 100003 + int(start_time))
+            file_time += timedelta(seconds=file_seconds)
+    return packet_count
+#------------------------------------------------------------------------------
@@ -0,0 +1,71 @@
+import os
+import pickle
+
+
+STATE_FILE_NAME = "state.pkl"  # index of the pcap files, rolling window and rollup store of the device
+
+#------------------------------------------------------------------------------
+def get_file_state(pcap_file):
+    """Return the size and modification time used to detect changed pcap files."""
+    stat = os.stat(pcap_file)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def is_unchanged(entry, state):
+    """True if the pcap file is exactly as it was when the checkpoint was written."""
+    return entry is not None and entry["size"] == state["size"] and entry["mtime"] == state["mtime"]
+
+
+def has_grown(entry, state):
+    """True if new packets were appended to the pcap file since the checkpoint was written."""
+    return entry is not None and state["size"] > entry["size"] and state["mtime"] >= entry["mtime"]
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def load_device_state(checkpoint_folder):
+    """Load the checkpoint of a device: the index of its pcap files, its rolling window and its rollup store.
+
+    Returns ({}, None, None) if there is no checkpoint or it cannot be read.
+    """
+    state_path = os.path.join(checkpoint_folder, STATE_FILE_NAME)
+    try:
+        if os.path.isfile(state_path):
+            with open(state_path, 'rb') as state_file:
+                state = pickle.load(state_file)
+            return state["index"], state["window"], state.get("rollups")
+    except Exception as e:
+        print(f"Error reading checkpoint {state_path}: {e}. Starting from scratch...")
+    return {}, None, None
+
+
+def save_device_state(checkpoint_folder, index, window, rollups):
+    """Write the index, the window and the rollups together and atomically, so they always match, even after a crash."""
+    if not os.path.exists(checkpoint_folder):
+        os.makedirs(checkpoint_folder)
+
+    state_path = os.path.join(checkpoint_folder, STATE_FILE_NAME)
+    temp_path = state_path + ".tmp"
+    with open(temp_path, 'wb') as state_file:
+        pickle.dump({"index": index, "window": window, "rollups": rollups}, state_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, state_path)
+
+
+def get_state_signature(checkpoint_folder):
+    """Identify the version of the saved checkpoint from the stat of its file, or None if there is none."""
+    try:
+        stat = os.stat(os.path.join(checkpoint_folder, STATE_FILE_NAME))
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def remove_stale_entries(index, files_to_keep, oldest_mtime):
+    """Drop the entries of the files that are no longer processed and were last written before oldest_mtime.
+
+    All the packets of such a file are older than the window. The entries of the other files are kept,
+    so the packets of a file that comes back into the processing window are not counted twice.
+    """
+    for pcap_file in list(index.keys()):
+        if pcap_file not in files_to_keep and index[pcap_file]["mtime"] < oldest_mtime:
+            del index[pcap_file]
+#------------------------------------------------------------------------------
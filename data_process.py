@@ -1,33 +1,107 @@
 import os
+import time
+import subprocess
 import pandas as pd
-from datetime import datetime
-from scapy.all import *
-from scapy.all import IP, Ether, rdpcap
-from scapy.layers.inet import TCP
-from collections import defaultdict
-import shutil
-import pytz
-from io import StringIO
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import socket
+import struct
+import sys
+import random
+import tempfile
+import hashlib
+import json
+import threading
+from pcap_reader import iter_ipv4_records
+from generations import create_generation, publish_generation, get_current_generation, link_generation_folder
+from file_watcher import create_watcher
+from aggregation import to_epoch_seconds
+from storage import write_table, link_table, FORMAT_CSV
+from rolling_window import RollingWindow
+from rollups import RollupStore
+from fleet_aggregate import FleetAggregate, summarize_device
+from pcap_catalog import PcapCatalog, CATALOG_FILE_NAME, to_wall_clock_seconds
+from snapshots import get_response_tables, table_to_columns, write_snapshots, rewrite_snapshot_generation, ENCODING_JSON, ENCODING_COMPACT
+from instrumentation import timed_stage, add_count, recording, reset_metrics, current_metrics, write_run_report
+from checkpoint import (get_file_state, is_unchanged, has_grown, load_device_state, save_device_state,
+                        get_state_signature, remove_stale_entries)
 
 
 BASE_FOLDER_PATH = "/mnt/disk1/traffic"
 BY_MAC_FOLDER_PATH= os.path.join(BASE_FOLDER_PATH, "by-mac")
 
 YUDI_FOLDER_PATH = "/home/yudi/iot_traffic_visualization/backend"
-DATA_FOR_VIZ_FOLDER_PATH = os.path.join(YUDI_FOLDER_PATH, "data_for_visualization")
 DATA_FINISHED_PRO_FOLDER_PATH = os.path.join(YUDI_FOLDER_PATH, "data_finished_processed")
+CHECKPOINT_FOLDER_PATH = os.path.join(YUDI_FOLDER_PATH, "checkpoints")
 
 DISPLAY_PERIOD = 2  # hours
+KEEP_GENERATIONS = 3  # published generations kept in DATA_FINISHED_PRO_FOLDER_PATH
+
+PCAP_READER = "native"  # "native" reads the pcap files directly, "tshark" extracts the packets with tshark
+TSHARK_TIMEOUT = 600  # seconds, a tshark call that takes longer is killed
+
+# Daemon mode (python data_process.py --daemon) checks the by-mac folder for changes every TICK_INTERVAL
+# seconds and publishes a new generation when a device changed or a minute was completed. A random
+# delay of up to TICK_JITTER seconds is added to each tick. When a run takes longer than a tick, the
+# ticks missed are skipped and the next ones are delayed by a backoff, up to MAX_BACKOFF seconds.
+TICK_INTERVAL = 5  # seconds
+TICK_JITTER = 1  # seconds
+MAX_BACKOFF = 60  # seconds
+
+PROCESS_WORKERS = 0  # 0 processes the devices one at a time, N > 0 processes them in N worker processes
+MAX_QUEUED_DEVICES_PER_WORKER = 2  # devices waiting for a worker, so the queue of devices stays bounded
+
+# The CSV files are always written. Add FORMAT_COLUMNAR (from storage) to also write a columnar copy of each table,
+# which web_app reads instead of the CSV file.
+STORAGE_FORMATS = (FORMAT_CSV,)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# The packets of a pcap file are read and folded into the partial aggregates in chunks of about
+# EXTRACT_CHUNK_MB, so the memory used by the extraction does not grow with the size of the file. The
+# number of packets of a chunk is derived from the peak memory used per packet (about 150 bytes measured
+# by benchmarks/bench_extraction_memory.py). This is not a ceiling: the partial aggregates of the
+# display period (a row per second, destination and packet size) and their merges come on top.
+EXTRACT_CHUNK_MB = 256
+EXTRACT_BYTES_PER_PACKET = 200
+
+# Digests of the rollup tables of a device, in its output folder
+ROLLUP_DIGESTS_FILE_NAME = "rollup_digests.json"
+
+# The full /data response of each device is written with its tables, web_app sends it as it is.
+# It is written in each of SNAPSHOT_ENCODINGS, with a copy compressed with each of SNAPSHOT_CODINGS
+# ("br" only if the brotli package is installed).
+SNAPSHOT_ENCODINGS = (ENCODING_JSON, ENCODING_COMPACT)
+SNAPSHOT_CODINGS = ("br", "gzip")
+
+# State kept between the runs of the daemon
+KEEP_WINDOWS_IN_MEMORY = False
+WINDOWS_IN_MEMORY = {}  # checkpoint folder -> (signature of the saved state, checkpoint index, window, rollups)
+DEVICE_NAMES = {}  # name.txt path -> (modification time, device name)
+DEVICE_SUMMARIES = {}  # device name -> (end of the window, fleet summary of the device) of the last run
+
+# Column types of the compacted metrics. Destinations are IPv4 addresses packed as unsigned 32-bit
+# integers; they are only converted back to text when destination_traffic_<device> is written.
+METRICS_DTYPES = {
+    'throughput': 'int64',  # bits
+    'packet_count': 'uint32',
+    'packet_size': 'uint16',  # bytes, ip.len is a 16-bit field
+    'destination': 'uint32'
+}
 
 #------------------------------------------------------------------------------
 def get_packet_count(pcap_file):
     """Get total packet count of pcap using tshark."""
     try:
         cmd = ['tshark', '-r', pcap_file, '-n', '-q', '-z', 'io,phs']
-        output = subprocess.check_output(cmd).decode('utf-8')
+        output = subprocess.check_output(cmd, timeout=TSHARK_TIMEOUT).decode('utf-8')
         for line in output.splitlines():
             if line.strip().startswith('eth'):
                 return int(line.split("frames:")[1].split()[0])
+    except subprocess.TimeoutExpired:
+        print(f"Error determining packet count: tshark took longer than {TSHARK_TIMEOUT} seconds")
+        return 0
     except subprocess.CalledProcessError as e:
         # Try to parse the number of frames from the error output
         for line in e.output.decode('utf-8').splitlines():
@@ -38,33 +112,87 @@ def get_packet_count(pcap_file):
 
 
 
-def tshark_extract(pcap_file, hours):
-    """Extract specific hours of data from pcap using tshark and return temp CSV file path."""
+def get_window_bounds_utc(hours):
+    """Return the start and end of the extraction window as UTC datetimes."""
+    # Converts CURRENT_TIME from the local time zone to UTC
+    # Define the end time as the last complete minute closest to CURRENT_TIME
+    end_time = CURRENT_TIME.replace(second=0, microsecond=0)
+    import pytz  # Imported when a window is first computed, not when data_process is imported
+    local_tz = pytz.timezone('Europe/London') # London time zone
+    localized_dt = local_tz.localize(end_time)
+    utc_dt = localized_dt.astimezone(pytz.utc)
+
+    return utc_dt - timedelta( hours = hours ), utc_dt
+
+
+
+@timed_stage("native_extract")
+def native_extract(pcap_file, hours, offset = 0, section = None):
+    """Extract specific hours of data from pcap with the built-in reader, in a single pass.
+
+    The packets after the byte offset are read in chunks and folded into the partial aggregates one
+    chunk at a time. section is the pcapng section state of the offset (see iter_ipv4_records).
+    Returns the compacted metrics, the offset to resume from and its section state, or
+    (None, offset, section) on error.
+    """
+    try:
+        print("Starting native extraction...")
+
+        # The end of the window is not filtered, for the same reason as in tshark_extract
+        start_time, _ = get_window_bounds_utc(hours)
+        partials = []
+        next_offset, next_section = offset, section
+        for timestamps, lengths, destinations, next_offset, next_section in iter_ipv4_records(pcap_file, start_time = start_time.timestamp(), offset = offset, chunk_records = get_chunk_rows(), section = section):
+            # Destinations stay packed as unsigned 32-bit integers, see encode_destinations
+            df = pd.DataFrame({
+                'frame.time_epoch': np.frombuffer(timestamps, dtype=np.float64),
+                'ip.len': np.frombuffer(lengths, dtype=np.uint32).astype(np.int64),
+                'ip.dst': np.frombuffer(destinations, dtype=np.uint32)
+            })
+            fold_packets(partials, df)
+
+        add_count("pcap_bytes_read", next_offset - offset)
+        print("Native extraction completed successfully.")
+        return merge_partials(partials), next_offset, next_section
+
+    except Exception as e:
+        print(f"Exception occurred: {e}")
+        return None, offset, section
+
+
+
+@timed_stage("tshark_extract")
+def tshark_extract(pcap_file, hours, first_frame = 0):
+    """Extract specific hours of data from pcap using tshark.
+
+    Only frames after first_frame are decoded. The output of tshark is read in chunks and folded into
+    the partial aggregates one chunk at a time. Returns the compacted metrics and the number of frames
+    read, or (None, first_frame) on error.
+    """
     try:
         print("Starting tshark extraction...")
 
         total_packets = get_packet_count(pcap_file)
         if total_packets is None or total_packets == 0:
             print("Error determining total packet count.")
-            return None
-        
-        # Converts CURRENT_TIME from the local time zone to UTC
-        # Define the end time as the last complete minute closest to CURRENT_TIME
-        end_time = CURRENT_TIME.replace(second=0, microsecond=0)
-        local_tz = pytz.timezone('Europe/London') # London time zone
-        localized_dt = local_tz.localize(end_time)
-        utc_dt = localized_dt.astimezone(pytz.utc)
-
+            return None, first_frame
 
+        # Nothing was appended since the last checkpoint
+        if total_packets <= first_frame:
+            print("No new packets since the last checkpoint.")
+            return empty_metrics(), first_frame
+        
         # Invoke tshark
-        end_time = utc_dt
-        start_time = end_time - timedelta( hours = hours )
+        start_time, end_time = get_window_bounds_utc(hours)
 
         # Start by processing all packets
         packet_limit = total_packets
         retries = 0  # Added a retry counter for better control
 
-        while packet_limit > 0 and retries < 10:
+        while packet_limit > first_frame and retries < 10:
+            # The end of the window is not filtered here: packets of the current minute are kept in the
+            # checkpoint so they are not lost once the frame counter has moved past them. They are
+            # truncated later by save_metrics_to_csv.
             cmd = [
                 'tshark', 
                 '-r', pcap_file, 
@@ -74,211 +202,462 @@ def tshark_extract(pcap_file, hours):
                 '-e', 'frame.time_epoch',  # timestamp
                 '-e', 'ip.len',  # IP packet length
                 '-e', 'ip.dst',  # destination IP address
-                '-Y', f'ip && frame.time >= "{start_time}" && frame.time <= "{end_time}"',  # IP filter and time filter combined
+                '-Y', f'ip && frame.number > {first_frame} && frame.time >= "{start_time}"',  # IP filter, new frames and time filter combined
                 '-c', str(packet_limit)
             ]
 
-            # Run tshark and get the output
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output, error = process.communicate()
+            # Run tshark and fold its output as it is produced
+            result = stream_tshark(cmd)
+            if result is None:
+                add_count("tshark_timeouts")
+                print(f"Error: tshark took longer than {TSHARK_TIMEOUT} seconds on {pcap_file}.")
+                return None, first_frame
+            metrics, rows, valid_rows, error, returncode = result
 
             # Check for truncated packet messages in the error output
-            if "packet size limited during capture" in error.decode('ISO-8859-1'):
+            if "packet size limited during capture" in error:
                 print("Warning: Detected truncated packets. Reducing packet limit for retry.")
                 packet_limit -= 1
                 retries += 1
+                add_count("tshark_retries")
                 continue
             
-            if process.returncode == 0:
+            if returncode == 0:
+                if rows > 0 and valid_rows == 0:
+                    print(f"Error: All data from {pcap_file} were invalid after cleaning.")
+                    return None, first_frame
                 print("Tshark extraction completed successfully.")
-                return output.decode('ISO-8859-1').strip().split('\n')
+                return metrics, packet_limit
             else:
                 # If tshark returns an error, reduce the number of packets and retry
                 packet_limit -= 1
                 retries += 1
+                add_count("tshark_retries")
         
         # If the retry limit is reached
         print("Failed to extract data even after reducing packet limit.")
-        return None
+        return None, first_frame
     
     except Exception as e:
         print(f"Exception occurred: {e}")
-        return None
+        return None, first_frame
+
+
+def stream_tshark(cmd):
+    """Run tshark and fold its CSV output into partial aggregates, one chunk of rows at a time.
+
+    stderr is written to a temporary file, so tshark never blocks on a full stderr pipe while stdout
+    is being read. Returns (metrics, rows, valid rows, stderr text, return code), or None if tshark
+    was killed after TSHARK_TIMEOUT seconds.
+    """
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=error_file)
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(TSHARK_TIMEOUT, kill_on_timeout)
+        timer.start()
+
+        partials = []
+        rows = valid_rows = 0
+        try:
+            # Rows with more fields than the header are skipped, rows with fewer fields are dropped when cleaned
+            reader = pd.read_csv(process.stdout, encoding='ISO-8859-1', header=0, sep=',', chunksize=get_chunk_rows(), on_bad_lines='skip')
+            for chunk in reader:
+                df = clean_tshark_rows(chunk)
+                rows += len(chunk)
+                valid_rows += len(df)
+                add_count("tshark_rows_dropped", len(chunk) - len(df))
+                fold_packets(partials, df)
+        except pd.errors.EmptyDataError:
+            pass  # tshark wrote nothing, not even the header
+        finally:
+            # Closing stdout also stops tshark if the output was not read to the end
+            timer.cancel()
+            process.stdout.close()
+            returncode = process.wait()
+
+        if timed_out.is_set():
+            return None
+
+        error_file.seek(0)
+        error = error_file.read().decode('ISO-8859-1')
 
+    return merge_partials(partials), rows, valid_rows, error, returncode
+
+
+def clean_tshark_rows(chunk):
+    """Keep the rows of the tshark output that have a time, a length and an IPv4 destination."""
+    df = pd.DataFrame({
+        'frame.time_epoch': pd.to_numeric(chunk['frame.time_epoch'], errors='coerce'),
+        'ip.len': pd.to_numeric(chunk['ip.len'], errors='coerce'),
+        'ip.dst': chunk['ip.dst']
+    }).dropna()
+
+    destinations, valid = encode_destinations(df['ip.dst'])
+    df = df[valid].assign(**{'ip.dst': destinations[valid]})
+    df['ip.len'] = df['ip.len'].astype(np.int64)
+    return df
+
+
+def get_chunk_rows():
+    """Number of packets read at a time, so the packets of a chunk take about EXTRACT_CHUNK_MB."""
+    return max(1, EXTRACT_CHUNK_MB * 1024 * 1024 // EXTRACT_BYTES_PER_PACKET)
     
 
 
-def extract_data_from_pcap(pcap_file, hours = DISPLAY_PERIOD):
-    try:
-        print("Extracting required data from pcap file...")
 
-        # tshark is used to extract the data for the specified number of hours and save it as CSV
-        extracted_data = tshark_extract(pcap_file, hours)
+@timed_stage("extract_data_from_pcap")
+def extract_data_from_pcap(pcap_file, hours = DISPLAY_PERIOD, position = 0, section = None):
+    """Extract the packets after position as partial aggregates.
 
-        # for line in extracted_data:
-        #      print(line)
+    position is a byte offset for the native reader and a frame number for tshark. section is the
+    pcapng section state at the offset for the native reader, and None otherwise. Returns the
+    compacted metrics, the position to resume from and its section state, or (None, position, section)
+    on error.
+    """
+    print("Extracting required data from pcap file...")
 
-        if not extracted_data:
+    if PCAP_READER == "native":
+        metrics, position_read, section_read = native_extract(pcap_file, hours, position, section)
+        if metrics is None:
+            print(f"Error extracting data from {pcap_file} using the native reader.")
+            return None, position, section
+    else:
+        metrics, position_read = tshark_extract(pcap_file, hours, position)
+        section_read = None
+        if metrics is None:
             print(f"Error extracting data from {pcap_file} using tshark.")
-            return None
-        
+            return None, position, section
 
+    print("Successfully extracted required data from pcap file.")
+    return metrics, position_read, section_read
 
-        # For rows with the wrong number of fields, filter them and print out the data in question
-        cleaned_data = []
-        for index, line in enumerate(extracted_data, start=1):  # Add start=1 to start counting at 1
-            fields = line.strip().split(',')
 
-            if len(fields) == 3:
-                cleaned_data.append(line)
-            # if len(fields) != 3:  # Expecting only 3 fields based on your description
-            #     print(f"Error in line {index}: Unexpected number of fields. Data: {line}")
-            # else:
-            #     cleaned_data.append(line)
+def fold_packets(partials, df):
+    """Compact a chunk of extracted packets and add it to the list of partial aggregates.
 
-        if not cleaned_data:
-            print(f"Error: All data from {pcap_file} were invalid after cleaning.")
-            return None
+    A second can be split between two chunks, so the partials are compacted together again, but only
+    once the newer ones hold as many rows as the first one. Each row is then compacted again a few
+    times at most, whatever the number of chunks.
+    """
+    if df.empty:
+        return
 
-        sio = StringIO("\n".join(cleaned_data))
+    add_count("packets_parsed", len(df))
+    add_count("bytes_parsed", df['ip.len'].sum())
+    partials.append(compact_metrics(packets_to_metrics(df)))
+    if sum(len(partial) for partial in partials[1:]) >= len(partials[0]):
+        partials[:] = [merge_partials(partials)]
 
-        df = pd.read_csv(sio, encoding='ISO-8859-1', header=0, sep=',')
-        
 
-        # A datetime object that converts a timestamp to UTC
-        df['frame.time_epoch'] = pd.to_datetime(df['frame.time_epoch'], unit='s', utc=True)
+def merge_partials(partials):
+    """Compact a list of partial aggregates into one."""
+    if not partials:
+        return empty_metrics()
+    if len(partials) == 1:
+        return partials[0]
+    return compact_metrics(pd.concat(partials))
 
-        # Convert time from UTC to local time (e.g. 'Europe/London')
-        df['frame.time_epoch'] = df['frame.time_epoch'].dt.tz_convert('Europe/London')
 
-        # Compute throughput
-        df['throughput'] = df['ip.len'] * 8 # bits
-        
-        # Packet count
-        df['packet_count'] = 1
-        
-        # Renaming columns
-        df.rename(columns={
-            'frame.time_epoch': 'time',
-            'ip.len': 'packet_size', # bytes
-            'ip.dst': 'destination'
-        }, inplace=True)
-
-        # Select and rearrange the desired columns
-        metrics = df[['time', 'throughput', 'packet_count', 'packet_size', 'destination']]
-        metrics.set_index('time', inplace=True)
-
-        print("Successfully extracted required data from pcap file.")
-        # print(metrics)
+def packets_to_metrics(df):
+    """Turn extracted packets (frame.time_epoch, ip.len, ip.dst) into one metrics row per packet."""
+    # A datetime object that converts a timestamp to UTC
+    df['frame.time_epoch'] = pd.to_datetime(df['frame.time_epoch'], unit='s', utc=True)
+
+    # Convert time from UTC to local time (e.g. 'Europe/London')
+    df['frame.time_epoch'] = df['frame.time_epoch'].dt.tz_convert('Europe/London')
+
+    # Compute throughput
+    df['throughput'] = df['ip.len'] * 8 # bits
+    
+    # Packet count
+    df['packet_count'] = 1
+    
+    # Renaming columns
+    df.rename(columns={
+        'frame.time_epoch': 'time',
+        'ip.len': 'packet_size', # bytes
+        'ip.dst': 'destination'
+    }, inplace=True)
+
+    # Select and rearrange the desired columns
+    metrics = df[['time', 'throughput', 'packet_count', 'packet_size', 'destination']]
+    return metrics.set_index('time')
+
+
+def encode_destinations(values):
+    """Pack IPv4 addresses given as text into unsigned 32-bit integers.
+
+    Each distinct address is converted once. Returns the packed addresses and a mask of the values
+    that are valid IPv4 addresses (the others are packed as 0).
+    """
+    codes, unique_text = pd.factorize(pd.Series(values).astype(str))
+    unique_packed = np.zeros(len(unique_text), dtype=np.uint32)
+    unique_valid = np.zeros(len(unique_text), dtype=bool)
+    for i, text in enumerate(unique_text):
+        try:
+            unique_packed[i] = struct.unpack('!I', socket.inet_aton(text))[0]
+            unique_valid[i] = text.count('.') == 3
+        except OSError:
+            pass
+    return unique_packed[codes], unique_valid[codes]
+
+
+def decode_destinations(values):
+    """Convert packed IPv4 addresses back to text, once per distinct address."""
+    codes, unique_packed = pd.factorize(np.asarray(values, dtype=np.uint32))
+    unique_text = np.array([socket.inet_ntoa(struct.pack('!I', int(d))) for d in unique_packed], dtype=object)
+    return unique_text[codes]
+
+
+def compact_metrics(metrics):
+    """Collapse packets into one row per second, destination and packet size.
+
+    Each row keeps the total bits and number of packets it stands for, so the rows of several
+    files or runs can simply be concatenated and aggregated again.
+    """
+    if metrics.empty:
         return metrics
 
-    except Exception as e:
-        print(f"Error: Failed to process file {pcap_file}. Reason: {e}")
-        return None
+    # Floor in UTC, so the ambiguous hour at the end of summer time does not raise
+    seconds = metrics.index.tz_convert('UTC').floor('s').tz_convert('Europe/London')
+    seconds.name = 'time'
+
+    compacted = metrics.groupby([seconds, 'destination', 'packet_size'], dropna=False).agg({
+        'throughput': 'sum',
+        'packet_count': 'sum'
+    }).reset_index()
+
+    compacted = compacted[['time', 'throughput', 'packet_count', 'packet_size', 'destination']]
+    compacted.set_index('time', inplace=True)
+    return compacted.astype(METRICS_DTYPES)
+
+
+def empty_metrics():
+    """An empty metrics DataFrame with the columns produced by extract_data_from_pcap."""
+    return pd.DataFrame({
+        column: pd.Series(dtype=dtype) for column, dtype in METRICS_DTYPES.items()
+    }, index=pd.DatetimeIndex([], tz='Europe/London', name='time'))
     
 #------------------------------------------------------------------------------
 
 
 #------------------------------------------------------------------------------
-def aggregate_all_metrics_for_device(device_folder_path):
-    """Scan all pcap files in the folder of a device and aggregate metrics."""
+@timed_stage("update_device_window")
+def update_device_window(device_folder_path):
+    """Add the new packets of the pcap files in the folder of a device to its rolling window.
+
+    The window and the position reached in each pcap file are checkpointed, so only new files and the
+    new packets of files that grew since the last run are decoded. The minutes that leave the window
+    are added to the rollup store of the device. Returns the window, moved to the display period of
+    this run, the rollup store, and whether the window changed: it was rebuilt, it moved, or packets
+    were added inside it. Packets after the end of the window are only kept aside.
+    """
     print(f"Starting aggregation for device folder: {device_folder_path}")
-    all_metrics = []
     pcap_files_to_process = get_files_to_process(device_folder_path)
 
     if not pcap_files_to_process:
         print(f"No pcap files found for processing in folder: {device_folder_path}")
 
+    checkpoint_folder = os.path.join(CHECKPOINT_FOLDER_PATH, os.path.basename(os.path.normpath(device_folder_path)))
+    checkpoint_index, window, rollups = load_window_state(checkpoint_folder)
+    loaded_window, loaded_revision = window, getattr(window, "revision", None)
+    if rollups is None or getattr(rollups, "version", None) != RollupStore.FORMAT_VERSION:
+        rollups = RollupStore()
+
+    # The minutes that leave the window are kept at coarser resolutions, even if the window is rebuilt
+    end_second = get_window_end_second()
+    if is_window_compatible(window, end_second):
+        roll_up_expired_minutes(window, rollups, end_second)
+
+    # The packets already in the window cannot be removed, so it is rebuilt from the pcap files when
+    # it is outdated, when the clock went back or when a file was rewritten instead of appended to
+    if not is_window_reusable(window, end_second, checkpoint_index, pcap_files_to_process):
+        print(f"Rebuilding the window of device folder: {device_folder_path}")
+        checkpoint_index = {}
+        window = RollingWindow(DISPLAY_PERIOD * 3600)
+    window.move_to(end_second)
+
     for pcap_file in pcap_files_to_process:
         print(f"Aggregating metrics for file: {pcap_file}")
-        metrics = load_metrics_from_pcap(pcap_file)
-        if metrics is not None:
-            all_metrics.append(metrics)
-
-    if all_metrics:
-        print(f"Successfully aggregated metrics for device folder: {device_folder_path}")
-        # print(all_metrics)
-        return pd.concat(all_metrics)
-    else:
-        print(f"No metrics found for device folder: {device_folder_path}")
-        return pd.DataFrame()  # Returns an empty DataFrame
+        add_new_packets(pcap_file, checkpoint_index, window)
+
+    # Files that left the window are no longer needed
+    try:
+        window_start_utc, _ = get_window_bounds_utc(DISPLAY_PERIOD)
+        remove_stale_entries(checkpoint_index, pcap_files_to_process, window_start_utc.timestamp())
+        save_window_state(checkpoint_folder, checkpoint_index, window, rollups)
+        record_processed_files(checkpoint_index)
+    except Exception as e:
+        print(f"Error saving checkpoint for device folder: {device_folder_path}, error: {e}")
+
+    print(f"Successfully aggregated metrics for device folder: {device_folder_path}")
+    return window, rollups, window is not loaded_window or window.revision != loaded_revision
+
 
+def roll_up_expired_minutes(window, rollups, end_second):
+    """Add the minutes that leave the window when it moves to end_second to the rollup store."""
+    new_start = end_second - window.seconds
+    if new_start > window.start:
+        rollups.add_minutes(*window.minute_totals(window.start, min(new_start, window.end)))
 
 
-def load_metrics_from_pcap(pcap_file):
-    """Load and compute metrics from the given pcap file."""
+
+def add_new_packets(pcap_file, checkpoint_index, window):
+    """Add the packets of the given pcap file that are not in the window yet."""
     try:
         print(f"Starting to calculate metrics: {pcap_file}")
-        metrics = extract_data_from_pcap(pcap_file)
-        if metrics is not None:
-            print(f"Successfully loaded metrics from pcap file: {pcap_file}")
-            return metrics
-        else:
-            return None
+        state = get_file_state(pcap_file)
+        entry = checkpoint_index.get(pcap_file)
+
+        # 1. The file did not change: its packets are already in the window
+        if is_unchanged(entry, state):
+            print(f"Using checkpoint for unchanged pcap file: {pcap_file}")
+            add_count("pcap_files_unchanged")
+            return
+
+        # A file rewritten since is_window_reusable checked it makes the next run rebuild the window
+        if entry is not None and not has_grown(entry, state):
+            print(f"Pcap file changed during the run, the window will be rebuilt: {pcap_file}")
+            return
+
+        # 2. The file grew: only decode the packets appended after the checkpoint
+        position = entry["position"] if entry is not None else 0
+        section = entry.get("section") if entry is not None else None
+
+        metrics, position_read, section_read = extract_data_from_pcap(pcap_file, position = position, section = section)
+        add_count("pcap_files_read")
+        if metrics is None:
+            return
+
+        if not metrics.empty:
+            window.add(
+                to_epoch_seconds(metrics.index.tz_localize(None)),
+                metrics['throughput'].to_numpy(),
+                metrics['packet_count'].to_numpy(),
+                metrics['packet_size'].to_numpy(),
+                metrics['destination'].to_numpy()
+            )
+
+        # 3. Record how far the file was read
+        checkpoint_index[pcap_file] = {
+            "size": state["size"],
+            "mtime": state["mtime"],
+            "reader": PCAP_READER,
+            "position": position_read,
+            "section": section_read
+        }
+
+        print(f"Successfully loaded metrics from pcap file: {pcap_file}")
     except Exception as e:
         print(f"Error during processing file: {pcap_file}, error: {e}")
-        return None
 
 
+def is_window_compatible(window, end_second):
+    """True if the saved window has the current format and length and can move to end_second."""
+    if window is None or getattr(window, "version", None) != RollingWindow.FORMAT_VERSION:
+        return False
+    return window.seconds == DISPLAY_PERIOD * 3600 and window.can_move_to(end_second)
+
 
+def is_window_reusable(window, end_second, checkpoint_index, pcap_files):
+    """True if the packets of the pcap files can be added to the saved window."""
+    if not is_window_compatible(window, end_second):
+        return False
+
+    for pcap_file in pcap_files:
+        entry = checkpoint_index.get(pcap_file)
+        if entry is None:
+            continue
+        if entry.get("reader") != PCAP_READER:
+            return False
+        try:
+            state = get_file_state(pcap_file)
+        except OSError:
+            continue
+        if not is_unchanged(entry, state) and not has_grown(entry, state):
+            return False
+    return True
+
+
+def get_window_end_second():
+    """The end of the display period (last complete minute) in wall-clock epoch seconds."""
+    end_time = CURRENT_TIME.replace(second=0, microsecond=0)
+    return int(to_epoch_seconds(pd.DatetimeIndex([end_time]))[0])
+
+
+def load_window_state(checkpoint_folder):
+    """Load the checkpoint index, window and rollup store of a device, from memory in daemon mode."""
+    cached = WINDOWS_IN_MEMORY.get(checkpoint_folder)
+    if cached is not None and cached[0] == get_state_signature(checkpoint_folder):
+        return cached[1:]
+    return load_device_state(checkpoint_folder)
+
+
+def save_window_state(checkpoint_folder, checkpoint_index, window, rollups):
+    """Save the checkpoint index, window and rollup store of a device, and keep them in memory in daemon mode."""
+    save_device_state(checkpoint_folder, checkpoint_index, window, rollups)
+    if KEEP_WINDOWS_IN_MEMORY:
+        WINDOWS_IN_MEMORY[checkpoint_folder] = (get_state_signature(checkpoint_folder), checkpoint_index, window, rollups)
+
+
+@timed_stage("get_files_to_process")
 def get_files_to_process(directory_path):
+    """Select the pcap files of a device that hold packets of the display period.
+
+    They are the files that start in the display period, and the last file that starts in the 24
+    hours before it (its packets may reach into the display period). The files are looked up in the
+    pcap catalog, which is refreshed first; only the directories that changed are listed again.
+    """
     print(f"Getting files to process from directory: {directory_path}")
-    pcap_files = []
+    device = os.path.basename(os.path.normpath(directory_path))
     try:
-        pcap_files = sorted([os.path.join(dp, f) for dp, dn, filenames in os.walk(directory_path) for f in filenames if f.endswith('.pcap')], reverse=True)
-        print(f"Found {len(pcap_files)} pcap files in directory: {directory_path}")
+        with open_pcap_catalog() as catalog:
+            catalog.refresh(device, directory_path)
+            file_count = catalog.count_files(device)
+            print(f"Found {file_count} pcap files in directory: {directory_path}")
+            if not file_count:
+                print(f"No pcap files found in directory: {directory_path}")
+                return []
+
+            current_time = to_wall_clock_seconds(CURRENT_TIME)
+            window_start = current_time - DISPLAY_PERIOD * 3600
+            files_to_return = catalog.files_between(device, window_start, current_time)
+            file_before_window = catalog.latest_file_between(device, window_start - 24 * 3600, window_start)
+            if file_before_window:
+                files_to_return.append(file_before_window)
     except Exception as e:
-        print(f"Error processing directory: {directory_path}, error: {e}")
-        return []
-    
-    if not pcap_files:
-        print(f"No pcap files found in directory: {directory_path}")
+        print(f"Error getting pcap files from directory: {directory_path}, error: {e}")
         return []
 
-    files_to_return = []
-    try:
-        # Filter out files for which get_file_time_from_name returns None
-        valid_files = [(f, get_file_time_from_name(f)) for f in pcap_files]
-        valid_files = [(f, t) for f, t in valid_files if t is not None and t <= CURRENT_TIME] # Ensure time is before CURRENT_TIME
-
-        two_hours_ago = CURRENT_TIME - timedelta( hours = DISPLAY_PERIOD )
-        files_within_2h = [f for f, t in valid_files if t > two_hours_ago]
-
-        if files_within_2h:
-            twenty_six_hours_ago = CURRENT_TIME - timedelta( hours = DISPLAY_PERIOD + 24 )
-            first_file_beyond_2h = next((f for f, t in valid_files if twenty_six_hours_ago <= t <= two_hours_ago), None)
-            if first_file_beyond_2h:
-                files_within_2h.append(first_file_beyond_2h)
-            files_to_return = files_within_2h
-        else:
-            twenty_six_hours_ago = CURRENT_TIME - timedelta( hours = DISPLAY_PERIOD + 24 )
-            most_recent_file_within_26h = next((f for f, t in valid_files if twenty_six_hours_ago <= t <= two_hours_ago), None)
-            if most_recent_file_within_26h:  # Check if a valid file was found
-                files_to_return.append(most_recent_file_within_26h)
-            print(f"Selected {len(files_to_return)} files for processing from directory: {directory_path}")
-    except Exception as e:
-        print(f"Error filtering pcap files from directory: {directory_path}, error: {e}")
-    
+    print(f"Selected {len(files_to_return)} files for processing from directory: {directory_path}")
     return files_to_return
 
 
-def get_file_time_from_name(file_path):
-    try:
-        file_name = os.path.basename(file_path)  # Extracting filenames
-        date_str, time_str = file_name.split('_')[:2]
-        datetime_str = f"{date_str}_{time_str}"
-        return datetime.strptime(datetime_str, "%Y-%m-%d_%H.%M.%S")
-    except Exception as e:
-        print(f"Error processing filename {file_name}. Reason: {e}. Skipping...")
-        return None
+def record_processed_files(checkpoint_index):
+    """Save the state of the files read by this run in the pcap catalog."""
+    with open_pcap_catalog() as catalog:
+        catalog.record_processed(checkpoint_index)
+
+
+def open_pcap_catalog():
+    return PcapCatalog(os.path.join(CHECKPOINT_FOLDER_PATH, CATALOG_FILE_NAME))
 #------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------
-def save_metrics_to_csv(metrics_df, device_name, mac_address):
-    """Resample and save aggregated metrics to CSV files."""
+@timed_stage("save_metrics_to_csv")
+def save_metrics_to_csv(window, device_name, mac_address):
+    """Save the metrics of the rolling window of a device (the display period) to CSV files.
+
+    Returns the metrics_per_min table, or None if there is no packet in the window.
+    """
     
     # Creating a device folder
-    output_folder = os.path.join(DATA_FOR_VIZ_FOLDER_PATH, device_name)
+    output_folder = os.path.join(OUTPUT_FOLDER_PATH, device_name)
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
@@ -286,284 +665,374 @@ def save_metrics_to_csv(metrics_df, device_name, mac_address):
     mac_address_file_path = os.path.join(output_folder, "mac_address.txt")
     with open(mac_address_file_path, 'w') as mac_file:
         mac_file.write(mac_address)
-    
-    # If the DataFrame is empty, an empty DataFrame is created
-    if metrics_df.empty:
-        return
-    
-    # Remove the timezone information for the metrics_df time
-    if 'time' in metrics_df.columns:
-        metrics_df['time'] = metrics_df['time'].dt.tz_localize(None)
-    else:
-        metrics_df.index = metrics_df.index.tz_localize(None)
-    
-    # Sort the data by time
-    metrics_df = metrics_df.sort_index()
 
-    # Define the end time as the last complete minute closest to CURRENT_TIME
-    end_time = CURRENT_TIME.replace(second=0, microsecond=0)
+    # All metrics are read from the ring buffers of the window, nothing is written without packets
+    aggregates = window.aggregate()
+    if aggregates is None:
+        save_snapshot(output_folder, device_name, {})
+        return None
 
-    # The start time is defined as a regression of n hours from the end time
-    start_time = end_time - pd.Timedelta( hours = DISPLAY_PERIOD )
+    throughput_per_second, metrics_per_min, dest_traffic_per_hour, packet_sizes_counts = build_device_tables(aggregates)
 
-    # Data taken from metrics_df in this period
-    truncated_df = metrics_df.truncate(before=start_time, after=end_time)
+    # Put the data into CSV
+    write_table(output_folder, f'throughput_per_second_{device_name}', throughput_per_second, STORAGE_FORMATS, date_format=TIME_FORMAT)
+    write_table(output_folder, f'metrics_per_min_{device_name}', metrics_per_min, STORAGE_FORMATS, date_format=TIME_FORMAT)
+    write_table(output_folder, f'destination_traffic_{device_name}', dest_traffic_per_hour, STORAGE_FORMATS)
+    write_table(output_folder, f'packet_sizes_count_{device_name}', packet_sizes_counts, STORAGE_FORMATS)
+
+    save_snapshot(output_folder, device_name, {
+        f'throughput_per_second_{device_name}': (throughput_per_second, TIME_FORMAT),
+        f'metrics_per_min_{device_name}': (metrics_per_min, TIME_FORMAT),
+        f'destination_traffic_{device_name}': (dest_traffic_per_hour, None),
+        f'packet_sizes_count_{device_name}': (packet_sizes_counts, None)
+    })
 
-    
-    if truncated_df.empty:
-        return
+    return metrics_per_min
 
 
-    # 1. bits per second over the last n hours
-    throughput_per_second = truncated_df.resample('1S').sum()['throughput'].reset_index()
-    throughput_per_second.columns = ['time', 'throughput_per_sec(bps)']
+@timed_stage("save_snapshot")
+def save_snapshot(output_folder, device_name, tables):
+    """Write the /data response of a device (or all_device) in this generation.
 
-    throughput_per_second = throughput_per_second.fillna(0)
+    tables maps the name of each table to (DataFrame, date format of its CSV file); the tables that
+    are not in it are sent empty, as web_app sends the tables that do not exist.
+    """
+    columns = {}
+    for key, table_name, rows in get_response_tables(device_name):
+        df, date_format = tables.get(table_name, (None, None))
+        columns[key] = table_to_columns(df, rows, date_format)
+    write_snapshots(output_folder, os.path.basename(OUTPUT_FOLDER_PATH), columns, SNAPSHOT_ENCODINGS, SNAPSHOT_CODINGS)
 
-    
 
+@timed_stage("save_rollup_tables")
+def save_rollup_tables(rollups, window, device_name):
+    """Save a table for each tier of the rollup store of a device.
 
+    Most runs only change the finest tier, so a table that did not change since the previous
+    generation is linked from it instead of being written again. The digest of each table is saved
+    in ROLLUP_DIGESTS_FILE_NAME to tell.
+    """
+    output_folder = os.path.join(OUTPUT_FOLDER_PATH, device_name)
+    previous_folder = os.path.join(PREVIOUS_GENERATION_PATH, device_name) if PREVIOUS_GENERATION_PATH else None
+    previous_digests = read_rollup_digests(previous_folder) if previous_folder else {}
 
-    # 2. Average throughput per minute (bps), peak traffic (bps), average packet size (bytes), number of packets, number of destinations over the last n hours
-    metrics_per_min = truncated_df.resample('1T').agg({
-        'packet_size': 'mean',
-        'packet_count': 'sum',
-        'destination': lambda x: x.nunique()
-    }).reset_index()
+    digests = {}
+    for tier_name, table in rollups.tables(window).items():
+        if table is None:
+            continue
+        table_name = f'rollup_{tier_name}_{device_name}'
+        digest = get_table_digest(table)
+        if previous_digests.get(table_name) != digest or not link_table(previous_folder, output_folder, table_name):
+            write_table(output_folder, table_name, table, STORAGE_FORMATS, date_format=TIME_FORMAT)
+        digests[table_name] = digest
 
-    # Calculate the average throughput and peak throughput per minute from the throughput per second calculated above
-    throughput_avg_per_min = throughput_per_second.resample('1T', on='time').mean()['throughput_per_sec(bps)'] # bps
-    throughput_peak_per_min = throughput_per_second.resample('1T', on='time').max()['throughput_per_sec(bps)'] # bps
+    with open(os.path.join(output_folder, ROLLUP_DIGESTS_FILE_NAME), 'w') as digests_file:
+        json.dump(digests, digests_file)
 
-    # Merge the new metric into metrics_per_min
-    metrics_per_min['avg_throughput_per_min(bps)'] = throughput_avg_per_min.values
-    metrics_per_min['peak_throughput_per_min(bps)'] = throughput_peak_per_min.values
 
-    metrics_per_min = metrics_per_min.rename(columns={
-    'packet_size': 'avg_packet_size_per_min(bytes)',
-    'packet_count': 'packet_count_per_min',
-    'destination': 'unique_destinations_count_per_min'
-    })
+def read_rollup_digests(folder):
+    try:
+        with open(os.path.join(folder, ROLLUP_DIGESTS_FILE_NAME), 'r') as digests_file:
+            return json.load(digests_file)
+    except (OSError, ValueError):
+        return {}
 
-    column_order = ['time', 'avg_throughput_per_min(bps)', 'peak_throughput_per_min(bps)','avg_packet_size_per_min(bytes)', 'packet_count_per_min', 'unique_destinations_count_per_min']
-    metrics_per_min = metrics_per_min[column_order]
 
-    metrics_per_min = metrics_per_min.fillna(0) # The missing value is set to 0
-    metrics_per_min = metrics_per_min.round(3) # All floating-point numbers keep three decimal places
+def get_table_digest(table):
+    """Digest of the content of a table and of the formats it is written in."""
+    digest = hashlib.sha1(repr(STORAGE_FORMATS).encode())
+    for column in table.columns:
+        digest.update(column.encode())
+        digest.update(np.ascontiguousarray(table[column].to_numpy()).tobytes())
+    return digest.hexdigest()
 
-    
 
+def build_device_tables(aggregates):
+    """Build the tables of a device from the aggregates of its window."""
 
-    # 4. Amount of data (bits) for each ip destination in the last n hours
-    dest_traffic_per_hour = truncated_df.groupby(by='destination').agg({
-        'throughput': 'sum'
-    }).reset_index().sort_values(by='throughput', ascending=False)
+    # 1. bits per second over the last n hours
+    throughput_per_second = pd.DataFrame({
+        'time': pd.to_datetime(aggregates['seconds'], unit='s'),
+        'throughput_per_sec(bps)': aggregates['bits_per_second']
+    })
 
-    dest_traffic_per_hour.columns = ['destination_ip', 'throughput_per_ip(bits)']
 
+    # 2. Average throughput per minute (bps), peak traffic (bps), average packet size (bytes), number of packets, number of destinations over the last n hours
+    metrics_per_min = pd.DataFrame({
+        'time': pd.to_datetime(aggregates['minutes'], unit='s'),
+        'avg_throughput_per_min(bps)': aggregates['avg_throughput_per_min'],
+        'peak_throughput_per_min(bps)': aggregates['peak_throughput_per_min'],
+        'avg_packet_size_per_min(bytes)': aggregates['avg_packet_size_per_min'],
+        'packet_count_per_min': aggregates['packet_count_per_min'],
+        'unique_destinations_count_per_min': aggregates['unique_destinations_per_min']
+    })
 
-    # 5. Log the size (bytes) of each packet for the past n hours
-    packet_sizes_counts = truncated_df['packet_size'].value_counts().reset_index()
+    metrics_per_min = metrics_per_min.fillna(0) # The missing value is set to 0
+    metrics_per_min = metrics_per_min.round(3) # All floating-point numbers keep three decimal places
 
-    packet_sizes_counts.columns = ['packet_size(bytes)', 'count']
 
-    # Sort by packet size
-    packet_sizes_counts = packet_sizes_counts.sort_values(by='packet_size(bytes)').reset_index(drop=True)
+    # 4. Amount of data (bits) for each ip destination in the last n hours
+    # The destinations are decoded to text here, and put in text order before sorting by traffic
+    destination_text = decode_destinations(aggregates['destinations'])
+    text_order = np.argsort(destination_text, kind='stable')
+    dest_traffic_per_hour = pd.DataFrame({
+        'destination_ip': destination_text[text_order],
+        'throughput_per_ip(bits)': aggregates['bits_per_destination'][text_order]
+    }).sort_values(by='throughput_per_ip(bits)', ascending=False)
+
+
+    # 5. Log the size (bytes) of each packet for the past n hours, sorted by packet size
+    packet_sizes_counts = pd.DataFrame({
+        'packet_size(bytes)': aggregates['packet_sizes'],
+        'count': aggregates['packets_per_size']
+    })
 
-    # Put the data into CSV
-    throughput_per_second.to_csv(os.path.join(output_folder, f'throughput_per_second_{device_name}.csv'), index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
-    metrics_per_min.to_csv(os.path.join(output_folder, f'metrics_per_min_{device_name}.csv'), index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
-    dest_traffic_per_hour.to_csv(os.path.join(output_folder, f'destination_traffic_{device_name}.csv'), index=False)
-    packet_sizes_counts.to_csv(os.path.join(output_folder, f'packet_sizes_count_{device_name}.csv'), index=False)
+    return throughput_per_second, metrics_per_min, dest_traffic_per_hour, packet_sizes_counts
 #------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------
-def process_all_devices_data():
-    all_devices_data_list = []
-    all_throughput_data_list = []
-
-    # 1. Read the CSV file for each device
-    for device_name in os.listdir(DATA_FOR_VIZ_FOLDER_PATH):
-        # If it's the all_device folder, skip it
-        if device_name == "all_device":
-            continue
+@timed_stage("process_all_devices_data")
+def process_all_devices_data(fleet):
+    """Write the tables of all the devices from the fleet aggregate filled as each device finished."""
+    all_device_folder = os.path.join(OUTPUT_FOLDER_PATH, "all_device")
+    if not os.path.exists(all_device_folder):
+        os.makedirs(all_device_folder)
 
-        device_folder = os.path.join(DATA_FOR_VIZ_FOLDER_PATH, device_name)
-        metrics_per_min_path = os.path.join(device_folder, f'metrics_per_min_{device_name}.csv')
-        throughput_per_second_path = os.path.join(device_folder, f'throughput_per_second_{device_name}.csv')
+    # If there's no device data, just create the all_device folder without producing any CSVs
+    if fleet.is_empty():
+        print("No device data found.")
+        save_snapshot(all_device_folder, "all_device", {})
+        return
 
-        # Check if CSV file exists in the device folder
-        if not os.path.exists(metrics_per_min_path) or not os.path.exists(throughput_per_second_path):
-            # print(f"Required CSVs not found for device {device_name}. Skipping...")
-            continue
+    tables = {}
 
-        try:
-            # metrics_df = pd.read_csv(metrics_per_min_path, parse_dates=['time'])
-            
-            # When reading the per-device CSV file, the peak_throughput column is simply discarded
-            metrics_df = pd.read_csv(metrics_per_min_path, parse_dates=['time']).drop(columns=['peak_throughput_per_min(bps)'], errors='ignore')
+    # 1. Average throughput, peak throughput, average packet size, packets and destinations of all devices per minute
+    try:
+        tables['all_device_aggregated_metrics_per_min'] = (fleet.metrics_per_min(), None)
+        write_table(all_device_folder, 'all_device_aggregated_metrics_per_min', tables['all_device_aggregated_metrics_per_min'][0], STORAGE_FORMATS)
+    except Exception as e:
+        print(f"Error during data aggregation: {e}")
 
-            throughput_df = pd.read_csv(throughput_per_second_path, parse_dates=['time'])
+    # 2. The traffic (bits) of each device in the display period
+    try:
+        tables['all_device_sorted_traffic_last_n_minutes'] = (fleet.sorted_traffic(), None)
+        write_table(all_device_folder, 'all_device_sorted_traffic_last_n_minutes', tables['all_device_sorted_traffic_last_n_minutes'][0], STORAGE_FORMATS)
+    except Exception as e:
+        print(f"Error during device traffic calculation: {e}")
 
-            if metrics_df.empty or throughput_df.empty:
-                print(f"CSVs for device {device_name} are empty. Skipping...")
-                continue
+    save_snapshot(all_device_folder, "all_device", tables)
 
-            # Add throughput data to the list
-            all_throughput_data_list.append(throughput_df)
 
-            metrics_df.set_index('time', inplace=True)
-            all_devices_data_list.append((device_name, metrics_df))
+def create_fleet_aggregate():
+    """Create an empty fleet aggregate over the display period of this run."""
+    end_second = get_window_end_second()
+    return FleetAggregate(end_second - DISPLAY_PERIOD * 3600, end_second)
 
-        except Exception as e:
-            print(f"Error reading CSV for device {device_name}: {e}")
-            continue
 
+def get_reused_device_summary(mac_address, device_name):
+    """Return the fleet summary of a device whose results are reused from the previous generation.
 
-    # If there's no device data, just create the all_device folder without producing any CSVs
-    if not all_devices_data_list:
-        print("No device data found.")
-        all_device_folder = os.path.join(DATA_FOR_VIZ_FOLDER_PATH, "all_device")
-        if not os.path.exists(all_device_folder):
-            os.makedirs(all_device_folder)
-        return
-    
-    # Save aggregated data
-    all_device_folder = os.path.join(DATA_FOR_VIZ_FOLDER_PATH, "all_device")
-    if not os.path.exists(all_device_folder):
-        os.makedirs(all_device_folder)
-        
+    The summary of the last run is kept in memory. Otherwise it is computed again from the window
+    of the device. Returns None if the device has no packets in the display period.
+    """
+    cached = DEVICE_SUMMARIES.get(device_name)
+    if cached is not None and cached[0] == get_window_end_second():
+        return cached[1]
 
+    _, window, _ = load_window_state(os.path.join(CHECKPOINT_FOLDER_PATH, mac_address))
+    if window is None or window.end != get_window_end_second():
+        return None
+    aggregates = window.aggregate()
+    if aggregates is None:
+        return None
+    _, metrics_per_min, _, _ = build_device_tables(aggregates)
+    return summarize_device(metrics_per_min, window)
+#------------------------------------------------------------------------------
 
-    # 2. Aggregate or accumulate data to generate summary metrics
-    try:
-        # Combine all throughput data
-        all_throughput_data = pd.concat(all_throughput_data_list)
-        all_throughput_data = all_throughput_data.sort_values(by='time')
-        all_throughput_data.set_index('time', inplace=True)
-        
-        peak_throughput_total = all_throughput_data.resample('1T').max()['throughput_per_sec(bps)']
-        peak_throughput_total.name = 'peak_throughput_all_devices(bps)'
+#------------------------------------------------------------------------------
+def get_devices_to_process():
+    """Return (mac_address, device_folder_path, device_name) for each device folder in the by-mac folder."""
+    devices = []
+    current_devices = set()  # Used to keep track of devices that have been encountered in the current run
 
-        aggregated_data = pd.concat([df.reset_index() for _, df in all_devices_data_list])
-        aggregated_data.sort_values(by='time', inplace=True)
-        
-        # print("step 1")
-        # print(aggregated_data.head())
-        # print(aggregated_data.info())
-
-        # Aggregation functions for each column
-        agg_functions = {
-            'avg_throughput_per_min(bps)': 'mean',
-            'avg_packet_size_per_min(bytes)': 'mean',
-            'packet_count_per_min': 'sum',
-            'unique_destinations_count_per_min': 'mean'
-        }
+    for mac_address in os.listdir(BY_MAC_FOLDER_PATH):
+        device_folder_path = os.path.join(BY_MAC_FOLDER_PATH, mac_address)
 
-        aggregated_data = aggregated_data.groupby('time').agg(agg_functions)
-        
-        # Make sure 'time' is a column, not an index
-        if 'time' not in aggregated_data.columns:
-            aggregated_data.reset_index(inplace=True)
-        
-        # Merge peak_throughput_total into aggregated_data
-        aggregated_data = pd.merge(aggregated_data, peak_throughput_total.reset_index(), on='time', how='left')
-        
+        # Read the device name from the name.txt file
+        device_name = read_device_name(os.path.join(device_folder_path, "name.txt"))
+        if not device_name:  # If there is no name.txt file or the device name is empty, skip this folder
+            continue
 
-        # Rename columns to match the expected output
-        aggregated_data.rename(columns={
-            'avg_throughput_per_min(bps)': 'avg_throughput_all_devices(bps)',
-            'avg_packet_size_per_min(bytes)': 'avg_packet_size_all_devices(bytes)',
-            'packet_count_per_min': 'packet_count_all_devices',
-            'unique_destinations_count_per_min': 'destinations_count_all_devices'
-        }, inplace=True)
-
-        aggregated_data = aggregated_data.fillna(0)
-
-        desired_order = [
-            'time', 
-            'avg_throughput_all_devices(bps)', 
-            'peak_throughput_all_devices(bps)',
-            'avg_packet_size_all_devices(bytes)', 
-            'packet_count_all_devices', 
-            'destinations_count_all_devices'
-        ]
-        aggregated_data = aggregated_data[desired_order] # Rearranging the sequence
+        # If the device name contains "phone" or has been encountered in this run, skip it
+        if "phone" in device_name.lower() or device_name in current_devices:
+            continue
 
-        
-        aggregated_data = aggregated_data.round(3) # All floating-point numbers keep three decimal places
+        current_devices.add(device_name)
+        devices.append((mac_address, device_folder_path, device_name))
 
-        aggregated_data.to_csv(os.path.join(all_device_folder, 'all_device_aggregated_metrics_per_min.csv'), index=False)
+    return devices
 
-    except Exception as e:
-        print(f"Error during data aggregation: {e}")
-    
 
-    # 3. The traffic (bits) of each device in t minutes
+def read_device_name(name_file_path):
+    """Read a name.txt file, only when it changed since it was last read. Returns None if it does not exist."""
     try:
-        
-        end_time = CURRENT_TIME.replace(second=0, microsecond=0)
-      
-        start_time = end_time - pd.Timedelta( hours = DISPLAY_PERIOD )
+        mtime = os.stat(name_file_path).st_mtime_ns
+    except OSError:
+        DEVICE_NAMES.pop(name_file_path, None)
+        return None
 
-        device_traffic_list = []
+    cached = DEVICE_NAMES.get(name_file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
 
-        for device_name, device_df in all_devices_data_list:  # Iterate over the tuple
-            
-            truncated_df = device_df.truncate(before=start_time, after=end_time)
-            
-            total_throughput = round((truncated_df['avg_throughput_per_min(bps)'] * 60).sum()) # bits
-            device_traffic_list.append((device_name, total_throughput))
+    with open(name_file_path, 'r') as name_file:
+        device_name = name_file.read().strip()
+    DEVICE_NAMES[name_file_path] = (mtime, device_name)
+    return device_name
 
-        # Sort from largest to smallest
-        sorted_device_traffic = sorted(device_traffic_list, key=lambda x: x[1], reverse=True)
 
-        sorted_traffic_df = pd.DataFrame(sorted_device_traffic, columns=['device_name', 'total_throughput'])
-        sorted_traffic_df.rename(columns={'total_throughput': 'total_throughput(bits)'}, inplace=True)  # rename columns
-        sorted_traffic_df.to_csv(os.path.join(all_device_folder, 'all_device_sorted_traffic_last_n_minutes.csv'), index=False)
-    except Exception as e:
-        print(f"Error during device traffic calculation: {e}")
-#------------------------------------------------------------------------------
+def process_device(mac_address, device_folder_path, device_name):
+    """Aggregate and save the metrics of one device.
 
-#------------------------------------------------------------------------------
-def copy_data_for_visualization_to_finished_process():
-    """ Copy everything from data_for_visualization into the data_finished_process folder."""
-    
-    # First, clear the data_finished_process folder
-    for item_name in os.listdir(DATA_FINISHED_PRO_FOLDER_PATH):
-        item_path = os.path.join(DATA_FINISHED_PRO_FOLDER_PATH, item_name)
-        
-        try:
-            # Delete based on whether it is a file or folder
-            if os.path.isfile(item_path):
-                os.remove(item_path)
-            elif os.path.isdir(item_path):
-                shutil.rmtree(item_path)
-        except Exception as e:
-            print(f"Error deleting {item_name}: {e}")
+    Returns (device_name, processing time, error, fleet summary of the device, stage metrics of the device).
+    """
+    start_time = time.time()
 
-    # Then copy the data from data_for_visualization
-    for item_name in os.listdir(DATA_FOR_VIZ_FOLDER_PATH):
-        source_path = os.path.join(DATA_FOR_VIZ_FOLDER_PATH, item_name)
-        destination_path = os.path.join(DATA_FINISHED_PRO_FOLDER_PATH, item_name)
-        
+    print(f"Processing device with MAC: {mac_address} and Name: {device_name}")
+    with recording() as device_metrics:
         try:
-            if os.path.isfile(source_path):
-                shutil.copy2(source_path, destination_path)
-            elif os.path.isdir(source_path):
-                shutil.copytree(source_path, destination_path)
+            with timed_stage("process_device"):
+                window, rollups, _ = update_device_window(device_folder_path)
+                metrics_per_min = save_metrics_to_csv(window, device_name, mac_address)
+                save_rollup_tables(rollups, window, device_name)
+                summary = summarize_device(metrics_per_min, window) if metrics_per_min is not None else None
+
+            end_time = time.time()
+            device_metrics.count("devices_processed")
+            return device_name, end_time - start_time, None, summary, device_metrics.snapshot()
+
         except Exception as e:
-            print(f"Error copying {item_name}: {e}")
+            print(f"Error processing device with MAC: {mac_address} and Name: {device_name}: {e}")
+            device_metrics.count("devices_failed")
+            return device_name, None, str(e), None, device_metrics.snapshot()
 
-    print("All data successfully copied to data_finished_process.")
 
+def process_devices_sequentially(devices, fleet):
+    """Process the devices one at a time, add them to the fleet aggregate and return their processing times."""
+    processing_times = {}  # It is used to record the processing time of each device
+    for device in devices:
+        collect_device_result(process_device(*device), processing_times, fleet)
+    return processing_times
+
+
+def init_worker(current_time, output_folder_path, previous_generation_path):
+    """Give each worker process the time, the output folder and the previous generation of the run."""
+    global CURRENT_TIME, OUTPUT_FOLDER_PATH, PREVIOUS_GENERATION_PATH
+    CURRENT_TIME = current_time
+    OUTPUT_FOLDER_PATH = output_folder_path
+    PREVIOUS_GENERATION_PATH = previous_generation_path
+
+
+def process_devices_in_parallel(devices, workers, fleet):
+    """Process the devices in a pool of worker processes, add them to the fleet aggregate and return their processing times.
+
+    At most workers * MAX_QUEUED_DEVICES_PER_WORKER devices are queued at once. An error only fails
+    its own device. If a worker process dies, the pool is restarted for the remaining devices and the
+    devices it was running are retried one at a time in their own process.
+    """
+    processing_times = {}
+    pending_devices = list(reversed(devices))
+    devices_to_retry = []
+    max_queued = workers * MAX_QUEUED_DEVICES_PER_WORKER
+
+    while pending_devices:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(CURRENT_TIME, OUTPUT_FOLDER_PATH, PREVIOUS_GENERATION_PATH))
+        running = {}
+        pool_broken = False
+        try:
+            while (pending_devices or running) and not pool_broken:
+                # Keep the queue of devices bounded
+                while pending_devices and len(running) < max_queued:
+                    device = pending_devices.pop()
+                    running[executor.submit(process_device, *device)] = device
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    device = running.pop(future)
+                    try:
+                        collect_device_result(future.result(), processing_times, fleet)
+                    except BrokenProcessPool:
+                        pool_broken = True
+                        devices_to_retry.append(device)
+
+            # We cannot tell which device killed the pool, so all of its devices are retried
+            devices_to_retry.extend(running.values())
+        finally:
+            executor.shutdown(wait=not pool_broken, cancel_futures=True)
+
+    for mac_address, device_folder_path, device_name in devices_to_retry:
+        print(f"Retrying device with MAC: {mac_address} and Name: {device_name} in its own process")
+        with ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(CURRENT_TIME, OUTPUT_FOLDER_PATH, PREVIOUS_GENERATION_PATH)) as executor:
+            try:
+                collect_device_result(executor.submit(process_device, mac_address, device_folder_path, device_name).result(), processing_times, fleet)
+            except BrokenProcessPool:
+                print(f"Worker process died while processing device with MAC: {mac_address} and Name: {device_name}")
+
+    return processing_times
+
+
+def collect_device_result(result, processing_times, fleet):
+    """Record the processing time returned by process_device and add the device to the fleet aggregate if it succeeded."""
+    device_name, processing_time, error, summary, device_metrics = result
+    current_metrics().add_device(device_name, device_metrics)
+    if error is None:
+        processing_times[device_name] = processing_time
+        DEVICE_SUMMARIES[device_name] = (get_window_end_second(), summary)
+        if summary is not None:
+            fleet.add_device(device_name, summary)
 #------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------
-def main():
+@timed_stage("reuse_unchanged_devices")
+def reuse_unchanged_devices(devices, changed_devices, previous_generation_path, fleet):
+    """Link the results of the unchanged devices from the previous generation into the new one.
+
+    The reused devices are added to the fleet aggregate. Returns the devices that still have to be
+    processed: the changed ones and those without results in the previous generation.
+    """
+    devices_to_process = []
+    for mac_address, device_folder_path, device_name in devices:
+        previous_folder = os.path.join(previous_generation_path, device_name)
+        if mac_address in changed_devices or not os.path.isdir(previous_folder):
+            devices_to_process.append((mac_address, device_folder_path, device_name))
+            continue
+        try:
+            summary = get_reused_device_summary(mac_address, device_name)
+            link_generation_folder(previous_folder, os.path.join(OUTPUT_FOLDER_PATH, device_name))
+            # The tables are the same, but the snapshot gives the generation it is served from
+            rewrite_snapshot_generation(os.path.join(OUTPUT_FOLDER_PATH, device_name), os.path.basename(OUTPUT_FOLDER_PATH), SNAPSHOT_ENCODINGS, SNAPSHOT_CODINGS)
+        except Exception as e:
+            print(f"Error reusing the results of device {device_name}: {e}")
+            devices_to_process.append((mac_address, device_folder_path, device_name))
+            continue
+        add_count("devices_reused")
+        if summary is not None:
+            fleet.add_device(device_name, summary)
+    return devices_to_process
+
+
+def main(changed_devices = None, current_time = None):
+    """Process the devices and publish the results as a new generation.
+
+    changed_devices is used by the daemon within a minute: only the device folders (MAC addresses) in
+    it are processed again, the results of the other devices are reused from the current generation.
+    current_time pins the time of the run (the benchmarks use it), it is the current time by default.
+    """
 
     global CURRENT_TIME  
-    CURRENT_TIME = datetime.now()  # Update the time each time main() is run
+    CURRENT_TIME = current_time or datetime.now()  # Update the time each time main() is run
+    run_metrics = reset_metrics()
+    run_start = time.perf_counter()
     
     # string_time = "2023-08-23 00:30:07.901887"
     # CURRENT_TIME = datetime.strptime(string_time, '%Y-%m-%d %H:%M:%S.%f')
@@ -571,52 +1040,25 @@ def main():
     print(f"current time = {CURRENT_TIME}")
     
 
-    # 1. Clear everything inside the DATA_FOR_VIZ_FOLDER_PATH
-    for root, dirs, files in os.walk(DATA_FOR_VIZ_FOLDER_PATH, topdown=False):
-        for name in files:
-            os.remove(os.path.join(root, name))
-        for name in dirs:
-            os.rmdir(os.path.join(root, name))
+    # 1. Write the results of this run into a new generation folder
+    global OUTPUT_FOLDER_PATH, PREVIOUS_GENERATION_PATH
+    previous_generation = get_current_generation(DATA_FINISHED_PRO_FOLDER_PATH)
+    PREVIOUS_GENERATION_PATH = os.path.join(DATA_FINISHED_PRO_FOLDER_PATH, previous_generation) if previous_generation is not None else None
+    OUTPUT_FOLDER_PATH = create_generation(DATA_FINISHED_PRO_FOLDER_PATH, CURRENT_TIME)
 
 
     print("Starting to scan files...")
 
-    processing_times = {}  # It is used to record the processing time of each device
-    current_devices = []  # Used to keep track of devices that have been encountered in the current run
-
-
     # 2. Iterate over each device folder in the by-mac folder
-    for mac_address in os.listdir(BY_MAC_FOLDER_PATH):
-        device_folder_path = os.path.join(BY_MAC_FOLDER_PATH, mac_address)
-
-        # Read the device name from the name.txt file
-        name_file_path = os.path.join(device_folder_path, "name.txt")
-        if os.path.exists(name_file_path):
-            with open(name_file_path, 'r') as name_file:
-                device_name = name_file.read().strip()
-                if not device_name:  # Check if the device name is empty
-                    continue
-        else:
-            continue  # If there is no name.txt file, skip this folder
-
-        # If the device name contains "phone" or has been encountered in this run, skip it
-        if "phone" in device_name.lower() or device_name in current_devices:
-            continue
-
-        start_time = time.time()
-
-        print(f"Processing device with MAC: {mac_address} and Name: {device_name}")
-        try:
-            all_metrics_df = aggregate_all_metrics_for_device(device_folder_path)
-            save_metrics_to_csv(all_metrics_df, device_name, mac_address)
-            current_devices.append(device_name)
-
-            end_time = time.time()
-            processing_time = end_time - start_time
-            processing_times[device_name] = processing_time
-
-        except Exception as e:
-            print(f"Error processing device with MAC: {mac_address} and Name: {device_name}: {e}")
+    # The metrics of all devices are summed as each device finishes
+    fleet = create_fleet_aggregate()
+    devices = get_devices_to_process()
+    if changed_devices is not None and previous_generation is not None:
+        devices = reuse_unchanged_devices(devices, changed_devices, PREVIOUS_GENERATION_PATH, fleet)
+    if PROCESS_WORKERS > 0:
+        processing_times = process_devices_in_parallel(devices, PROCESS_WORKERS, fleet)
+    else:
+        processing_times = process_devices_sequentially(devices, fleet)
 
     
     # After traversing the folders of all devices, the total data of all devices is calculated
@@ -624,7 +1066,7 @@ def main():
         print("Starting to calculating all devices data")
         start_time = time.time()
 
-        process_all_devices_data()
+        process_all_devices_data(fleet)
 
         end_time = time.time()
         processing_time = end_time - start_time
@@ -638,16 +1080,28 @@ def main():
     
 
     # Save df_processing_times to a CSV file
-    output_folder1 = os.path.join(DATA_FOR_VIZ_FOLDER_PATH, "all_device")
+    output_folder1 = os.path.join(OUTPUT_FOLDER_PATH, "all_device")
     if not os.path.exists(output_folder1):
         os.makedirs(output_folder1)
 
     output_path1 = os.path.join(output_folder1, "all_device_processing_times.csv")
     df_processing_times.to_csv(output_path1, index=False)
 
+    # Save the stage metrics of the run, web_app exposes them at /metrics
+    try:
+        write_run_report(output_folder1, run_metrics.report(
+            generation=os.path.basename(OUTPUT_FOLDER_PATH),
+            started=CURRENT_TIME.isoformat(),
+            finished_timestamp=time.time(),
+            wall_seconds=round(time.perf_counter() - run_start, 6)
+        ))
+    except Exception as e:
+        print(f"Error writing the run report: {e}")
+
 
-    # Copy everything from data_for_visualization into the data_finished_process folder
-    copy_data_for_visualization_to_finished_process()
+    # Publish the new generation, web_app switches to it on its next request
+    publish_generation(DATA_FINISHED_PRO_FOLDER_PATH, OUTPUT_FOLDER_PATH, KEEP_GENERATIONS)
+    print(f"Published generation {os.path.basename(OUTPUT_FOLDER_PATH)}.")
 
 
     global FINISHED_TIME
@@ -658,5 +1112,89 @@ def main():
     print(f"Program Started time is {CURRENT_TIME}. Finished time is {FINISHED_TIME}. The runtime of the program: {run_period}")
 
 
+def get_devices_to_publish(changed_devices):
+    """Add the new packets of the changed device folders (MAC addresses) to their windows, without publishing.
+
+    Within a minute, the packets of the current minute are after the end of the windows, so most
+    changes do not change any table: the packets are only decoded and checkpointed. Returns the
+    changed device folders whose tables do change: their window changed, they have no results in the
+    current generation (new or renamed devices), or they are no longer processed.
+    """
+    global CURRENT_TIME
+    CURRENT_TIME = datetime.now()
+
+    current_generation = get_current_generation(DATA_FINISHED_PRO_FOLDER_PATH)
+    if current_generation is None:
+        return set(changed_devices)
+    current_generation_path = os.path.join(DATA_FINISHED_PRO_FOLDER_PATH, current_generation)
+
+    devices = {mac_address: (device_folder_path, device_name)
+               for mac_address, device_folder_path, device_name in get_devices_to_process()}
+    devices_to_publish = set()
+    for mac_address in changed_devices:
+        if mac_address not in devices:
+            devices_to_publish.add(mac_address)
+            continue
+        device_folder_path, device_name = devices[mac_address]
+        try:
+            _, _, window_changed = update_device_window(device_folder_path)
+        except Exception as e:
+            print(f"Error updating the window of device with MAC: {mac_address} and Name: {device_name}: {e}")
+            window_changed = True
+        if window_changed or not os.path.isdir(os.path.join(current_generation_path, device_name)):
+            devices_to_publish.add(mac_address)
+    return devices_to_publish
+
+
+def run_daemon():
+    """Keep processing the devices, publishing a new generation when a minute was completed or the tables of a device changed.
+
+    The rolling windows of the devices and the device names stay in memory between runs.
+    """
+    global KEEP_WINDOWS_IN_MEMORY
+    KEEP_WINDOWS_IN_MEMORY = True
+
+    watcher = create_watcher(BY_MAC_FOLDER_PATH)
+    print(f"Daemon started, watching {BY_MAC_FOLDER_PATH} with {type(watcher).__name__}.")
+
+    last_minute = None
+    backoff = 0
+    try:
+        while True:
+            tick_start = time.monotonic()
+            try:
+                changed_devices = watcher.changed_devices()
+                minute = datetime.now().replace(second=0, microsecond=0)
+
+                # A completed minute moves the display period of every device
+                if minute != last_minute:
+                    main()
+                    last_minute = minute
+                elif changed_devices:
+                    print(f"Changed devices: {', '.join(sorted(changed_devices))}")
+                    devices_to_publish = get_devices_to_publish(changed_devices)
+                    if devices_to_publish:
+                        main(devices_to_publish)
+                    else:
+                        print("Only packets of the current minute were added, nothing to publish.")
+            except Exception as e:
+                print(f"Error during daemon tick: {e}")
+
+            # When a run takes longer than a tick, the ticks missed are skipped and the next ones back off
+            run_time = time.monotonic() - tick_start
+            if run_time > TICK_INTERVAL:
+                backoff = min(max(2 * backoff, TICK_INTERVAL), MAX_BACKOFF)
+                print(f"The run took {run_time:.1f} seconds, delaying the next tick by {backoff} seconds.")
+            else:
+                backoff = 0
+
+            time.sleep(TICK_INTERVAL - run_time % TICK_INTERVAL + backoff + random.uniform(0, TICK_JITTER))
+    finally:
+        watcher.close()
+
+
 if __name__ == "__main__":
-    main()
+    if "--daemon" in sys.argv[1:]:
+        run_daemon()
+    else:
+        main()
@@ -0,0 +1,87 @@
+# numpy is imported by the functions, so that web_app can import this module without loading it.
+
+# Methods that choose the rows of a time series kept for a chart
+METHOD_MINMAX = "minmax"  # The rows of the minimum and maximum of each bucket, so the peaks are always kept
+METHOD_LTTB = "lttb"  # Largest-Triangle-Three-Buckets, the row of each bucket that keeps the shape best
+METHODS = (METHOD_MINMAX, METHOD_LTTB)
+
+# Both methods keep the first and last rows, and min/max keeps two rows per bucket
+MIN_POINTS = 4
+
+#------------------------------------------------------------------------------
+def downsample_table(df, points, method = METHOD_MINMAX):
+    """Keep at most `points` rows of a time series table.
+
+    All the columns share the time axis, so the rows are chosen on one column (see get_key_column)
+    and kept whole. The rows of a series are evenly spaced, so the row number is the x axis.
+    """
+    import numpy as np
+
+    if len(df) <= points:
+        return df
+    column = get_key_column(df)
+    if column is None:
+        return df
+    values = np.nan_to_num(df[column].to_numpy(dtype=float))
+    indices = lttb_indices(values, points) if method == METHOD_LTTB else minmax_indices(values, points)
+    return df.iloc[indices]
+
+
+def get_key_column(df):
+    """The column the rows are chosen on: the peak throughput if the table has one, otherwise its first series."""
+    import numpy as np
+
+    series = [column for column in df.columns if column != 'time' and np.issubdtype(df[column].dtype, np.number)]
+    peaks = [column for column in series if column.startswith('peak_')]
+    return (peaks or series or [None])[0]
+
+
+def minmax_indices(values, points):
+    """The first and last rows, and the rows of the minimum and maximum of each of (points - 2) // 2 buckets."""
+    import numpy as np
+
+    count = len(values)
+    bucket_count = (points - 2) // 2
+    inner = values[1:-1]
+    starts = np.arange(bucket_count) * len(inner) // bucket_count
+    sizes = np.diff(np.r_[starts, len(inner)])
+
+    # The first row of each bucket equal to its minimum, and to its maximum
+    minimum_matches = np.flatnonzero(inner == np.repeat(np.minimum.reduceat(inner, starts), sizes))
+    maximum_matches = np.flatnonzero(inner == np.repeat(np.maximum.reduceat(inner, starts), sizes))
+    return np.unique(np.concatenate(([0, count - 1],
+                                     minimum_matches[np.searchsorted(minimum_matches, starts)] + 1,
+                                     maximum_matches[np.searchsorted(maximum_matches, starts)] + 1)))
+
+
+def lttb_indices(values, points):
+    """Largest-Triangle-Three-Buckets: the first and last rows, and one row in each of points - 2 buckets.
+
+    The row kept in a bucket makes the largest triangle with the row kept in the previous bucket and
+    the average of the next bucket. Each bucket depends on the previous one, so the buckets are
+    visited in order and the rows of a bucket are compared at once.
+    """
+    import numpy as np
+
+    count = len(values)
+    x = np.arange(count, dtype=float)
+    # Rows 1 to count - 2 split evenly, in integers so that no row is lost to rounding
+    edges = 1 + np.arange(points - 1) * (count - 2) // (points - 2)
+    edges = np.r_[edges, count]  # The next "bucket" of the last bucket is the last row
+
+    # Averages of the bucket after each bucket, computed at once
+    next_x = (edges[1:-1] + edges[2:] - 1) / 2
+    next_y = np.add.reduceat(values, edges[1:-1]) / np.diff(edges[1:])
+
+    indices = np.empty(points, dtype=np.int64)
+    indices[0], indices[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        previous_y = values[previous]
+        areas = np.abs((previous - next_x[bucket]) * (values[start:end] - previous_y)
+                       - (previous - x[start:end]) * (next_y[bucket] - previous_y))
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+    return indices
+#------------------------------------------------------------------------------
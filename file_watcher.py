@@ -0,0 +1,119 @@
+import os
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+# Files that change the results of a device
+WATCHED_EXTENSIONS = (".pcap",)
+WATCHED_FILE_NAMES = ("name.txt",)
+
+#------------------------------------------------------------------------------
+def create_watcher(root_folder):
+    """Watch the device folders of root_folder with inotify if it is available, otherwise by polling."""
+    if INotify is not None:
+        try:
+            return InotifyWatcher(root_folder)
+        except OSError as e:
+            print(f"Cannot watch {root_folder} with inotify ({e}), polling it instead.")
+    return PollingWatcher(root_folder)
+
+
+def is_watched_file(file_name):
+    return file_name.endswith(WATCHED_EXTENSIONS) or file_name in WATCHED_FILE_NAMES
+
+
+def get_device_folder_name(root_folder, path):
+    """Return the name of the device folder (first level under root_folder) that contains path."""
+    relative_path = os.path.relpath(path, root_folder)
+    return relative_path.split(os.sep)[0]
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+class PollingWatcher:
+    """Find the device folders whose pcap or name.txt files were created, changed or deleted.
+
+    Each call to changed_devices compares the size and modification time of the files with the
+    previous call.
+    """
+
+    def __init__(self, root_folder):
+        self.root_folder = root_folder
+        self.states = self.scan()
+
+    def scan(self):
+        states = {}
+        for folder_path, _, file_names in os.walk(self.root_folder):
+            for file_name in file_names:
+                if not is_watched_file(file_name):
+                    continue
+                path = os.path.join(folder_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                states[path] = (stat.st_size, stat.st_mtime_ns)
+        return states
+
+    def changed_devices(self):
+        """Return the names of the device folders that changed since the last call."""
+        states = self.scan()
+        changed_paths = {path for path, state in states.items() if self.states.get(path) != state}
+        changed_paths.update(path for path in self.states if path not in states)
+        self.states = states
+        return {get_device_folder_name(self.root_folder, path) for path in changed_paths}
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Same as PollingWatcher, from inotify events instead of scanning the folders."""
+
+    def __init__(self, root_folder):
+        self.root_folder = root_folder
+        self.inotify = INotify()
+        self.watch_flags = (flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO
+                            | flags.MOVED_FROM | flags.DELETE | flags.DELETE_SELF)
+        self.folders = {}  # watch descriptor -> folder path
+        self.add_watches(root_folder)
+
+    def add_watches(self, folder_path):
+        """Watch a folder and all its subfolders."""
+        for path, _, _ in os.walk(folder_path):
+            try:
+                self.folders[self.inotify.add_watch(path, self.watch_flags)] = path
+            except OSError as e:
+                print(f"Cannot watch folder {path}: {e}")
+
+    def changed_devices(self):
+        """Return the names of the device folders that changed since the last call."""
+        changed = set()
+        for event in self.inotify.read(timeout=0):
+            # Events were lost, so any device may have changed
+            if event.mask & flags.Q_OVERFLOW:
+                changed.update(name for name in os.listdir(self.root_folder) if os.path.isdir(os.path.join(self.root_folder, name)))
+                continue
+
+            folder_path = self.folders.get(event.wd)
+            if folder_path is None:
+                continue
+            if event.mask & flags.IGNORED:
+                del self.folders[event.wd]
+                continue
+
+            path = os.path.join(folder_path, event.name)
+            if event.mask & flags.ISDIR:
+                # New folders are watched too, a new device folder may already hold files
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self.add_watches(path)
+                changed.add(get_device_folder_name(self.root_folder, path))
+            elif is_watched_file(event.name) and folder_path != self.root_folder:
+                changed.add(get_device_folder_name(self.root_folder, path))
+        return changed
+
+    def close(self):
+        self.inotify.close()
+#------------------------------------------------------------------------------
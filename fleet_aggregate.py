@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from aggregation import to_epoch_seconds
+from hll import union_sketches
+
+
+#------------------------------------------------------------------------------
+def summarize_device(metrics_per_min, window):
+    """Keep the columns of metrics_per_min_<device> that the fleet tables use, as NumPy arrays.
+
+    The summary is small (one value and one destination sketch per minute of the display period), so
+    it can be returned by a worker process. The values are the rounded ones written to the CSV file of
+    the device, the sketches come from its rolling window.
+    """
+    minutes = to_epoch_seconds(pd.DatetimeIndex(metrics_per_min['time']))
+    return {
+        "minutes": minutes,
+        "avg_throughput": metrics_per_min['avg_throughput_per_min(bps)'].to_numpy(dtype=np.float64),
+        "peak_throughput": metrics_per_min['peak_throughput_per_min(bps)'].to_numpy(dtype=np.int64),
+        "avg_packet_size": metrics_per_min['avg_packet_size_per_min(bytes)'].to_numpy(dtype=np.float64),
+        "packet_count": metrics_per_min['packet_count_per_min'].to_numpy(dtype=np.int64),
+        "destination_sketches": window.destination_sketches(minutes)
+    }
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+class FleetAggregate:
+    """Metrics of all the devices, per minute of the display period, updated as each device finishes.
+
+    Each minute of [start, end) (wall-clock epoch seconds) has a slot. Adding a device sums its
+    averages and packet counts into the slots of its minutes, keeps the highest peak, merges the
+    sketches of the destinations and counts the devices of each minute, so the averages over the
+    devices that have the minute are known without reading the tables of the devices back. The
+    averages of the devices are rounded to thousandths, so they are summed exactly as integer
+    thousandths and the averages do not depend on the order the devices finish in. A destination is
+    counted once per minute, even when several devices send to it.
+    """
+
+    def __init__(self, start, end):
+        self.start = start
+        minute_count = (end - start) // 60
+
+        self.device_count = np.zeros(minute_count, dtype=np.int64)
+        self.avg_throughput = np.zeros(minute_count, dtype=np.int64)  # thousandths
+        self.peak_throughput = np.zeros(minute_count, dtype=np.int64)
+        self.avg_packet_size = np.zeros(minute_count, dtype=np.int64)  # thousandths
+        self.packet_count = np.zeros(minute_count, dtype=np.int64)
+        self.destination_sketches = [None] * minute_count
+        self.device_traffic = []  # (device name, bits over the display period)
+
+    def add_device(self, device_name, summary):
+        """Add the summary of a device, from summarize_device."""
+        slots = (summary["minutes"] - self.start) // 60
+        in_range = (slots >= 0) & (slots < len(self.device_count))
+        slots = slots[in_range]
+
+        self.device_count[slots] += 1
+        self.avg_throughput[slots] += _to_thousandths(summary["avg_throughput"][in_range])
+        self.peak_throughput[slots] = np.maximum(self.peak_throughput[slots], summary["peak_throughput"][in_range])
+        self.avg_packet_size[slots] += _to_thousandths(summary["avg_packet_size"][in_range])
+        self.packet_count[slots] += summary["packet_count"][in_range]
+        sketches = [sketch for sketch, keep in zip(summary["destination_sketches"], in_range) if keep]
+        for slot, sketch in zip(slots, sketches):
+            previous = self.destination_sketches[slot]
+            self.destination_sketches[slot] = sketch if previous is None else previous.union(sketch)
+
+        # Each minute of the average throughput carries 60 seconds of traffic
+        self.device_traffic.append((device_name, round(float((summary["avg_throughput"][in_range] * 60).sum()))))
+
+    def is_empty(self):
+        return not self.device_traffic
+
+    def metrics_per_min(self):
+        """The table all_device_aggregated_metrics_per_min, with a row for each minute that has a device."""
+        slots = np.flatnonzero(self.device_count)
+        device_count = self.device_count[slots]
+
+        aggregated_data = pd.DataFrame({
+            'time': pd.to_datetime(self.start + slots * 60, unit='s'),
+            'avg_throughput_all_devices(bps)': _mean_of_thousandths(self.avg_throughput[slots], device_count),
+            'peak_throughput_all_devices(bps)': self.peak_throughput[slots],
+            'avg_packet_size_all_devices(bytes)': _mean_of_thousandths(self.avg_packet_size[slots], device_count),
+            'packet_count_all_devices': self.packet_count[slots],
+            'destinations_count_all_devices': [self.destination_sketches[slot].count() for slot in slots]
+        })
+        return aggregated_data.round(3) # All floating-point numbers keep three decimal places
+
+    def count_destinations(self, first_minute, last_minute):
+        """Number of distinct destinations of all devices over the minutes [first_minute, last_minute]."""
+        first_slot = max((first_minute - self.start) // 60, 0)
+        last_slot = min((last_minute - self.start) // 60, len(self.device_count) - 1)
+        sketches = [sketch for sketch in self.destination_sketches[first_slot:last_slot + 1] if sketch is not None]
+        return union_sketches(sketches).count()
+
+    def sorted_traffic(self):
+        """The table all_device_sorted_traffic_last_n_minutes, from the largest to the smallest traffic."""
+        sorted_device_traffic = sorted(self.device_traffic, key=lambda x: (-x[1], x[0]))
+        return pd.DataFrame(sorted_device_traffic, columns=['device_name', 'total_throughput(bits)'])
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def _to_thousandths(values):
+    return np.rint(values * 1000).astype(np.int64)
+
+
+def _mean_of_thousandths(totals, counts):
+    return totals / 1000 / counts
+#------------------------------------------------------------------------------
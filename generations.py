@@ -0,0 +1,91 @@
+import os
+import shutil
+
+
+# Each run of data_process writes into a new generation directory and then publishes it by
+# replacing the pointer file. Readers resolve the pointer once and only see complete generations.
+GENERATION_PREFIX = "gen_"
+POINTER_FILE_NAME = "CURRENT"
+SYMLINK_NAME = "current"
+
+#------------------------------------------------------------------------------
+def create_generation(base_folder, current_time):
+    """Create and return an empty generation directory named after the time of the run."""
+    generation_name = GENERATION_PREFIX + current_time.strftime('%Y%m%d_%H%M%S_%f')
+    generation_path = os.path.join(base_folder, generation_name)
+    os.makedirs(generation_path)
+    return generation_path
+
+
+def publish_generation(base_folder, generation_path, keep):
+    """Make generation_path the current generation, then delete all but the newest `keep` generations."""
+    generation_name = os.path.basename(generation_path)
+
+    # os.replace is atomic, so readers see either the old or the new pointer
+    pointer_path = os.path.join(base_folder, POINTER_FILE_NAME)
+    temp_path = pointer_path + ".tmp"
+    with open(temp_path, 'w') as pointer_file:
+        pointer_file.write(generation_name)
+    os.replace(temp_path, pointer_path)
+
+    # The symlink is only a convenience for browsing the folder, it is not available everywhere
+    try:
+        symlink_path = os.path.join(base_folder, SYMLINK_NAME)
+        temp_symlink_path = symlink_path + ".tmp"
+        if os.path.lexists(temp_symlink_path):
+            os.remove(temp_symlink_path)
+        os.symlink(generation_name, temp_symlink_path)
+        os.replace(temp_symlink_path, symlink_path)
+    except (OSError, NotImplementedError):
+        pass
+
+    remove_old_generations(base_folder, generation_name, keep)
+
+
+def link_generation_folder(source_folder, target_folder):
+    """Copy a folder of a published generation into a new generation, with hard links when possible.
+
+    The files of a generation are never modified once it is published, so both generations can
+    share them.
+    """
+    try:
+        shutil.copytree(source_folder, target_folder, copy_function=os.link)
+    except OSError:
+        shutil.rmtree(target_folder, ignore_errors=True)
+        shutil.copytree(source_folder, target_folder)
+
+
+def remove_old_generations(base_folder, current_name, keep):
+    """Delete the generations older than the newest `keep`, never the current one."""
+    generations = sorted((name for name in os.listdir(base_folder)
+                          if name.startswith(GENERATION_PREFIX) and os.path.isdir(os.path.join(base_folder, name))),
+                         reverse=True)
+    for name in generations[keep:]:
+        if name == current_name:
+            continue
+        try:
+            shutil.rmtree(os.path.join(base_folder, name))
+        except Exception as e:
+            print(f"Error deleting generation {name}: {e}")
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def get_current_generation(base_folder):
+    """Return the name of the current generation, or None if nothing was published yet."""
+    try:
+        with open(os.path.join(base_folder, POINTER_FILE_NAME), 'r') as pointer_file:
+            return pointer_file.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve_generation(base_folder):
+    """Return the folder of the current generation.
+
+    Falls back to base_folder itself for data written before generations were introduced.
+    """
+    generation_name = get_current_generation(base_folder)
+    if generation_name is None:
+        return base_folder
+    return os.path.join(base_folder, generation_name)
+#------------------------------------------------------------------------------
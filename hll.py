@@ -0,0 +1,100 @@
+import numpy as np
+
+
+# 2^PRECISION HyperLogLog registers of one byte, standard error of about 1.04 / sqrt(2^PRECISION) (0.8%)
+PRECISION = 14
+REGISTER_COUNT = 1 << PRECISION
+# Sets up to EXACT_LIMIT values (32-bit) are kept exactly, they take no more memory than the registers
+EXACT_LIMIT = REGISTER_COUNT // 4
+
+#------------------------------------------------------------------------------
+class DistinctSketch:
+    """Number of distinct 32-bit values (packed IPv4 destinations) of a set, mergeable with other sets.
+
+    Small sets are kept exactly as sorted unique values, so their count is exact. When a set grows
+    beyond EXACT_LIMIT values, it is replaced by HyperLogLog registers and its count becomes an
+    estimate. A sketch never takes more than REGISTER_COUNT bytes, and the union of two sketches is
+    the sketch of the union of their sets.
+    """
+
+    __slots__ = ("values", "registers")
+
+    def __init__(self, values = None, registers = None):
+        self.values = values
+        self.registers = registers
+
+    @classmethod
+    def from_values(cls, values):
+        return _compact(np.unique(np.asarray(values, dtype=np.uint32)))
+
+    def is_exact(self):
+        return self.registers is None
+
+    def count(self):
+        """The number of distinct values, exact for small sets and estimated for the others."""
+        if self.is_exact():
+            return len(self.values)
+        return _estimate(self.registers)
+
+    def union(self, other):
+        return union_sketches([self, other])
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def union_sketches(sketches):
+    """The sketch of the union of the sets of the given sketches."""
+    exact_values = [sketch.values for sketch in sketches if sketch.is_exact()]
+    dense_registers = [sketch.registers for sketch in sketches if not sketch.is_exact()]
+
+    values = np.unique(np.concatenate(exact_values)) if exact_values else np.zeros(0, dtype=np.uint32)
+    if not dense_registers:
+        return _compact(values)
+
+    registers = np.maximum.reduce(dense_registers + [_registers_of(values)])
+    return DistinctSketch(registers=registers)
+
+
+def _compact(values):
+    """A sketch of sorted unique values, with registers instead if there are too many of them."""
+    if len(values) > EXACT_LIMIT:
+        return DistinctSketch(registers=_registers_of(values))
+    return DistinctSketch(values=values)
+
+
+def _hash(values):
+    """64-bit hashes of the values (SplitMix64 finalizer), NumPy integer arithmetic wraps around."""
+    hashes = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def _registers_of(values):
+    """HyperLogLog registers of the values: the highest rank of the hashes that fall in each register."""
+    registers = np.zeros(REGISTER_COUNT, dtype=np.uint8)
+    if not len(values):
+        return registers
+
+    hashes = _hash(values)
+    register_index = (hashes >> np.uint64(64 - PRECISION)).astype(np.intp)
+
+    # Rank: position of the first set bit of the remaining bits, they fit in a float64 exactly
+    remaining_bits = 64 - PRECISION
+    rest = (hashes & np.uint64((1 << remaining_bits) - 1)).astype(np.float64)
+    bit_length = np.frexp(rest)[1]
+    ranks = (remaining_bits - bit_length + 1).astype(np.uint8)
+
+    np.maximum.at(registers, register_index, ranks)
+    return registers
+
+
+def _estimate(registers):
+    """HyperLogLog estimate, with linear counting for small cardinalities."""
+    alpha = 0.7213 / (1 + 1.079 / REGISTER_COUNT)
+    estimate = alpha * REGISTER_COUNT ** 2 / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+
+    empty_registers = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * REGISTER_COUNT and empty_registers:
+        estimate = REGISTER_COUNT * np.log(REGISTER_COUNT / empty_registers)
+    return int(round(estimate))
+#------------------------------------------------------------------------------
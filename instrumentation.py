@@ -0,0 +1,188 @@
+import os
+import re
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows, the peak memory is then reported as 0
+
+
+REPORT_FILE_NAME = "run_report.json"
+METRIC_PREFIX = "iot_traffic_"
+
+#------------------------------------------------------------------------------
+class RunMetrics:
+    """Wall time, CPU time and number of calls of each stage of the pipeline, plus counters.
+
+    The CPU time of a stage includes the child processes (tshark) that finished during it. Stages can
+    be nested, so the time of a stage also counts in the stages around it. The metrics of each device
+    are recorded separately, in the worker process that processed it, and merged into the metrics of
+    the run with add_device.
+    """
+
+    def __init__(self):
+        self.stages = {}  # stage name -> [calls, wall seconds, CPU seconds]
+        self.counters = {}
+        self.peak_rss_bytes = 0
+        self.children_peak_rss_bytes = 0
+        self.devices = {}  # device name -> snapshot of the metrics of the device
+
+    def add_stage(self, name, wall_seconds, cpu_seconds, calls = 1):
+        totals = self.stages.setdefault(name, [0, 0.0, 0.0])
+        totals[0] += calls
+        totals[1] += wall_seconds
+        totals[2] += cpu_seconds
+
+    def count(self, name, value = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def snapshot(self):
+        """The metrics recorded so far, as a dictionary that can be returned by a worker process."""
+        peak_rss_bytes, children_peak_rss_bytes = get_peak_rss_bytes()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, peak_rss_bytes)
+        self.children_peak_rss_bytes = max(self.children_peak_rss_bytes, children_peak_rss_bytes)
+        return {
+            "stages": {name: {"calls": calls, "wall_seconds": round(wall, 6), "cpu_seconds": round(cpu, 6)}
+                       for name, (calls, wall, cpu) in self.stages.items()},
+            "counters": dict(self.counters),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "children_peak_rss_bytes": self.children_peak_rss_bytes
+        }
+
+    def add_device(self, device_name, snapshot):
+        """Merge the snapshot of the metrics of a device into the metrics of the run."""
+        self.devices[device_name] = snapshot
+        for name, stage in snapshot["stages"].items():
+            self.add_stage(name, stage["wall_seconds"], stage["cpu_seconds"], stage["calls"])
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, snapshot["peak_rss_bytes"])
+        self.children_peak_rss_bytes = max(self.children_peak_rss_bytes, snapshot["children_peak_rss_bytes"])
+
+    def report(self, **fields):
+        """The report of the run: the given fields, the merged metrics and the metrics of each device."""
+        return dict(fields, **self.snapshot(), devices=self.devices)
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# Metrics the stages and counters are recorded into, replaced by recording()
+_current = RunMetrics()
+
+
+def current_metrics():
+    return _current
+
+
+def reset_metrics():
+    """Start recording into new metrics, for a new run."""
+    global _current
+    _current = RunMetrics()
+    return _current
+
+
+@contextmanager
+def recording():
+    """Record into new metrics within the block, then go back to the previous ones."""
+    global _current
+    previous = _current
+    _current = RunMetrics()
+    try:
+        yield _current
+    finally:
+        _current = previous
+
+
+@contextmanager
+def timed_stage(name):
+    """Record the wall and CPU time of a block or, as a decorator, of each call of a function."""
+    metrics = _current
+    wall_start = time.perf_counter()
+    cpu_start = get_cpu_seconds()
+    try:
+        yield
+    finally:
+        metrics.add_stage(name, time.perf_counter() - wall_start, get_cpu_seconds() - cpu_start)
+
+
+def add_count(name, value = 1):
+    _current.count(name, value)
+
+
+def get_cpu_seconds():
+    """CPU time of this process and of its child processes that finished."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def get_peak_rss_bytes():
+    """Peak resident memory of this process and of its largest child process that finished."""
+    if resource is None:
+        return 0, 0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def write_run_report(folder, report):
+    with open(os.path.join(folder, REPORT_FILE_NAME), 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+
+
+def read_run_report(folder):
+    """Read the report of a run, or None if it does not exist or cannot be read."""
+    try:
+        with open(os.path.join(folder, REPORT_FILE_NAME), 'r') as report_file:
+            return json.load(report_file)
+    except (OSError, ValueError):
+        return None
+
+
+def format_prometheus(report):
+    """Format a run report in the Prometheus text exposition format.
+
+    All the values are those of the last run, so they are exposed as gauges.
+    """
+    lines = []
+
+    def add_metric(name, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+            lines.append(f"{METRIC_PREFIX}{name}{{{label_text}}} {value}" if label_text else f"{METRIC_PREFIX}{name} {value}")
+
+    add_metric("run_timestamp_seconds", "Time the last run finished.", [({}, report["finished_timestamp"])])
+    add_metric("run_wall_seconds", "Wall time of the last run.", [({}, report["wall_seconds"])])
+
+    stages = sorted(report["stages"].items())
+    add_metric("stage_calls", "Number of calls of each stage in the last run.", [({"stage": name}, stage["calls"]) for name, stage in stages])
+    add_metric("stage_wall_seconds", "Wall time of each stage in the last run.", [({"stage": name}, stage["wall_seconds"]) for name, stage in stages])
+    add_metric("stage_cpu_seconds", "CPU time of each stage in the last run, child processes included.", [({"stage": name}, stage["cpu_seconds"]) for name, stage in stages])
+
+    for name, value in sorted(report["counters"].items()):
+        add_metric(_metric_name(name), f"{name} in the last run.", [({}, value)])
+
+    add_metric("peak_rss_bytes", "Peak resident memory of the pipeline processes since they started, and of their largest finished child process.", [
+        ({"process": "pipeline"}, report["peak_rss_bytes"]),
+        ({"process": "children"}, report["children_peak_rss_bytes"])
+    ])
+    add_metric("device_wall_seconds", "Wall time spent on each device in the last run.", [
+        ({"device": device_name}, device["stages"].get("process_device", {}).get("wall_seconds", 0))
+        for device_name, device in sorted(report["devices"].items())
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+#------------------------------------------------------------------------------
@@ -0,0 +1,179 @@
+import os
+import time
+import sqlite3
+from datetime import datetime
+
+
+CATALOG_FILE_NAME = "pcap_catalog.sqlite"
+# Catalogs written with another version are started again
+FORMAT_VERSION = 1
+# A directory modified less than RACY_SECONDS before it was listed is listed again on the next refresh,
+# as a file created in the same clock tick would not change its modification time
+RACY_SECONDS = 2
+# Seconds a process waits for another one that is writing to the catalog
+LOCK_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    start_time REAL,
+    size INTEGER,
+    mtime REAL,
+    position INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_by_start_time ON files (device, start_time);
+CREATE INDEX IF NOT EXISTS directories_by_parent ON directories (parent);
+"""
+
+#------------------------------------------------------------------------------
+class PcapCatalog:
+    """Index of the pcap files of the devices, in an SQLite database.
+
+    Each file has its device, the start time parsed from its name (wall-clock epoch seconds), its size
+    and modification time, and the position reached by the last run that read it. The directories are
+    only listed again when their modification time changed, so a refresh costs one stat per directory
+    and the names of the files are parsed once. The files of a period are then found with a range
+    query on the start time.
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != FORMAT_VERSION:
+            with self.connection:
+                self.connection.executescript("DROP TABLE IF EXISTS directories; DROP TABLE IF EXISTS files;")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {FORMAT_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def refresh(self, device, device_folder_path):
+        """Bring the files of a device up to date with its folder. Returns the number of directories listed."""
+        listed = 0
+        with self.connection:
+            if not os.path.isdir(device_folder_path):
+                self.connection.execute("DELETE FROM files WHERE device = ?", (device,))
+                self.connection.execute("DELETE FROM directories WHERE device = ?", (device,))
+                return listed
+
+            folders = [device_folder_path]
+            while folders:
+                folder = folders.pop()
+                try:
+                    mtime_ns = os.stat(folder).st_mtime_ns
+                except OSError:
+                    self._remove_folder(folder)
+                    continue
+
+                row = self.connection.execute("SELECT mtime_ns FROM directories WHERE path = ?", (folder,)).fetchone()
+                if row is not None and row[0] == mtime_ns:
+                    subfolders = [path for path, in self.connection.execute("SELECT path FROM directories WHERE parent = ?", (folder,))]
+                else:
+                    subfolders = self._list_folder(device, folder, mtime_ns)
+                    listed += 1
+                folders.extend(subfolders)
+        return listed
+
+    def files_between(self, device, after, until):
+        """Paths of the files of a device that start in (after, until], in reverse path order."""
+        rows = self.connection.execute(
+            "SELECT path FROM files WHERE device = ? AND start_time > ? AND start_time <= ? ORDER BY path DESC",
+            (device, after, until))
+        return [path for path, in rows]
+
+    def latest_file_between(self, device, earliest, latest):
+        """Path of the last file of a device that starts in [earliest, latest], or None."""
+        row = self.connection.execute(
+            "SELECT path FROM files WHERE device = ? AND start_time >= ? AND start_time <= ? "
+            "ORDER BY start_time DESC, path DESC LIMIT 1",
+            (device, earliest, latest)).fetchone()
+        return row[0] if row is not None else None
+
+    def count_files(self, device):
+        return self.connection.execute("SELECT COUNT(*) FROM files WHERE device = ?", (device,)).fetchone()[0]
+
+    def record_processed(self, checkpoint_index):
+        """Save the size, modification time and position reached of the files of a checkpoint index."""
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE files SET size = ?, mtime = ?, position = ? WHERE path = ?",
+                [(entry["size"], entry["mtime"], entry["position"], pcap_file) for pcap_file, entry in checkpoint_index.items()])
+
+    def _list_folder(self, device, folder, mtime_ns):
+        """List a directory again: add its new pcap files, drop the ones removed. Returns its subdirectories."""
+        subfolders = []
+        names = set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir() and not entry.is_symlink():
+                    subfolders.append(entry.path)
+                elif entry.name.endswith('.pcap'):
+                    names.add(entry.path)
+
+        known = {path for path, in self.connection.execute("SELECT path FROM files WHERE directory = ?", (folder,))}
+        for path in known - names:
+            self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        for path in names - known:
+            file_time = get_file_time_from_name(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self.connection.execute(
+                "INSERT INTO files (path, device, directory, start_time, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, device, folder, to_wall_clock_seconds(file_time) if file_time is not None else None, stat.st_size, stat.st_mtime))
+
+        known_subfolders = {path for path, in self.connection.execute("SELECT path FROM directories WHERE parent = ?", (folder,))}
+        for path in known_subfolders - set(subfolders):
+            self._remove_folder(path)
+
+        # The directory is listed again next time if it may still change within the same clock tick
+        if time.time() - mtime_ns / 1e9 < RACY_SECONDS:
+            mtime_ns = -1
+        self.connection.execute(
+            "INSERT OR REPLACE INTO directories (path, device, parent, mtime_ns) VALUES (?, ?, ?, ?)",
+            (folder, device, os.path.dirname(folder), mtime_ns))
+        return subfolders
+
+    def _remove_folder(self, folder):
+        """Forget a directory that no longer exists, with its files and subdirectories."""
+        prefix = folder.rstrip(os.sep) + os.sep
+        self.connection.execute("DELETE FROM files WHERE directory = ? OR substr(directory, 1, ?) = ?", (folder, len(prefix), prefix))
+        self.connection.execute("DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?", (folder, len(prefix), prefix))
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def get_file_time_from_name(file_path):
+    try:
+        file_name = os.path.basename(file_path)  # Extracting filenames
+        date_str, time_str = file_name.split('_')[:2]
+        datetime_str = f"{date_str}_{time_str}"
+        return datetime.strptime(datetime_str, "%Y-%m-%d_%H.%M.%S")
+    except Exception as e:
+        print(f"Error processing filename {file_name}. Reason: {e}. Skipping...")
+        return None
+
+
+def to_wall_clock_seconds(local_time):
+    """Seconds since the epoch of a naive local time, read as if it were UTC like the other wall-clock times."""
+    return (local_time - datetime(1970, 1, 1)).total_seconds()
+#------------------------------------------------------------------------------
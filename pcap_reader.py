@@ -0,0 +1,250 @@
+import os
+import mmap
+import struct
+from array import array
+
+
+# Link layer types found in the captures (see https://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+PCAP_GLOBAL_HEADER_LENGTH = 24
+PCAP_RECORD_HEADER_LENGTH = 16
+
+PCAPNG_SECTION_HEADER_BLOCK = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION_BLOCK = 1
+PCAPNG_ENHANCED_PACKET_BLOCK = 6
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPTION_IF_TSRESOL = 9
+
+RELEASE_BYTES = 16 * 1024 * 1024  # the pages read are released from memory every RELEASE_BYTES
+
+U16_BE = struct.Struct('!H')
+IPV4_LENGTH_AND_DESTINATION = struct.Struct('!2xH12xI')
+
+
+class PcapFormatError(Exception):
+    """Raised when a file is neither a pcap nor a pcapng capture."""
+
+
+#------------------------------------------------------------------------------
+def iter_ipv4_records(pcap_file, start_time = None, end_time = None, offset = 0, chunk_records = None, section = None):
+    """Read the timestamp, IP length and destination of every IPv4 packet in a pcap or pcapng file.
+
+    Only the record headers and the first bytes of each packet are decoded. Records outside
+    [start_time, end_time] (epoch seconds, UTC) are skipped using their header alone. Reading starts
+    at the byte offset returned by a previous call, so a growing file can be read incrementally.
+
+    Yields (timestamps, lengths, destinations, next_offset, section) for chunks of at most
+    chunk_records packets (chunk_records = None reads a single chunk). timestamps is an array of epoch
+    seconds, lengths holds ip.len in bytes and destinations holds the IPv4 destinations as unsigned
+    32-bit integers. next_offset is the position right after the chunk. At least one chunk is yielded,
+    possibly empty, and the next_offset of the last chunk is the offset to resume from: the start of a
+    truncated trailing record if the capture is still being written.
+
+    section is None for a pcap file. For a pcapng file it is the state of the section at next_offset
+    (see _read_pcapng): passed back with the offset, the next call starts reading at the offset
+    instead of walking the blocks before it again.
+    """
+    file_size = os.path.getsize(pcap_file)
+    if file_size < 4:
+        yield array('d'), array('I'), array('I'), offset, section
+        return
+
+    with open(pcap_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] == b'\x0a\x0d\x0d\x0a':
+                yield from _read_pcapng(data, file_size, start_time, end_time, offset, chunk_records, section)
+            else:
+                yield from _read_pcap(data, file_size, start_time, end_time, offset, chunk_records)
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def _new_chunk():
+    return array('d'), array('I'), array('I')
+
+
+def _release_pages(data, start, end):
+    """Drop the mapped pages between start (page aligned) and end from the memory of the process.
+
+    The pages read stay mapped until the file is closed, so without this the resident memory of the
+    reader would grow with the size of the file. The data stays in the page cache. Returns the end of
+    the pages released.
+    """
+    end -= end % mmap.PAGESIZE
+    if end > start and hasattr(mmap, 'MADV_DONTNEED'):
+        data.madvise(mmap.MADV_DONTNEED, start, end - start)
+    return end
+
+
+def _read_pcap(data, file_size, start_time, end_time, offset, chunk_records):
+    """Walk the records of a classic pcap file."""
+    timestamps, lengths, destinations = _new_chunk()
+    if file_size < PCAP_GLOBAL_HEADER_LENGTH:
+        yield timestamps, lengths, destinations, offset, None
+        return
+
+    magic = data[:4]
+    if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+        endian = '<'
+    elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+        endian = '>'
+    else:
+        raise PcapFormatError(f"Unknown capture file magic: {magic.hex()}")
+    ts_unit = 1e-9 if magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d') else 1e-6
+
+    link_type = struct.unpack_from(endian + 'I', data, 20)[0] & 0x0FFFFFFF
+    record_header = struct.Struct(endian + 'IIII')
+
+    position = max(offset, PCAP_GLOBAL_HEADER_LENGTH)
+    released = 0
+    while position + PCAP_RECORD_HEADER_LENGTH <= file_size:
+        ts_sec, ts_frac, captured_length, _ = record_header.unpack_from(data, position)
+        packet_start = position + PCAP_RECORD_HEADER_LENGTH
+        packet_end = packet_start + captured_length
+
+        # The last record is still being written: stop here and resume from it next time
+        if packet_end > file_size:
+            break
+
+        timestamp = ts_sec + ts_frac * ts_unit
+        if (start_time is None or timestamp >= start_time) and (end_time is None or timestamp <= end_time):
+            _append_ipv4(data, link_type, packet_start, packet_end, timestamp, timestamps, lengths, destinations)
+
+        position = packet_end
+        if position - released >= RELEASE_BYTES:
+            released = _release_pages(data, released, position)
+
+        if chunk_records is not None and len(timestamps) >= chunk_records:
+            yield timestamps, lengths, destinations, position, None
+            timestamps, lengths, destinations = _new_chunk()
+
+    yield timestamps, lengths, destinations, position, None
+
+
+def _read_pcapng(data, file_size, start_time, end_time, offset, chunk_records, section):
+    """Walk the blocks of a pcapng file.
+
+    The packets of a block depend on the section header and interface description blocks before it,
+    so the state of the section is yielded with each offset: (start of the section, byte order,
+    interfaces). Given back with the offset, reading starts at the offset if the section still starts
+    there. Without it, the blocks before the offset are walked again to collect the interfaces.
+    """
+    timestamps, lengths, destinations = _new_chunk()
+    section_start = 0
+    interfaces = []  # (link_type, timestamp unit) per interface of the current section
+    endian = '<'
+
+    position = 0
+    if (section is not None and section[0] <= offset <= file_size
+            and data[section[0]:section[0] + 4] == b'\x0a\x0d\x0d\x0a'):
+        section_start, endian, interfaces = section[0], section[1], list(section[2])
+        position = offset
+    block_header = struct.Struct(endian + 'II')
+
+    released = position - position % mmap.PAGESIZE
+    while position + 12 <= file_size:
+        block_type = struct.unpack_from('<I', data, position)[0]
+
+        # A section header resets the byte order and the interfaces
+        if block_type == PCAPNG_SECTION_HEADER_BLOCK:
+            if position + 16 > file_size:
+                break
+            endian = '<' if struct.unpack_from('<I', data, position + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            block_header = struct.Struct(endian + 'II')
+            section_start = position
+            interfaces = []
+
+        block_type, block_length = block_header.unpack_from(data, position)
+        if block_length < 12 or position + block_length > file_size:
+            break  # truncated trailing block
+
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION_BLOCK:
+            link_type = struct.unpack_from(endian + 'H', data, position + 8)[0]
+            interfaces.append((link_type, _get_pcapng_ts_unit(data, endian, position + 16, position + block_length - 4)))
+
+        # Blocks before the resume offset are only walked to collect the interfaces
+        elif block_type == PCAPNG_ENHANCED_PACKET_BLOCK and position >= offset:
+            interface_id, ts_high, ts_low, captured_length = struct.unpack_from(endian + 'IIII', data, position + 8)
+            if interface_id < len(interfaces):
+                link_type, ts_unit = interfaces[interface_id]
+                timestamp = ((ts_high << 32) | ts_low) * ts_unit
+                if (start_time is None or timestamp >= start_time) and (end_time is None or timestamp <= end_time):
+                    packet_start = position + 28
+                    packet_end = min(packet_start + captured_length, position + block_length - 4)
+                    _append_ipv4(data, link_type, packet_start, packet_end, timestamp, timestamps, lengths, destinations)
+
+        position += block_length
+        if position - released >= RELEASE_BYTES:
+            released = _release_pages(data, released, position)
+
+        if chunk_records is not None and len(timestamps) >= chunk_records:
+            yield timestamps, lengths, destinations, max(position, offset), (section_start, endian, tuple(interfaces))
+            timestamps, lengths, destinations = _new_chunk()
+
+    yield timestamps, lengths, destinations, max(position, offset), (section_start, endian, tuple(interfaces))
+
+
+def _get_pcapng_ts_unit(data, endian, options_start, options_end):
+    """Read the if_tsresol option of an interface description block. The default is microseconds."""
+    position = options_start
+    while position + 4 <= options_end:
+        code, length = struct.unpack_from(endian + 'HH', data, position)
+        if code == 0:
+            break
+        if code == PCAPNG_OPTION_IF_TSRESOL and length >= 1:
+            resolution = data[position + 4]
+            if resolution & 0x80:
+                return 2.0 ** -(resolution & 0x7F)
+            return 10.0 ** -resolution
+        position += 4 + ((length + 3) & ~3)
+    return 1e-6
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def _append_ipv4(data, link_type, packet_start, packet_end, timestamp, timestamps, lengths, destinations):
+    """Find the IPv4 header behind the link layer header and keep its length and destination."""
+    if link_type == LINKTYPE_ETHERNET:
+        ip_start = packet_start + 14
+        if ip_start > packet_end:
+            return
+        ethertype = U16_BE.unpack_from(data, ip_start - 2)[0]
+        # Skip VLAN tags
+        while ethertype in ETHERTYPE_VLAN and ip_start + 4 <= packet_end:
+            ethertype = U16_BE.unpack_from(data, ip_start + 2)[0]
+            ip_start += 4
+        if ethertype != ETHERTYPE_IPV4:
+            return
+    elif link_type == LINKTYPE_LINUX_SLL:
+        ip_start = packet_start + 16
+        if ip_start > packet_end or U16_BE.unpack_from(data, packet_start + 14)[0] != ETHERTYPE_IPV4:
+            return
+    elif link_type == LINKTYPE_LINUX_SLL2:
+        ip_start = packet_start + 20
+        if ip_start > packet_end or U16_BE.unpack_from(data, packet_start)[0] != ETHERTYPE_IPV4:
+            return
+    elif link_type == LINKTYPE_NULL:
+        ip_start = packet_start + 4
+        if ip_start > packet_end:
+            return
+    elif link_type in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        ip_start = packet_start
+    else:
+        return
+
+    # The IPv4 header must be captured up to the destination address
+    if ip_start + 20 > packet_end or data[ip_start] >> 4 != 4:
+        return
+
+    ip_length, destination = IPV4_LENGTH_AND_DESTINATION.unpack_from(data, ip_start)
+    timestamps.append(timestamp)
+    lengths.append(ip_length)
+    destinations.append(destination)
+#------------------------------------------------------------------------------
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """An LRU cache of serialized payloads with a memory cap.
+
+    Each entry is stored with the signature of the file it was built from and is only returned
+    while the file still has that signature.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (signature, payload)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, signature):
+        """Return the cached payload, or None if it is missing or was built from an older file."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, signature, payload):
+        """Store a payload, evicting the least recently used entries to stay under the memory cap."""
+        if len(payload) > self.max_bytes:
+            return
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.size_bytes -= len(old_entry[1])
+
+            self.entries[key] = (signature, payload)
+            self.size_bytes += len(payload)
+
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_payload) = self.entries.popitem(last=False)
+                self.size_bytes -= len(evicted_payload)
+                self.evictions += 1
+
+    def stats(self):
+        """Return the hit/miss counters and the current size of the cache."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,222 @@
+import numpy as np
+from hll import DistinctSketch, union_sketches
+
+
+#------------------------------------------------------------------------------
+class RollingWindow:
+    """Traffic of one device over the last `seconds` seconds, in fixed-size ring buffers.
+
+    The window covers the seconds [end - seconds, end), where end is the start of a minute. Times are
+    wall-clock epoch seconds, so the bins match the local times written to the CSV files. The bits and
+    packets of each second are kept in ring buffers indexed by second % number of slots, and the
+    destinations and packet sizes of each minute in slots indexed by minute % number of slots. Moving
+    the window only clears the slots that expire and adding packets only touches their own slots.
+    Packets at or after end are kept aside until the window moves past them.
+    """
+
+    # Windows saved with another version are rebuilt from the pcap files
+    FORMAT_VERSION = 2
+
+    # Changes each time the content of the window changes: when it moves, or when packets are added
+    # inside it (not when they are kept aside). A class attribute, so windows saved before it start at 0.
+    revision = 0
+
+    def __init__(self, seconds):
+        if seconds % 60:
+            raise ValueError("The length of the window must be a whole number of minutes")
+
+        self.version = self.FORMAT_VERSION
+        self.seconds = seconds
+        self.end = None
+
+        # [end - seconds, end) holds seconds seconds and seconds / 60 minutes
+        self.second_slots = seconds
+        self.minute_slots = seconds // 60
+        self.bits = np.zeros(self.second_slots, dtype=np.int64)
+        self.packets = np.zeros(self.second_slots, dtype=np.int64)
+        self.minute_destinations = [_empty_counts(np.uint32) for _ in range(self.minute_slots)]  # (destinations, bits)
+        self.minute_sizes = [_empty_counts(np.uint16) for _ in range(self.minute_slots)]  # (packet sizes, packets)
+        self.pending = None  # rows at or after end: (times, bits, packets, sizes, destinations)
+
+    @property
+    def start(self):
+        return self.end - self.seconds
+
+    def can_move_to(self, end):
+        """False if end is before the current end: the expired seconds cannot be restored."""
+        return self.end is None or end >= self.end
+
+    def move_to(self, end):
+        """Move the end of the window forward to end, expiring the oldest seconds and minutes."""
+        if end % 60:
+            raise ValueError("The end of the window must be the start of a minute")
+        if not self.can_move_to(end):
+            raise ValueError("The window cannot move backwards")
+
+        if self.end is not None and end > self.end:
+            # The slots of the new seconds and minutes still hold expired ones
+            self._clear(self.bits, self.end, end)
+            self._clear(self.packets, self.end, end)
+            for minute in _slot_range(self.end // 60, end // 60, self.minute_slots):
+                self.minute_destinations[minute % self.minute_slots] = _empty_counts(np.uint32)
+                self.minute_sizes[minute % self.minute_slots] = _empty_counts(np.uint16)
+
+        if end != self.end:
+            self.revision += 1
+        self.end = end
+
+        # The packets the window has now reached are inserted
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            self.add(*pending)
+
+    def _clear(self, slots, first, last):
+        """Zero the slots of the seconds [first, last)."""
+        if last - first >= len(slots):
+            slots[:] = 0
+        else:
+            slots[np.arange(first, last) % len(slots)] = 0
+    #--------------------------------------------------------------------------
+
+    def add(self, times, bits, packets, sizes, destinations):
+        """Add compacted packet rows: wall-clock epoch seconds, bits, packets, packet size and destination.
+
+        Rows before the start of the window are dropped and rows at or after its end are kept until
+        the window moves past them.
+        """
+        if self.end is None:
+            raise ValueError("move_to must be called before adding packets")
+
+        times = np.asarray(times, dtype=np.int64)
+        columns = (times, np.asarray(bits, dtype=np.int64), np.asarray(packets, dtype=np.int64),
+                   np.asarray(sizes, dtype=np.uint16), np.asarray(destinations, dtype=np.uint32))
+
+        later = times >= self.end
+        if later.any():
+            later_rows = tuple(column[later] for column in columns)
+            if self.pending is not None:
+                later_rows = tuple(np.concatenate([old, new]) for old, new in zip(self.pending, later_rows))
+            self.pending = later_rows
+
+        in_window = (times >= self.start) & ~later
+        if in_window.any():
+            self._insert(*(column[in_window] for column in columns))
+
+    def _insert(self, times, bits, packets, sizes, destinations):
+        """Add rows that are inside the window to their second and minute slots."""
+        self.revision += 1
+        second_slots = times % self.second_slots
+        np.add.at(self.bits, second_slots, bits)
+        np.add.at(self.packets, second_slots, packets)
+
+        # Rows grouped by minute, each minute is merged into its slot
+        minutes = times // 60
+        order = np.argsort(minutes, kind='stable')
+        minutes = minutes[order]
+        group_starts = np.flatnonzero(np.diff(minutes, prepend=minutes[0] - 1))
+        group_ends = np.append(group_starts[1:], len(minutes))
+        for group_start, group_end in zip(group_starts, group_ends):
+            rows = order[group_start:group_end]
+            slot = minutes[group_start] % self.minute_slots
+            self.minute_destinations[slot] = _merge_counts(self.minute_destinations[slot], destinations[rows], bits[rows])
+            self.minute_sizes[slot] = _merge_counts(self.minute_sizes[slot], sizes[rows], packets[rows])
+    #--------------------------------------------------------------------------
+
+    def aggregate(self):
+        """Compute the metrics of the window.
+
+        The seconds and minutes go from the first to the last second that has packets. Returns None
+        if there is no packet in the window, otherwise a dict of NumPy arrays: seconds,
+        bits_per_second, minutes, avg_throughput_per_min, peak_throughput_per_min,
+        avg_packet_size_per_min, packet_count_per_min, unique_destinations_per_min, destinations,
+        bits_per_destination, packet_sizes and packets_per_size.
+        """
+        if self.end is None:
+            return None
+
+        window_packets = self.packets[np.arange(self.start, self.end) % self.second_slots]
+        seconds_with_packets = np.flatnonzero(window_packets)
+        if not len(seconds_with_packets):
+            return None
+
+        first_second = self.start + seconds_with_packets[0]
+        last_second = self.start + seconds_with_packets[-1]
+        seconds = np.arange(first_second, last_second + 1)
+        bits_per_second = self.bits[seconds % self.second_slots]
+        packets_per_second = self.packets[seconds % self.second_slots]
+
+        # Minutes from the first to the last second, each holds at least one second of the range
+        minute_of_second = seconds // 60
+        minute_starts = np.flatnonzero(np.diff(minute_of_second, prepend=minute_of_second[0] - 1))
+        seconds_per_minute = np.diff(np.append(minute_starts, len(seconds)))
+        bits_per_minute = np.add.reduceat(bits_per_second, minute_starts)
+        packet_count_per_min = np.add.reduceat(packets_per_second, minute_starts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_packet_size_per_min = np.where(packet_count_per_min > 0, bits_per_minute / 8 / packet_count_per_min, np.nan)
+
+        minutes = minute_of_second[minute_starts]
+        minute_slots = minutes % self.minute_slots
+        destinations, bits_per_destination = _sum_counts([self.minute_destinations[slot] for slot in minute_slots], np.uint32)
+        packet_sizes, packets_per_size = _sum_counts([self.minute_sizes[slot] for slot in minute_slots], np.uint16)
+
+        return {
+            "seconds": seconds,
+            "bits_per_second": bits_per_second,
+            "minutes": minutes * 60,
+            "avg_throughput_per_min": bits_per_minute / seconds_per_minute,
+            "peak_throughput_per_min": np.maximum.reduceat(bits_per_second, minute_starts),
+            "avg_packet_size_per_min": avg_packet_size_per_min,
+            "packet_count_per_min": packet_count_per_min,
+            "unique_destinations_per_min": np.array([len(self.minute_destinations[slot][0]) for slot in minute_slots], dtype=np.int64),
+            "destinations": destinations,
+            "bits_per_destination": bits_per_destination,
+            "packet_sizes": packet_sizes,
+            "packets_per_size": packets_per_size
+        }
+
+    def minute_totals(self, first, last):
+        """Totals of each minute of [first, last) (epoch seconds, inside the window).
+
+        Returns the start of each minute, its bits and packets, its highest bits in a second and a
+        DistinctSketch of its destinations.
+        """
+        minutes = np.arange(first // 60, last // 60) * 60
+        second_slots = (minutes[:, np.newaxis] + np.arange(60)) % self.second_slots
+        bits = self.bits[second_slots]
+        return minutes, bits.sum(axis=1), self.packets[second_slots].sum(axis=1), bits.max(axis=1, initial=0), self.destination_sketches(minutes)
+
+    def destination_sketches(self, minutes):
+        """A DistinctSketch of the destinations of each of the given minutes (epoch seconds of their start)."""
+        return [DistinctSketch.from_values(self.minute_destinations[(minute // 60) % self.minute_slots][0]) for minute in minutes]
+
+    def destination_sketch(self, first_minute, last_minute):
+        """A DistinctSketch of the destinations of the minutes [first_minute, last_minute] of the window."""
+        minutes = np.arange(max(first_minute, self.start) // 60, min(last_minute // 60 + 1, self.end // 60)) * 60
+        return union_sketches(self.destination_sketches(minutes))
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def _empty_counts(key_dtype):
+    return np.zeros(0, dtype=key_dtype), np.zeros(0, dtype=np.int64)
+
+
+def _slot_range(first, last, slot_count):
+    """The values of [first, last), or only the last slot_count of them, which cover every slot."""
+    return range(max(first, last - slot_count), last)
+
+
+def _merge_counts(counts, keys, values):
+    """Add values to sorted unique keys and their totals, returning the new (keys, totals)."""
+    all_keys, inverse = np.unique(np.concatenate([counts[0], keys]), return_inverse=True)
+    totals = np.zeros(len(all_keys), dtype=np.int64)
+    np.add.at(totals, inverse, np.concatenate([counts[1], values]))
+    return all_keys, totals
+
+
+def _sum_counts(counts_list, key_dtype):
+    """Sum several (keys, totals) pairs into one, with sorted unique keys."""
+    if not counts_list:
+        return _empty_counts(key_dtype)
+    return _merge_counts(_empty_counts(key_dtype), np.concatenate([keys for keys, _ in counts_list]),
+                         np.concatenate([totals for _, totals in counts_list]))
+#------------------------------------------------------------------------------
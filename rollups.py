@@ -0,0 +1,136 @@
+import numpy as np
+from hll import union_sketches
+
+
+# Tiers of the rollup store: (name, seconds per bucket, seconds kept). The seconds of the display
+# period are the finest tier, they are kept by the rolling window of each device.
+TIERS = (
+    ("1min", 60, 48 * 3600),
+    ("15min", 15 * 60, 30 * 24 * 3600),
+    ("1h", 3600, 365 * 24 * 3600),
+)
+
+#------------------------------------------------------------------------------
+class RollupStore:
+    """Traffic of one device over long periods, at the resolutions of TIERS.
+
+    The minutes that leave the rolling window are added to every tier, each tier sums them into its
+    own buckets. A tier is a ring buffer of buckets, so the memory of the store does not grow with
+    time. The data of the display period stays in the rolling window until it leaves it, and tables()
+    combines both.
+    """
+
+    # Stores saved with another version are started again
+    FORMAT_VERSION = 1
+
+    def __init__(self):
+        self.version = self.FORMAT_VERSION
+        self.tiers = [RollupTier(*tier) for tier in TIERS]
+        self.next_minute = None  # minutes before it were already added
+
+    def add_minutes(self, minutes, bits, packets, peaks, sketches):
+        """Add the totals of minutes that left the window, as returned by RollingWindow.minute_totals.
+
+        Minutes already added are skipped, so a window rebuilt after the clock went back does not
+        count them twice.
+        """
+        keep = packets > 0
+        if self.next_minute is not None:
+            keep &= minutes >= self.next_minute
+        if len(minutes):
+            self.next_minute = max(self.next_minute or 0, int(minutes.max()) + 60)
+        if not keep.any():
+            return
+
+        sketches = [sketch for sketch, kept in zip(sketches, keep) if kept]
+        for tier in self.tiers:
+            tier.add(minutes[keep], bits[keep], packets[keep], peaks[keep], sketches)
+
+    def tables(self, window):
+        """Return a table for each tier, with its complete buckets up to the end of the window.
+
+        The buckets that overlap the window also get the minutes still in the window. A table goes
+        from the first bucket with packets to the last complete one, and is None if there is none.
+        """
+        recent = window.minute_totals(window.start, window.end)
+        return {tier.name: tier.table(recent, window.end) for tier in self.tiers}
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+class RollupTier:
+    """Bits, packets, highest bits in a second and destinations per bucket, in a ring buffer of buckets."""
+
+    def __init__(self, name, bucket_seconds, retention):
+        self.name = name
+        self.bucket_seconds = bucket_seconds
+        self.slot_count = retention // bucket_seconds
+
+        # A slot holds the bucket in bucket_ids, the buckets that expired are overwritten
+        self.bucket_ids = np.full(self.slot_count, -1, dtype=np.int64)
+        self.bits = np.zeros(self.slot_count, dtype=np.int64)
+        self.packets = np.zeros(self.slot_count, dtype=np.int64)
+        self.peaks = np.zeros(self.slot_count, dtype=np.int64)
+        self.destination_counts = np.zeros(self.slot_count, dtype=np.int64)
+        self.sketches = [None] * self.slot_count
+
+    def add(self, minutes, bits, packets, peaks, sketches):
+        buckets = minutes // self.bucket_seconds
+        for bucket in np.unique(buckets):
+            rows = np.flatnonzero(buckets == bucket)
+            slot = bucket % self.slot_count
+            if self.bucket_ids[slot] != bucket:
+                self.bucket_ids[slot] = bucket
+                self.bits[slot] = self.packets[slot] = self.peaks[slot] = self.destination_counts[slot] = 0
+                self.sketches[slot] = None
+
+            self.bits[slot] += bits[rows].sum()
+            self.packets[slot] += packets[rows].sum()
+            self.peaks[slot] = max(self.peaks[slot], peaks[rows].max())
+            self.sketches[slot] = _union(self.sketches[slot], [sketches[row] for row in rows])
+            self.destination_counts[slot] = self.sketches[slot].count()
+
+    def table(self, recent, end):
+        """The buckets of the tier that are complete at end, with the recent minutes added."""
+        last_bucket = end // self.bucket_seconds - 1
+        buckets = np.arange(last_bucket - self.slot_count + 1, last_bucket + 1)
+        slots = buckets % self.slot_count
+        held = self.bucket_ids[slots] == buckets
+
+        bits = np.where(held, self.bits[slots], 0)
+        packets = np.where(held, self.packets[slots], 0)
+        peaks = np.where(held, self.peaks[slots], 0)
+        destination_counts = np.where(held, self.destination_counts[slots], 0)
+
+        # Minutes of the window, only those of complete buckets
+        minutes, minute_bits, minute_packets, minute_peaks, minute_sketches = recent
+        index = minutes // self.bucket_seconds - buckets[0]
+        valid = (index >= 0) & (index < len(buckets)) & (minute_packets > 0)
+        np.add.at(bits, index[valid], minute_bits[valid])
+        np.add.at(packets, index[valid], minute_packets[valid])
+        np.maximum.at(peaks, index[valid], minute_peaks[valid])
+        for i in np.unique(index[valid]):
+            tier_sketch = self.sketches[slots[i]] if held[i] else None
+            destination_counts[i] = _union(tier_sketch, [minute_sketches[row] for row in np.flatnonzero(valid & (index == i))]).count()
+
+        with_packets = np.flatnonzero(packets)
+        if not len(with_packets):
+            return None
+        rows = slice(with_packets[0], None)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_packet_size = np.where(packets[rows] > 0, bits[rows] / 8 / packets[rows], 0)
+        import pandas as pd  # web_app imports this module for TIERS only, without pandas
+        return pd.DataFrame({
+            'time': pd.to_datetime(buckets[rows] * self.bucket_seconds, unit='s'),
+            'avg_throughput(bps)': bits[rows] / self.bucket_seconds,
+            'peak_throughput(bps)': peaks[rows],
+            'avg_packet_size(bytes)': avg_packet_size,
+            'packet_count': packets[rows],
+            'unique_destinations_count': destination_counts[rows]
+        }).round(3) # All floating-point numbers keep three decimal places
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def _union(sketch, sketches):
+    return union_sketches(sketches if sketch is None else [sketch] + sketches)
+#------------------------------------------------------------------------------
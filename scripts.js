@@ -3,6 +3,15 @@ let currentDeviceSelection;
 // Data request currently in progress
 let ongoingFetchRequest = null;
 
+// Device, generation and raw times of the data currently plotted, used to request only the new rows
+let plottedDevice = null;
+let plottedGeneration = null;
+let plottedTimes = {};
+
+// Server-sent events stream of the plotted device. While it is open, the periodic data fetch is skipped
+let updateStream = null;
+let updateStreamDevice = null;
+
 // When the document is loaded, initialize the device list, start the data fetch schedule, and the device update schedule
 document.addEventListener("DOMContentLoaded", function() {
     populateDevices();
@@ -104,45 +113,76 @@ function destroyExistingCharts() {
     if (packetSizeChartInstance) packetSizeChartInstance.destroy();
 }
 
+// Returns the oldest of the last plotted times of the time series, or null if nothing is plotted
+function getSinceTime() {
+    const lastTimes = Object.values(plottedTimes).map(times => times[times.length - 1]);
+    if (lastTimes.length === 0 || lastTimes.some(time => time === undefined)) {
+        return null;
+    }
+    return lastTimes.reduce((oldest, time) => (time < oldest ? time : oldest));
+}
+
 // Gets the data of the selected device and plots it
-function fetchAndPlotData() {
+// If incremental is true and the charts of the device are already plotted, only the new rows are requested
+function fetchAndPlotData(incremental = false) {
     // If there is a request in progress, it is interrupted
     if (ongoingFetchRequest) {
         ongoingFetchRequest.abort();
     }
 
-    // Destroy existing charts
-    destroyExistingCharts();
     // Saves the current device selection state
     saveCurrentState();
 
     // Gets the name of the currently selected device
     const deviceName = document.getElementById('deviceSelector').value;
 
+    // The time columns are sent as delta-encoded epoch seconds, decodeCompactData rebuilds them
+    const requestBody = { device_name: deviceName, encoding: 'compact' };
+    const since = getSinceTime();
+    if (incremental && deviceName === plottedDevice && since !== null) {
+        requestBody.since = since;
+        requestBody.generation = plottedGeneration;
+    } else {
+        // Destroy existing charts
+        destroyExistingCharts();
+        plottedDevice = null;
+    }
+
     // Create an instance of AbortController so that you can abort requests
     const controller = new AbortController();
     ongoingFetchRequest = controller;
 
     // Request the backend to fetch data for the selected device
-    fetch('/data', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({ device_name: deviceName }),
-        signal: controller.signal
-    })    
+    // The full data is requested with a GET, so the browser can revalidate its cached copy with the ETag
+    const request = requestBody.since === undefined
+        ? fetch('/data?' + new URLSearchParams(requestBody), { signal: controller.signal })
+        : fetch('/data', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(requestBody),
+            signal: controller.signal
+        });
+    request
     .then(response => {
         if (!response.ok) {
             throw new Error("Failed to fetch data");
         }
         return response.json();
     })
+    .then(decodeCompactData)
     .then(data => { 
         console.log(data); 
         return data; 
     })
     .then(data => {
+        // Only the new rows were returned: add them to the existing charts
+        if (data.full === false) {
+            updateCharts(data);
+            return;
+        }
+
         // If the data is valid, the graph is plotted, otherwise the message is displayed
         let hasMetrics = data.all_device_metrics && Object.keys(data.all_device_metrics).length;
         let hasThroughput = data.throughput_per_device && Object.keys(data.throughput_per_device).length;
@@ -151,6 +191,7 @@ function fetchAndPlotData() {
 
         if (hasMetrics || hasThroughput || hasMetricsPerDevice || hasTraffic) {
             plotData(data);
+            rememberPlottedData(deviceName, data);
         } else {
             displayMessage("No data available for the selected device.");
         } 
@@ -173,6 +214,35 @@ function fetchAndPlotData() {
 
 
 
+// Rebuilds the time columns of a response in the compact encoding, so it reads like a JSON response
+function decodeCompactData(data) {
+    if (data.encoding !== 'compact') {
+        return data;
+    }
+    Object.values(data).forEach(table => {
+        if (table && typeof table === 'object' && table.time && !Array.isArray(table.time)) {
+            table.time = decodeTimes(table.time);
+        }
+    });
+    return data;
+}
+
+// A time column is { start, deltas, suffix }: the first time and the differences between the next
+// ones, in seconds. They are wall-clock times sent as if they were UTC, so they are formatted in UTC.
+function decodeTimes(column) {
+    let seconds = column.start;
+    const times = [formatEpochSeconds(seconds, column.suffix)];
+    column.deltas.forEach(delta => {
+        seconds += delta;
+        times.push(formatEpochSeconds(seconds, column.suffix));
+    });
+    return times;
+}
+
+function formatEpochSeconds(seconds, suffix) {
+    return new Date(seconds * 1000).toISOString().slice(0, 19).replace('T', ' ') + suffix;
+}
+
 function formatTime_sec(timeStr) {
     return timeStr.replace(/^\d{4}-/, '').replace(/\.\d+$/, '');
 }
@@ -211,7 +281,7 @@ function plotData(data) {
         peakThroughputAllDevicesChartInstance = plotLineChart('peakThroughputAllDevicesChart', formattedTime, data.all_device_metrics['peak_throughput_all_devices(bps)'], 'peak throughput (bps)', 'Peak Throughput of All Devices per Min');
         avgPacketSizeAllDevicesChartInstance = plotLineChart('avgPacketSizeAllDevicesChart', formattedTime, data.all_device_metrics['avg_packet_size_all_devices(bytes)'], 'avg ip packet size (bytes)', 'Average IP Packet Size of All Devices per Min');
         packetCountAllDevicesChartInstance = plotLineChart('packetCountAllDevicesChart', formattedTime, data.all_device_metrics['packet_count_all_devices'], 'ip packet count', 'Number of IP Packets of All Devices per Min');
-        destinationsCountAllDevicesChartInstance = plotLineChart('destinationsCountAllDevicesChart', formattedTime, data.all_device_metrics['destinations_count_all_devices'], 'destination ip count','Average Number of Unique Destinations of All Devices per Min');
+        destinationsCountAllDevicesChartInstance = plotLineChart('destinationsCountAllDevicesChart', formattedTime, data.all_device_metrics['destinations_count_all_devices'], 'destination ip count','Number of Unique Destinations of All Devices per Min');
     }else{
         notshowElement('avgThroughputAllDevicesChart');
         notshowElement('peakThroughputAllDevicesChart');
@@ -281,6 +351,135 @@ function plotData(data) {
 }
 
 
+// Opens the stream of updates pushed by the server for a device
+function openUpdateStream(deviceName) {
+    if (!window.EventSource || updateStreamDevice === deviceName) {
+        return;
+    }
+    closeUpdateStream();
+
+    updateStreamDevice = deviceName;
+    updateStream = new EventSource('/stream?device_name=' + encodeURIComponent(deviceName));
+    updateStream.addEventListener('update', event => {
+        const data = JSON.parse(event.data);
+        // Each update is a full snapshot, only the rows that are not plotted yet are added
+        if (plottedDevice === deviceName && data.generation !== plottedGeneration) {
+            updateCharts(data);
+        }
+    });
+}
+
+function closeUpdateStream() {
+    if (updateStream) {
+        updateStream.close();
+    }
+    updateStream = null;
+    updateStreamDevice = null;
+}
+
+function isUpdateStreamOpen() {
+    return updateStream !== null && updateStream.readyState === EventSource.OPEN;
+}
+
+// Remembers what is plotted, so the next requests only ask for newer rows
+function rememberPlottedData(deviceName, data) {
+    openUpdateStream(deviceName);
+    plottedDevice = deviceName;
+    plottedGeneration = data.generation;
+    plottedTimes = {};
+    ['all_device_metrics', 'metrics_per_device', 'throughput_per_device'].forEach(series => {
+        if (data[series] && data[series].time) {
+            plottedTimes[series] = data[series].time.slice();
+        }
+    });
+}
+
+// Adds the rows returned by an incremental request to the existing charts
+function updateCharts(data) {
+    plottedGeneration = data.generation;
+
+    if (data.all_device_metrics && data.all_device_metrics.time && avgThroughputAllDevicesChartInstance) {
+        mergeLineChartRows('all_device_metrics', data.all_device_metrics, [
+            [avgThroughputAllDevicesChartInstance, 'avg_throughput_all_devices(bps)'],
+            [peakThroughputAllDevicesChartInstance, 'peak_throughput_all_devices(bps)'],
+            [avgPacketSizeAllDevicesChartInstance, 'avg_packet_size_all_devices(bytes)'],
+            [packetCountAllDevicesChartInstance, 'packet_count_all_devices'],
+            [destinationsCountAllDevicesChartInstance, 'destinations_count_all_devices']
+        ], formatTime_min, 120);
+    }
+
+    if (data.all_device_traffic && data.all_device_traffic.device_name && barChartInstance) {
+        updateBarChart(barChartInstance, data.all_device_traffic.device_name, data.all_device_traffic['total_throughput(bits)']);
+    }
+
+    if (data.throughput_per_device && data.throughput_per_device.time && throughputPerSecondDeviceChartInstance) {
+        mergeLineChartRows('throughput_per_device', data.throughput_per_device, [
+            [throughputPerSecondDeviceChartInstance, 'throughput_per_sec(bps)']
+        ], formatTime_sec, 300);
+    }
+
+    if (data.metrics_per_device && data.metrics_per_device.time && avgThroughputDeviceChartInstance) {
+        mergeLineChartRows('metrics_per_device', data.metrics_per_device, [
+            [avgThroughputDeviceChartInstance, 'avg_throughput_per_min(bps)'],
+            [peakThroughputDeviceChartInstance, 'peak_throughput_per_min(bps)'],
+            [avgPacketSizeDeviceChartInstance, 'avg_packet_size_per_min(bytes)'],
+            [packetCountDeviceChartInstance, 'packet_count_per_min'],
+            [uniqueDestinationsDeviceChartInstance, 'unique_destinations_count_per_min']
+        ], formatTime_min, 120);
+    }
+
+    if (data.traffic_per_device && data.traffic_per_device.destination_ip && destinationTrafficDeviceChartInstance) {
+        updateBarChart(destinationTrafficDeviceChartInstance, data.traffic_per_device.destination_ip, data.traffic_per_device['throughput_per_ip(bits)']);
+    }
+
+    if (data.packet_size_record && data.packet_size_record['packet_size(bytes)'] && packetSizeChartInstance) {
+        updateBarChart(packetSizeChartInstance, data.packet_size_record['packet_size(bytes)'], data.packet_size_record['count']);
+    }
+}
+
+// Appends new rows to line charts that share the same time axis, then drops the oldest points
+// so the charts keep maxPoints points. A row with the same time as the last point replaces it,
+// because the last minute/second of a run is incomplete.
+function mergeLineChartRows(series, table, charts, formatTime, maxPoints) {
+    const times = plottedTimes[series] || [];
+
+    table.time.forEach((time, i) => {
+        const last = times.length - 1;
+        if (last >= 0 && time < times[last]) {
+            return; // Already plotted
+        }
+        if (last >= 0 && time === times[last]) {
+            charts.forEach(([chart, column]) => { chart.data.datasets[0].data[last] = table[column][i]; });
+        } else {
+            times.push(time);
+            charts.forEach(([chart, column]) => {
+                chart.data.labels.push(formatTime(time));
+                chart.data.datasets[0].data.push(table[column][i]);
+            });
+        }
+    });
+
+    const excess = times.length - maxPoints;
+    if (excess > 0) {
+        times.splice(0, excess);
+        charts.forEach(([chart]) => {
+            chart.data.labels.splice(0, excess);
+            chart.data.datasets[0].data.splice(0, excess);
+        });
+    }
+
+    plottedTimes[series] = times;
+    charts.forEach(([chart]) => chart.update('none'));
+}
+
+// Replaces the data of a bar chart without rebuilding it
+function updateBarChart(chart, dataLabels, dataValues) {
+    chart.data.labels = dataLabels;
+    chart.data.datasets[0].data = dataValues;
+    chart.update('none');
+}
+
+
 //Draw a line chart
 function plotLineChart(ctxId, dataLabels, dataValues, labelName, title) {
 
@@ -291,7 +490,7 @@ function plotLineChart(ctxId, dataLabels, dataValues, labelName, title) {
     return new Chart(ctx, {
         type: 'line',
         data: {
-            labels: dataLabels,
+            labels: dataLabels.slice(), // Each chart gets its own copy, since new points are pushed to it
             datasets: [{
                 label: labelName,
                 data: dataValues,
@@ -379,9 +578,15 @@ function displayMessage(message) {
 
 
 // Schedule data acquisition, which is executed every 1 minutes
+// It is skipped while the server pushes the updates of the selected device
 function scheduleDataFetch() {
     setTimeout(() => {
-        fetchAndPlotData();
+        const deviceName = document.getElementById('deviceSelector').value;
+        if (isUpdateStreamOpen() && updateStreamDevice === deviceName && plottedDevice === deviceName) {
+            scheduleDataFetch();
+        } else {
+            fetchAndPlotData(true);
+        }
     }, 1 * 60 * 1000);
 }
 
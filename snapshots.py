@@ -0,0 +1,174 @@
+import os
+import re
+import gzip
+import json
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Only gzip is then available
+
+
+# Encodings of a /data response: the JSON of the tables as they are, or the compact encoding, where
+# the time column of each table is delta-encoded (see encode_times)
+ENCODING_JSON = "json"
+ENCODING_COMPACT = "compact"
+
+# The full /data response of a device in each encoding, written by data_process next to its tables
+SNAPSHOT_FILE_NAMES = {ENCODING_JSON: "snapshot.json", ENCODING_COMPACT: "snapshot.compact.json"}
+SNAPSHOT_FILE_NAME = SNAPSHOT_FILE_NAMES[ENCODING_JSON]
+
+# Content codings of the compressed copies of the snapshots and their file extensions, preferred first
+CODING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+# Tables of a /data response: (key in the response, table name, number of last rows or None for all)
+DEVICE_TABLES = (
+    ("metrics_per_device", "metrics_per_min_{device_name}", 120),
+    ("traffic_per_device", "destination_traffic_{device_name}", None),
+    ("throughput_per_device", "throughput_per_second_{device_name}", 300),
+    ("packet_size_record", "packet_sizes_count_{device_name}", None),
+)
+ALL_DEVICE_TABLES = (
+    ("all_device_metrics", "all_device_aggregated_metrics_per_min", 120),
+    ("all_device_traffic", "all_device_sorted_traffic_last_n_minutes", None),
+)
+
+# Times of the tables as they are serialized: whole seconds, with or without a zero fraction
+TIME_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(\.0+)?')
+EPOCH = datetime(1970, 1, 1)
+
+#------------------------------------------------------------------------------
+def get_response_tables(device_name):
+    """The tables of the /data response of a device, with the names of its tables."""
+    tables = ALL_DEVICE_TABLES if device_name == "all_device" else DEVICE_TABLES
+    return [(key, table_name.format(device_name=device_name), rows) for key, table_name, rows in tables]
+
+
+def dumps(value):
+    """Serialize like the JSON provider of Flask, so the snapshots match the responses built by web_app."""
+    return json.dumps(value, ensure_ascii=True, sort_keys=True)
+
+
+def join_json(parts):
+    """Join values already serialized as JSON into one JSON object."""
+    return "{" + ",".join(f"{dumps(name)}:{payload}" for name, payload in parts.items()) + "}"
+
+
+def table_to_columns(df, rows = None, date_format = None):
+    """The columns of a table as web_app serves them after reading it back from its file.
+
+    The datetime columns are rendered as text, as in the CSV file, and the missing values are 0.
+    """
+    if df is None:
+        return {}
+    import pandas as pd  # Only the pipeline converts tables, web_app serves the files
+
+    if rows is not None:
+        df = df.tail(rows)
+    df = df.fillna(0)
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(date_format) if date_format else df[column].astype(str)
+    return df.to_dict(orient='list')
+
+
+def compact_columns(columns):
+    """The columns of a table in the compact encoding: the time column is delta-encoded."""
+    return {name: encode_times(values) if name == 'time' else values for name, values in columns.items()}
+
+
+def encode_times(times):
+    """Encode a column of times as {"start": epoch seconds, "deltas": [...], "suffix": fraction text}.
+
+    The times are wall-clock times, read as if they were UTC, so the client rebuilds the same text
+    with the UTC functions of Date. The column is returned unchanged unless all its times are whole
+    seconds written the same way.
+    """
+    if not times:
+        return times
+    seconds = []
+    suffix = None
+    for value in times:
+        match = TIME_PATTERN.fullmatch(value) if isinstance(value, str) else None
+        if match is None or suffix not in (None, match.group(2) or ""):
+            return times
+        suffix = match.group(2) or ""
+        seconds.append(int((datetime.fromisoformat(match.group(1)) - EPOCH).total_seconds()))
+    return {"start": seconds[0], "deltas": [second - previous for previous, second in zip(seconds, seconds[1:])], "suffix": suffix}
+
+
+def build_snapshot(generation, tables, encoding = ENCODING_JSON):
+    """The /data response of a device, from the columns of its tables (see table_to_columns)."""
+    parts = {"generation": dumps(generation), "full": dumps(True)}
+    if encoding == ENCODING_COMPACT:
+        parts["encoding"] = dumps(ENCODING_COMPACT)
+        tables = {key: compact_columns(columns) for key, columns in tables.items()}
+    parts.update((key, dumps(columns)) for key, columns in tables.items())
+    return join_json(parts)
+
+
+def compress(data, coding, fast = False):
+    """Compress bytes with a content coding, or return None if it is not available.
+
+    fast is for the responses compressed at each request, the snapshots are compressed once.
+    """
+    if coding == "gzip":
+        # No timestamp in the header, so the same snapshot always gives the same bytes
+        return gzip.compress(data, compresslevel=6 if fast else 9, mtime=0)
+    if coding == "br" and brotli is not None:
+        return brotli.compress(data, quality=5 if fast else 11)
+    return None
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def write_snapshots(folder, generation, tables, encodings = (ENCODING_JSON,), codings = ("gzip",)):
+    """Write the snapshot of a device in each encoding, and a copy compressed with each content coding.
+
+    The JSON snapshot is always written, rewrite_snapshot_generation reads the tables from it. The
+    files are replaced rather than written in place, as they may be hard links shared with the
+    previous generation.
+    """
+    for encoding, file_name in SNAPSHOT_FILE_NAMES.items():
+        path = os.path.join(folder, file_name)
+        if encoding == ENCODING_JSON or encoding in encodings:
+            data = build_snapshot(generation, tables, encoding).encode('utf-8')
+            _replace_file(path, data)
+        else:
+            data = None
+            _remove_file(path)
+
+        for coding, extension in CODING_EXTENSIONS.items():
+            compressed = compress(data, coding) if data is not None and coding in codings else None
+            if compressed is not None:
+                _replace_file(path + extension, compressed)
+            else:
+                _remove_file(path + extension)
+
+
+def rewrite_snapshot_generation(folder, generation, encodings = (ENCODING_JSON,), codings = ("gzip",)):
+    """Change the generation of the snapshots of a device reused from the previous generation.
+
+    Returns False if the folder has no snapshot.
+    """
+    try:
+        with open(os.path.join(folder, SNAPSHOT_FILE_NAME), 'rb') as snapshot_file:
+            payload = json.loads(snapshot_file.read())
+    except (OSError, ValueError):
+        return False
+    tables = {key: value for key, value in payload.items() if key not in ("generation", "full")}
+    write_snapshots(folder, generation, tables, encodings, codings)
+    return True
+
+
+def _replace_file(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+#------------------------------------------------------------------------------
@@ -0,0 +1,165 @@
+import os
+import json
+import shutil
+
+
+# numpy and pandas are imported by the functions that read or write the tables, so that web_app can
+# import this module and serve the snapshots without loading them.
+
+# Tables can be written as CSV and/or as a columnar directory of .npy files, one per column.
+# Datetime columns are stored in the columnar format as integer seconds since the epoch.
+FORMAT_CSV = "csv"
+FORMAT_COLUMNAR = "columnar"
+
+CSV_EXTENSION = ".csv"
+COLUMNAR_EXTENSION = ".cols"
+COLUMNAR_SCHEMA_FILE = "schema.json"
+
+#------------------------------------------------------------------------------
+def write_table(folder, table_name, df, formats = (FORMAT_CSV,), date_format = None):
+    """Write a table in each of the given formats.
+
+    date_format is the format of the datetime columns in the CSV file. The columnar copy keeps it,
+    so the times read back from either format are rendered the same way.
+    """
+    if FORMAT_CSV in formats:
+        df.to_csv(os.path.join(folder, table_name + CSV_EXTENSION), index=False, date_format=date_format)
+
+    if FORMAT_COLUMNAR in formats:
+        write_columnar(os.path.join(folder, table_name + COLUMNAR_EXTENSION), df, date_format)
+
+
+def read_table(folder, table_name, tail = None, parse_dates = False):
+    """Read a table, from its columnar copy if there is one, otherwise from its CSV file.
+
+    Only the last `tail` rows are returned if tail is given. Datetime columns are returned as
+    datetimes if parse_dates is True, otherwise as text, the same as in the CSV file.
+    Returns None if the table does not exist.
+    """
+    columnar_path = os.path.join(folder, table_name + COLUMNAR_EXTENSION)
+    if os.path.isdir(columnar_path):
+        return read_columnar(columnar_path, tail, parse_dates)
+
+    csv_path = os.path.join(folder, table_name + CSV_EXTENSION)
+    if os.path.isfile(csv_path):
+        import pandas as pd
+        df = pd.read_csv(csv_path, parse_dates=['time'] if parse_dates else False)
+        return df.tail(tail) if tail is not None else df
+
+    return None
+
+
+def table_signature(folder, table_name):
+    """Identify the version of a table from the stat of its file, or None if it does not exist.
+
+    A table is replaced by writing a new file, so a change of inode, size or mtime means new content.
+    """
+    for path in (os.path.join(folder, table_name + COLUMNAR_EXTENSION, COLUMNAR_SCHEMA_FILE),
+                 os.path.join(folder, table_name + CSV_EXTENSION)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        return (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    return None
+
+
+def table_exists(folder, table_name):
+    """True if the table was written in any format."""
+    return (os.path.isdir(os.path.join(folder, table_name + COLUMNAR_EXTENSION))
+            or os.path.isfile(os.path.join(folder, table_name + CSV_EXTENSION)))
+
+
+def link_table(source_folder, target_folder, table_name):
+    """Add a table of source_folder to target_folder, with hard links when possible.
+
+    The tables of a published generation are never modified, so both folders can share the files.
+    Returns False if source_folder has no such table.
+    """
+    if not table_exists(source_folder, table_name):
+        return False
+
+    csv_path = os.path.join(source_folder, table_name + CSV_EXTENSION)
+    if os.path.isfile(csv_path):
+        try:
+            os.link(csv_path, os.path.join(target_folder, table_name + CSV_EXTENSION))
+        except OSError:
+            shutil.copy2(csv_path, os.path.join(target_folder, table_name + CSV_EXTENSION))
+
+    columnar_path = os.path.join(source_folder, table_name + COLUMNAR_EXTENSION)
+    if os.path.isdir(columnar_path):
+        target_path = os.path.join(target_folder, table_name + COLUMNAR_EXTENSION)
+        try:
+            shutil.copytree(columnar_path, target_path, copy_function=os.link)
+        except OSError:
+            shutil.rmtree(target_path, ignore_errors=True)
+            shutil.copytree(columnar_path, target_path)
+    return True
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+def write_columnar(path, df, date_format = None):
+    """Write one .npy file per column into a new directory, then swap it in place of the old one."""
+    import numpy as np
+    import pandas as pd
+
+    temp_path = path + ".tmp"
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+
+    schema = {"date_format": date_format, "columns": []}
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            kind = "datetime"
+            array = values.values.astype('datetime64[s]').astype(np.int64)
+        elif pd.api.types.is_numeric_dtype(values):
+            kind = "number"
+            array = values.to_numpy()
+        else:
+            kind = "text"
+            array = values.fillna('').astype(str).to_numpy().astype(str)
+
+        file_name = f"{i}.npy"
+        np.save(os.path.join(temp_path, file_name), array, allow_pickle=False)
+        schema["columns"].append({"name": column, "kind": kind, "file": file_name})
+
+    with open(os.path.join(temp_path, COLUMNAR_SCHEMA_FILE), 'w') as schema_file:
+        json.dump(schema, schema_file)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(temp_path, path)
+
+
+def read_columnar(path, tail = None, parse_dates = False):
+    """Read a columnar table. The columns are memory-mapped, so only the rows returned are read."""
+    import numpy as np
+    import pandas as pd
+
+    with open(os.path.join(path, COLUMNAR_SCHEMA_FILE), 'r') as schema_file:
+        schema = json.load(schema_file)
+
+    data = {}
+    for column in schema["columns"]:
+        array = np.load(os.path.join(path, column["file"]), mmap_mode='r', allow_pickle=False)
+        if tail is not None:
+            array = array[-tail:] if tail > 0 else array[:0]
+        array = np.array(array)
+
+        if column["kind"] == "datetime":
+            times = pd.to_datetime(array, unit='s')
+            if parse_dates:
+                data[column["name"]] = times
+            elif schema["date_format"]:
+                data[column["name"]] = times.strftime(schema["date_format"])
+            else:
+                data[column["name"]] = times.astype(str)
+        elif column["kind"] == "text":
+            data[column["name"]] = array.astype(object)
+        else:
+            data[column["name"]] = array
+
+    return pd.DataFrame(data)
+#------------------------------------------------------------------------------
@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+import logging
+
+
+class Subscriber:
+    """One client connected to the stream of a device."""
+
+    def __init__(self, device_name, max_queued):
+        self.device_name = device_name
+        self.messages = queue.Queue(maxsize=max_queued)
+        self.dropped = 0
+
+    def send(self, message):
+        """Queue a message without ever blocking the broadcaster.
+
+        Every message is a full snapshot of the device, so when a slow client falls behind its
+        oldest queued messages are dropped and it only receives the latest ones.
+        """
+        while True:
+            try:
+                self.messages.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.messages.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class UpdateBroadcaster:
+    """Push one serialized update per device to all its subscribers when a new generation is published.
+
+    get_generation() returns the current generation and build_message(device_name, generation)
+    returns the message to send. A background thread polls get_generation every poll_interval seconds.
+    """
+
+    def __init__(self, get_generation, build_message, poll_interval = 1, max_queued = 4):
+        self.get_generation = get_generation
+        self.build_message = build_message
+        self.poll_interval = poll_interval
+        self.max_queued = max_queued
+        self.subscribers = {}  # device_name -> set of Subscriber
+        self.generation = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, device_name):
+        """Register a client and queue the current data of the device for it."""
+        subscriber = Subscriber(device_name, self.max_queued)
+        with self.lock:
+            self.subscribers.setdefault(device_name, set()).add(subscriber)
+            if self.thread is None:
+                self.generation = self.get_generation()
+                self.thread = threading.Thread(target=self.watch_generations, daemon=True)
+                self.thread.start()
+            generation = self.generation
+
+        subscriber.send(self.build_message(device_name, generation))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            device_subscribers = self.subscribers.get(subscriber.device_name)
+            if device_subscribers is not None:
+                device_subscribers.discard(subscriber)
+                if not device_subscribers:
+                    del self.subscribers[subscriber.device_name]
+
+    def subscriber_count(self):
+        with self.lock:
+            return sum(len(device_subscribers) for device_subscribers in self.subscribers.values())
+
+    def watch_generations(self):
+        """Broadcast an update each time the current generation changes."""
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                generation = self.get_generation()
+                if generation == self.generation:
+                    continue
+                self.generation = generation
+                self.broadcast(generation)
+            except Exception as e:
+                logging.error(f"Error broadcasting generation {self.generation}: {e}")
+
+    def broadcast(self, generation):
+        """Build the message of each subscribed device once and queue it for all its subscribers."""
+        with self.lock:
+            targets = {device_name: list(device_subscribers) for device_name, device_subscribers in self.subscribers.items()}
+
+        for device_name, device_subscribers in targets.items():
+            message = self.build_message(device_name, generation)
+            for subscriber in device_subscribers:
+                subscriber.send(message)
@@ -1,99 +1,600 @@
-from flask import Flask, jsonify, request, abort
+from flask import Flask, Response, jsonify, request, abort, send_file
 from flask_cors import CORS
-import pandas as pd
 import os
+import sys
+import math
+import queue
 import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from storage import read_table, table_signature
+from response_cache import ResponseCache
+from generations import resolve_generation, get_current_generation
+from update_broadcaster import UpdateBroadcaster
+from downsampling import downsample_table, METHODS, METHOD_MINMAX, MIN_POINTS
+from instrumentation import read_run_report, format_prometheus, METRIC_PREFIX
+from snapshots import (SNAPSHOT_FILE_NAME, SNAPSHOT_FILE_NAMES, CODING_EXTENSIONS, ENCODING_JSON, ENCODING_COMPACT,
+                       DEVICE_TABLES, ALL_DEVICE_TABLES, get_response_tables, compact_columns, compress)
 
 app = Flask(__name__, static_folder="C:/Users/63002/OneDrive/桌面/frontend", static_url_path='')
 CORS(app)
 logging.basicConfig(level=logging.INFO)
 
-# path of data_finished_processed folder
+# path of data_finished_processed folder, the data of the current generation is read from it
 BASE_PATH = "C:\\Users\\63002\\OneDrive\\test_data_2\\data_finished_processed"
 
+# Serialized tables are cached until their file changes
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+table_cache = ResponseCache(CACHE_MAX_BYTES)
+
+# Responses built at each request are compressed (with the content coding preferred by the client)
+# from this size on
+COMPRESS_MIN_BYTES = 1024
+
+# Server-sent events: a comment is sent when there was no update for HEARTBEAT_INTERVAL seconds
+HEARTBEAT_INTERVAL = 15
+
+# Server of `python web_app.py`: waitress if it is installed, otherwise the threaded Flask server.
+# `python web_app.py --debug` runs the Flask development server with the debugger instead.
+HOST = "127.0.0.1"
+PORT = 5000
+SERVER_THREADS = 256
+CONNECTION_LIMIT = 2000
+# Each open stream holds a thread of the server until the client leaves, so at most MAX_STREAMS are
+# open at once and the other threads are left for the requests. The clients above it get a 503 and
+# the dashboard polls /data instead.
+MAX_STREAMS = 224
+
+# /data/batch: at most MAX_BATCH_DEVICES devices per request. Their tables are read by BATCH_READERS
+# threads shared by all the batch requests, so a batch does not hold more than its own thread of the
+# server and the readers are not multiplied by the concurrent batches.
+MAX_BATCH_DEVICES = 200
+BATCH_READERS = 8
+batch_readers = ThreadPoolExecutor(max_workers=BATCH_READERS, thread_name_prefix="batch-reader")
+
+# Devices of the generation listed last: (generation path, device names, set of the names). A
+# published generation is never modified, so they are only listed again when it changes.
+device_listing = (None, [], frozenset())
+
+# Series that can answer a /data request with a range: (resolution, seconds covered, table name prefix).
+# The throughput_per_second table covers the DISPLAY_PERIOD of data_process, the others are the
+# rollup tables written for each tier of the rollup store. Set by get_series_tables.
+DISPLAY_PERIOD_SECONDS = 2 * 3600
+SERIES_TABLES = None
+DURATION_UNITS = {"s": 1, "min": 60, "h": 3600, "d": 86400}
+# Longest range or resolution accepted, far above the retention of the longest rollup tier
+MAX_DURATION_SECONDS = 10 * 365 * 86400
+
+# The times of the tables are wall-clock times of TIME_ZONE (see data_process), written with TIME_FORMAT
+TIME_ZONE = 'Europe/London'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Keys of the tables that /data/batch can return
+SERIES_KEYS = frozenset(key for key, _, _ in DEVICE_TABLES + ALL_DEVICE_TABLES)
+
 @app.route('/')
 def index():
     return app.send_static_file('index.html')
 
 @app.route('/devices', methods=['GET'])
 def get_devices():
-    devices = [d for d in os.listdir(BASE_PATH) if os.path.isdir(os.path.join(BASE_PATH, d))]
-    return jsonify({"devices": devices})
+    return jsonify({"devices": get_device_listing(resolve_generation(BASE_PATH))[1]})
+
+def list_devices(generation_path):
+    return [d for d in os.listdir(generation_path) if os.path.isdir(os.path.join(generation_path, d))]
+
+def get_device_listing(generation_path):
+    """The device names of a generation and the same names as a set, listed once per generation.
+
+    The folder of data written before generations were introduced is modified in place, so it is
+    listed on every call.
+    """
+    global device_listing
+    listing = device_listing
+    if listing[0] != generation_path or generation_path == BASE_PATH:
+        devices = list_devices(generation_path)
+        listing = (generation_path, devices, frozenset(devices))
+        device_listing = listing
+    return listing
 
-def load_and_tail(file_path, n):
+def is_device(generation_path, device_name):
+    """Whether device_name is a device of the generation.
+
+    Only text is looked up: a list or an object sent as the name cannot be in the set of the names.
+    """
+    return isinstance(device_name, str) and device_name in get_device_listing(generation_path)[2]
+
+def load_and_tail(folder_path, table_name, n):
     try:
-        if os.path.isfile(file_path):
-            df = pd.read_csv(file_path)
+        df = read_table(folder_path, table_name, tail=n)
+        if df is not None:
             df.fillna(0, inplace=True)
-            return df.tail(n)
+            return df
         else:
-            # logging.warning(f"File not found: {file_path}")
+            # logging.warning(f"Table not found: {table_name}")
             return None
     except Exception as e:
-        logging.error(f"Error reading {file_path}: {e}")
+        logging.error(f"Error reading {table_name} in {folder_path}: {e}")
         return None
     
 
-def load_full_csv(file_path):
+def load_full_table(folder_path, table_name):
     try:
-        if os.path.isfile(file_path):
-            df = pd.read_csv(file_path)
+        df = read_table(folder_path, table_name)
+        if df is not None:
             df.fillna(0, inplace=True)
             return df
         else:
-            # logging.warning(f"File not found: {file_path}")
+            # logging.warning(f"Table not found: {table_name}")
             return None
     except Exception as e:
-        logging.error(f"Error reading {file_path}: {e}")
+        logging.error(f"Error reading {table_name} in {folder_path}: {e}")
         return None
 
 
 
-@app.route('/data', methods=['POST'])
+def load_table_json(folder_path, table_name, n = None, since = None, compact = False, points = None, method = METHOD_MINMAX):
+    """Return the table (or its last n rows) serialized as JSON, from the cache when the file has not changed.
+
+    If since is given (a time as parse_since returns it), only the rows with a time at or after it are
+    kept. The row at `since` is sent again because the last minute/second of a run is still incomplete
+    and is updated by the next run.
+    If compact is True, the table is in the compact encoding (see snapshots.compact_columns). If
+    points is given, the rows are downsampled to at most that many with the given method (see
+    downsampling.downsample_table).
+    """
+    signature = table_signature(folder_path, table_name)
+    if signature is None:
+        return "{}"
+
+    key = (folder_path, table_name, n, since, compact, points, method)
+    payload = table_cache.get(key, signature)
+    if payload is not None:
+        return payload
+
+    if n is None:
+        df = load_full_table(folder_path, table_name)
+    else:
+        df = load_and_tail(folder_path, table_name, n)
+    if df is not None and since is not None and 'time' in df.columns:
+        # The times are text in a sortable format, so they can be compared as strings
+        df = df[df['time'].astype(str) >= since]
+    if df is not None and points is not None:
+        df = downsample_table(df, points, method)
+    columns = df.to_dict(orient='list') if df is not None else {}
+    payload = app.json.dumps(compact_columns(columns) if compact else columns)
+
+    table_cache.put(key, signature, payload)
+    return payload
+
+
+def join_json(parts):
+    """Join the serialized tables into one JSON object."""
+    return "{" + ",".join(f"{app.json.dumps(name)}:{payload}" for name, payload in parts.items()) + "}"
+
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(table_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics: the stage metrics of the last run of data_process, and the counters of the cache."""
+    lines = []
+    report = read_run_report(os.path.join(resolve_generation(BASE_PATH), "all_device"))
+    if report is not None:
+        lines.append(format_prometheus(report))
+
+    for name, value in table_cache.stats().items():
+        metric_type = "counter" if name in ("hits", "misses", "evictions") else "gauge"
+        metric_name = f"{METRIC_PREFIX}cache_{name}_total" if metric_type == "counter" else f"{METRIC_PREFIX}cache_{name}"
+        lines.append(f"# TYPE {metric_name} {metric_type}\n{metric_name} {value}\n")
+    return Response("".join(lines), mimetype='text/plain; version=0.0.4')
+
+
+
+@app.route('/data', methods=['GET', 'POST'])
 def get_device_data():
-    device_name = request.json.get('device_name')
+    """Return the data of a device.
+
+    Without `since` the full snapshot is returned: the snapshot file written by data_process (gzipped
+    if the client accepts it), with an ETag, so a GET with If-None-Match gets a 304 when the data did
+    not change. With `since` (the last time the client has, in the JSON body or the query string),
+    the time series only contain the rows from that time on, and nothing but the generation is
+    returned if the client already has the current `generation`.
+
+    With `range` (and optionally `resolution`), only the traffic series of the device over the last
+    `range` is returned, from the cheapest table that covers it (see select_series_table).
+    Durations are seconds or a number with a unit: "90s", "15min", "48h", "7d".
+
+    With `points`, each time series is the whole table (or the `range`) downsampled to at most that
+    many points, with `downsample` "minmax" (the default, the peaks are kept) or "lttb".
+
+    With `encoding` "compact", the time columns are delta-encoded epoch seconds (see
+    snapshots.encode_times). The responses are compressed with brotli or gzip when the client accepts it.
+    """
+    params = read_params()
+    device_name = params.get('device_name') or request.args.get('device_name')
+    since = params.get('since') or request.args.get('since')
+    client_generation = params.get('generation') or request.args.get('generation')
+    series_range = params.get('range') or request.args.get('range')
+    resolution = params.get('resolution') or request.args.get('resolution')
 
     if not device_name:
         abort(400, "device_name is required.")
 
-    if device_name not in get_devices().json["devices"]:
+    encoding, points, method = parse_table_options(params)
+    compact = encoding == ENCODING_COMPACT
+    since = read_since(since)
+
+    # The generation is resolved once, so all tables of a response come from the same run
+    generation_path = resolve_generation(BASE_PATH)
+
+    if not is_device(generation_path, device_name):
         abort(400, "Invalid device_name.")
 
-    folder_path = os.path.join(BASE_PATH, device_name)
+    if series_range is not None:
+        if device_name == "all_device":
+            abort(400, "range is only available for a device.")
+        try:
+            range_seconds = parse_duration(series_range)
+            resolution_seconds = parse_duration(resolution) if resolution is not None else 1
+        except ValueError:
+            abort(400, "Invalid range or resolution.")
+        body = build_series_payload(device_name, generation_path, range_seconds, resolution_seconds, compact, points, method)
+        return send_json(body)
 
-    response_data = {}
+    if since is None and points is None:
+        response = send_snapshot(os.path.join(generation_path, device_name), encoding)
+        if response is not None:
+            return response
 
-    if device_name == "all_device":
-        response_data.update(get_all_device_data(folder_path))
+    body = build_device_payload(device_name, generation_path, since, client_generation, compact, points, method)
+    return send_json(body)
 
-    else:
-        response_data.update(get_specific_device_data(folder_path, device_name))
-    
-    return jsonify(response_data)
 
+def read_params():
+    """The JSON body of a request, or {} without one. Aborts with a 400 if the body is not an object."""
+    params = request.get_json(silent=True)
+    if params is None:
+        return {}
+    if not isinstance(params, dict):
+        abort(400, "The JSON body must be an object.")
+    return params
 
 
-def get_all_device_data(folder_path):
-    metrics = load_and_tail(os.path.join(folder_path, "all_device_aggregated_metrics_per_min.csv"), 120)
-    traffic = load_full_csv(os.path.join(folder_path, "all_device_sorted_traffic_last_n_minutes.csv"))
-    
-    return {
-        "all_device_metrics": metrics.to_dict(orient='list') if metrics is not None else {},
-        "all_device_traffic": traffic.to_dict(orient='list') if traffic is not None else {}
+def read_since(since):
+    """Parse the `since` of a request (see parse_since), or abort with a 400 if it is not a time."""
+    if since is None:
+        return None
+    try:
+        return parse_since(since)
+    except ValueError:
+        abort(400, "Invalid since.")
+
+
+def parse_table_options(params):
+    """Read the options of the tables of a /data request: (encoding, points, method). Aborts with a 400 if one is invalid."""
+    encoding = params.get('encoding') or request.args.get('encoding') or ENCODING_JSON
+    points = params.get('points') or request.args.get('points')
+    method = params.get('downsample') or request.args.get('downsample') or METHOD_MINMAX
+
+    # Only text is looked up: a list sent as the encoding cannot be a key of SNAPSHOT_FILE_NAMES
+    if not isinstance(encoding, str) or encoding not in SNAPSHOT_FILE_NAMES:
+        abort(400, "Invalid encoding.")
+
+    if points is not None:
+        try:
+            points = int(points)
+        except (TypeError, ValueError):
+            points = 0
+        if points < MIN_POINTS:
+            abort(400, f"points must be a number of at least {MIN_POINTS}.")
+    if method not in METHODS:
+        abort(400, "Invalid downsample method.")
+    return encoding, points, method
+
+
+@app.route('/data/batch', methods=['POST'])
+def get_batch_data():
+    """Return the data of several devices in one response.
+
+    The JSON body has `device_names`, a list of devices, and optionally `series`, the keys of the
+    tables wanted (as in the /data response, e.g. "throughput_per_device"); without it all the tables
+    are returned. `since`, `generation`, `points`, `downsample` and `encoding` are read as by /data.
+    The tables of the devices are read concurrently by the threads of batch_readers, through the
+    table cache. The response has the generation and `devices`, the tables of each device by name.
+    """
+    params = read_params()
+    device_names = params.get('device_names')
+    series = params.get('series')
+    since = params.get('since') or request.args.get('since')
+    client_generation = params.get('generation') or request.args.get('generation')
+
+    if not isinstance(device_names, list) or not device_names or not all(isinstance(name, str) for name in device_names):
+        abort(400, "device_names must be a list of device names.")
+    device_names = list(dict.fromkeys(device_names))
+    if len(device_names) > MAX_BATCH_DEVICES:
+        abort(400, f"At most {MAX_BATCH_DEVICES} devices can be requested at once.")
+    if series is not None and (not isinstance(series, list)
+                               or not all(isinstance(key, str) and key in SERIES_KEYS for key in series)):
+        abort(400, f"series must be a list of: {', '.join(sorted(SERIES_KEYS))}.")
+
+    encoding, points, method = parse_table_options(params)
+    compact = encoding == ENCODING_COMPACT
+    since = read_since(since)
+
+    # The generation is resolved once, so all the devices come from the same run
+    generation_path = resolve_generation(BASE_PATH)
+    unknown = [name for name in device_names if not is_device(generation_path, name)]
+    if unknown:
+        abort(400, f"Invalid device_names: {', '.join(unknown)}.")
+
+    generation = os.path.basename(os.path.normpath(generation_path))
+    response_data = {
+        "generation": app.json.dumps(generation),
+        "full": app.json.dumps(since is None)
+    }
+    if compact:
+        response_data["encoding"] = app.json.dumps(ENCODING_COMPACT)
+
+    # The client is up to date
+    if since is not None and client_generation == generation:
+        return send_json(join_json(response_data))
+
+    keys = set(series) if series is not None else None
+    payloads = batch_readers.map(
+        lambda device_name: join_json(get_tables_data(os.path.join(generation_path, device_name), device_name,
+                                                      since, compact, points, method, keys)),
+        device_names)
+    response_data["devices"] = join_json(dict(zip(device_names, payloads)))
+    return send_json(join_json(response_data))
+
+
+def send_snapshot(folder_path, encoding = ENCODING_JSON):
+    """Send the snapshot of a device folder in an encoding, or return None if it has none.
+
+    The file is sent as it is (with sendfile where the server supports it), or its copy compressed
+    with the content coding preferred by the client, and answered with a 304 if the client already
+    has it.
+    """
+    # send_file reads relative paths from the folder of the app, not from the working directory
+    path = os.path.abspath(os.path.join(folder_path, SNAPSHOT_FILE_NAMES[encoding]))
+    coding = next((coding for coding, extension in CODING_EXTENSIONS.items()
+                   if request.accept_encodings.quality(coding) > 0 and os.path.isfile(path + extension)), None)
+    try:
+        response = send_file(path + CODING_EXTENSIONS[coding] if coding else path, mimetype='application/json', conditional=True)
+    except OSError:
+        return None
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def send_json(body):
+    """Send a JSON response built for this request, compressed if the client accepts it and it is large enough."""
+    data = body.encode('utf-8')
+    response = Response(data, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    for coding in CODING_EXTENSIONS:
+        if request.accept_encodings.quality(coding) > 0:
+            compressed = compress(data, coding, fast=True)
+            if compressed is not None:
+                response.set_data(compressed)
+                response.headers['Content-Encoding'] = coding
+                break
+    return response
+
+
+def read_snapshot(folder_path):
+    """The snapshot of a device folder as text, or None if it has none."""
+    try:
+        with open(os.path.join(folder_path, SNAPSHOT_FILE_NAME), 'r', encoding='utf-8') as snapshot_file:
+            return snapshot_file.read()
+    except OSError:
+        return None
+
+
+
+def build_device_payload(device_name, generation_path, since = None, client_generation = None, compact = False,
+                         points = None, method = METHOD_MINMAX):
+    """Serialize the /data response of a device in the given generation."""
+    folder_path = os.path.join(generation_path, device_name)
+    generation = os.path.basename(os.path.normpath(generation_path))
+
+    response_data = {
+        "generation": app.json.dumps(generation),
+        "full": app.json.dumps(since is None)
     }
+    if compact:
+        response_data["encoding"] = app.json.dumps(ENCODING_COMPACT)
+
+    # The client is up to date
+    if since is not None and client_generation == generation:
+        return join_json(response_data)
+
+    response_data.update(get_tables_data(folder_path, device_name, since, compact, points, method))
+    return join_json(response_data)
+
+
+
+def parse_duration(value):
+    """Convert a duration (seconds, or a number followed by one of DURATION_UNITS) to seconds."""
+    text = str(value).strip()
+    number = text.rstrip("abcdefghijklmnopqrstuvwxyz")
+    unit = text[len(number):] or "s"
+    if unit not in DURATION_UNITS:
+        raise ValueError(f"Unknown unit: {unit}")
+    seconds = float(number) * DURATION_UNITS[unit]
+    if not math.isfinite(seconds) or seconds > MAX_DURATION_SECONDS:
+        raise ValueError(f"A duration must be at most {MAX_DURATION_SECONDS} seconds")
+    seconds = int(seconds)
+    if seconds <= 0:
+        raise ValueError("A duration must be positive")
+    return seconds
+
+
+def parse_since(value):
+    """Convert a time to the text of the same time in the tables, to compare it with their time column.
+
+    The time is either text, as the tables write it or in ISO 8601 (with a `T`, and with an offset or
+    `Z` for a time that is not a wall-clock time of TIME_ZONE), or epoch seconds, as a number or as text.
+    Raises ValueError if it is none of these.
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError("A time must be text or a number")
+    import pytz  # Only the requests with since need it
+
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = float(text)
+        except ValueError:
+            value = None
+    try:
+        if value is not None:
+            if not math.isfinite(value):
+                raise ValueError("A time must be finite")
+            time = datetime.fromtimestamp(value, pytz.utc)
+        else:
+            time = datetime.fromisoformat(text[:-1] + "+00:00" if text[-1:] in ("Z", "z") else text)
+    except (OverflowError, OSError) as error:
+        raise ValueError(f"Invalid time: {error}")
+
+    if time.tzinfo is not None:
+        time = time.astimezone(pytz.timezone(TIME_ZONE)).replace(tzinfo=None)
+    # Without the fraction when it is zero, so that it also comes first among the times of the same
+    # second written without a fraction
+    return time.strftime(TIME_FORMAT if time.microsecond else TIME_FORMAT[:-3])
+
+
+def get_series_tables():
+    """The series of SERIES_TABLES, listed on the first range query.
+
+    rollups (and numpy with it) is only imported then, the other requests do not need it.
+    """
+    global SERIES_TABLES
+    if SERIES_TABLES is None:
+        from rollups import TIERS
+        SERIES_TABLES = ((1, DISPLAY_PERIOD_SECONDS, "throughput_per_second_"),) + tuple(
+            (bucket_seconds, retention, f"rollup_{name}_") for name, bucket_seconds, retention in TIERS)
+    return SERIES_TABLES
+
+
+def select_series_table(range_seconds, resolution_seconds):
+    """Pick the series that answers a range query with the fewest rows.
 
-def get_specific_device_data(folder_path, device_name):
-    metrics = load_and_tail(os.path.join(folder_path, f"metrics_per_min_{device_name}.csv"), 120)
-    traffic = load_full_csv(os.path.join(folder_path, f"destination_traffic_{device_name}.csv"))
-    throughput = load_and_tail(os.path.join(folder_path, f"throughput_per_second_{device_name}.csv"), 300)
-    packetsize = load_full_csv(os.path.join(folder_path, f"packet_sizes_count_{device_name}.csv"))
-
-    return {
-        "metrics_per_device": metrics.to_dict(orient='list') if metrics is not None else {},
-        "traffic_per_device": traffic.to_dict(orient='list') if traffic is not None else {},
-        "throughput_per_device": throughput.to_dict(orient='list') if throughput is not None else {},
-        "packet_size_record": packetsize.to_dict(orient='list') if packetsize is not None else {}
+    Among the series that cover the range, it is the coarsest one that is at least as fine as the
+    resolution asked, or the finest one if they are all coarser. If no series covers the range, the
+    longest one is used.
+    """
+    series_tables = get_series_tables()
+    covering = [series for series in series_tables if series[1] >= range_seconds] or [series_tables[-1]]
+    fine_enough = [series for series in covering if series[0] <= resolution_seconds]
+    return fine_enough[-1] if fine_enough else covering[0]
+
+
+def build_series_payload(device_name, generation_path, range_seconds, resolution_seconds, compact = False,
+                         points = None, method = METHOD_MINMAX):
+    """Serialize the traffic series of a device over the last range_seconds."""
+    folder_path = os.path.join(generation_path, device_name)
+    generation = os.path.basename(os.path.normpath(generation_path))
+    series_resolution, series_period, table_prefix = select_series_table(range_seconds, resolution_seconds)
+
+    # The series have a row for each second or bucket, so the range is a number of rows
+    rows = -(-min(range_seconds, series_period) // series_resolution)
+    response_data = {
+        "generation": app.json.dumps(generation),
+        "full": app.json.dumps(True)
     }
+    if compact:
+        response_data["encoding"] = app.json.dumps(ENCODING_COMPACT)
+    response_data["resolution"] = app.json.dumps(series_resolution)
+    response_data["series"] = load_table_json(folder_path, table_prefix + device_name, rows, compact=compact, points=points, method=method)
+    return join_json(response_data)
+
+
+def build_stream_message(device_name, generation):
+    """Format the full data of a device in a generation as one server-sent event."""
+    generation_path = os.path.join(BASE_PATH, generation) if generation else BASE_PATH
+    if not os.path.isdir(os.path.join(generation_path, device_name)):
+        payload = join_json({"generation": app.json.dumps(generation), "full": app.json.dumps(True)})
+    else:
+        payload = read_snapshot(os.path.join(generation_path, device_name)) or build_device_payload(device_name, generation_path)
+    return f"event: update\ndata: {payload}\n\n"
+
+
+broadcaster = UpdateBroadcaster(lambda: get_current_generation(BASE_PATH), build_stream_message)
+
+
+@app.route('/stream', methods=['GET'])
+def stream_device_data():
+    """Server-sent events with the data of a device, pushed each time a new generation is published."""
+    device_name = request.args.get('device_name')
+
+    if not device_name:
+        abort(400, "device_name is required.")
+
+    if not is_device(resolve_generation(BASE_PATH), device_name):
+        abort(400, "Invalid device_name.")
+
+    if broadcaster.subscriber_count() >= MAX_STREAMS:
+        abort(503, "Too many open streams, poll /data instead.")
+
+    subscriber = broadcaster.subscribe(device_name)
+
+    def events():
+        try:
+            while True:
+                try:
+                    yield subscriber.messages.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+
+def get_tables_data(folder_path, device_name, since = None, compact = False, points = None, method = METHOD_MINMAX,
+                    keys = None):
+    """The tables of the /data response of a device, read from its folder and serialized as JSON.
+
+    The time series are their last rows, or the whole series downsampled if points is given. The
+    other tables are sent whole. If keys is given, only the tables with these keys are read.
+    """
+    tables = {}
+    for key, table_name, rows in get_response_tables(device_name):
+        if keys is not None and key not in keys:
+            continue
+        if rows is None:
+            tables[key] = load_table_json(folder_path, table_name, compact=compact)
+        else:
+            tables[key] = load_table_json(folder_path, table_name, rows if points is None else None, since, compact, points, method)
+    return tables
+
+def run_server():
+    """Serve the app with waitress, or with the threaded Flask server if waitress is not installed.
+
+    waitress runs the requests in SERVER_THREADS threads and sends the responses from its I/O thread,
+    so a snapshot file is sent (and read) as the client receives it without holding a request thread.
+    """
+    try:
+        from waitress import serve
+    except ImportError:
+        logging.warning("waitress is not installed, using the Flask server.")
+        app.run(host=HOST, port=PORT, threaded=True)
+        return
+    serve(app, host=HOST, port=PORT, threads=SERVER_THREADS, connection_limit=CONNECTION_LIMIT)
+
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    if "--debug" in sys.argv[1:]:
+        app.run(debug=True)
+    else:
+        run_server()